@@ -6,15 +6,24 @@ Simulates smart meter readings with realistic consumption patterns
 
 import pika
 import json
+import struct
 import time
 import random
 import argparse
 import sys
 import os
+import uuid
 from datetime import datetime
 from pathlib import Path
 
 
+JSON_CONTENT_TYPE = 'application/json'
+BINARY_CONTENT_TYPE = 'application/x-ems-measurement'
+
+# 16-byte device UUID, int64 epoch milliseconds, float32 value (28 bytes)
+MEASUREMENT_STRUCT = struct.Struct('<16sqf')
+
+
 class EnergyPatternGenerator:
     """
     Generates realistic energy consumption patterns based on time of day
@@ -88,6 +97,7 @@ class SimulatorPublisher:
         self.connection = None
         self.channel = None
         self.queue_name = config['queue']
+        self.wire_format = config.get('wire_format', 'json')
     
     def connect(self):
         """Establish connection to RabbitMQ with retry logic"""
@@ -147,20 +157,30 @@ class SimulatorPublisher:
                     return False
             
             # Create message
-            message = {
-                "timestamp": datetime.utcnow().isoformat() + "Z",
-                "device_id": device_id,
-                "measurement_value": measurement_value
-            }
+            if self.wire_format == 'binary':
+                body = MEASUREMENT_STRUCT.pack(
+                    uuid.UUID(device_id).bytes,
+                    int(time.time() * 1000),
+                    measurement_value
+                )
+                content_type = BINARY_CONTENT_TYPE
+            else:
+                message = {
+                    "timestamp": datetime.utcnow().isoformat() + "Z",
+                    "device_id": device_id,
+                    "measurement_value": measurement_value
+                }
+                body = json.dumps(message)
+                content_type = JSON_CONTENT_TYPE
             
             # Publish message
             self.channel.basic_publish(
                 exchange='',
                 routing_key=self.queue_name,
-                body=json.dumps(message),
+                body=body,
                 properties=pika.BasicProperties(
                     delivery_mode=2,  # Make message persistent
-                    content_type='application/json'
+                    content_type=content_type
                 )
             )
             
@@ -202,6 +222,8 @@ class DeviceSimulator:
             self.config['interval_seconds'] = overrides['interval']
         if overrides.get('base_load'):
             self.config['base_load_kwh'] = overrides['base_load']
+        if overrides.get('wire_format'):
+            self.config['rabbitmq']['wire_format'] = overrides['wire_format']
         if overrides.get('duration'):
             self.config['duration_seconds'] = overrides['duration']
         else:
@@ -275,6 +297,7 @@ class DeviceSimulator:
             print(f"  Duration:         {duration} seconds ({sim_duration} minutes simulated)")
         print(f"  RabbitMQ Host:    {self.config['rabbitmq']['host']}:{self.config['rabbitmq']['port']}")
         print(f"  Queue:            {self.config['rabbitmq']['queue']}")
+        print(f"  Wire Format:      {self.config['rabbitmq'].get('wire_format', 'json')}")
         print("\nConsumption Patterns:")
         for pattern_name, pattern_data in self.config['patterns'].items():
             hours_str = f"{pattern_data['hours'][0]}-{pattern_data['hours'][-1]}"
@@ -379,6 +402,9 @@ Examples:
   
   # Use custom config file
   python simulator.py --config my_config.json
+  
+  # Send compact binary messages instead of JSON
+  python simulator.py --wire-format binary
         """
     )
     
@@ -406,6 +432,11 @@ Examples:
         type=int,
         help='Duration to run simulation in seconds (default: run indefinitely)'
     )
+    parser.add_argument(
+        '--wire-format',
+        choices=['json', 'binary'],
+        help='Message encoding: json or compact 28-byte binary (default: json)'
+    )
     parser.add_argument(
         '--time-acceleration',
         type=int,
@@ -422,6 +453,7 @@ Examples:
         interval=args.interval,
         base_load=args.base_load,
         duration=args.duration,
+        wire_format=args.wire_format,
         time_acceleration=args.time_acceleration
     )
     
@@ -11,6 +11,11 @@ export interface HourlyData {
   hour: number;
   total_consumption: number;
   measurement_count: number;
+  min_value?: number | null;
+  max_value?: number | null;
+  avg_value?: number | null;
+  last_value?: number | null;
+  last_timestamp?: string | null;
 }
 
 export interface DailyConsumptionResponse {
@@ -18,6 +23,7 @@ export interface DailyConsumptionResponse {
   date: string;
   hourly_data: HourlyData[];
   total_daily_consumption: number;
+  peak_value?: number | null;
 }
 
 export interface DateRangeConsumptionResponse {
@@ -31,10 +37,25 @@ export interface DateRangeConsumptionResponse {
     hour: number;
     total_consumption: number;
     measurement_count: number;
+    min_value: number | null;
+    max_value: number | null;
+    avg_value: number | null;
+    last_value: number | null;
+    last_timestamp: string | null;
   }>;
   total_consumption: number;
 }
 
+export interface LiveMeasurementEvent {
+  device_id: string;
+  timestamp: string;
+  measurement_value: number;
+  date: string;
+  hour: number;
+  hour_total_consumption: number;
+  hour_measurement_count: number;
+}
+
 export interface Device {
   id: string;
   name: string;
@@ -84,6 +105,56 @@ export const getDateRangeConsumption = async (
   return response.data;
 };
 
+/**
+ * Subscribe to live readings (Server-Sent Events) instead of polling.
+ * Uses fetch so the Authorization header can be sent; returns an unsubscribe function.
+ * onDropped is called when the server-side buffer overflowed and data should be refetched.
+ */
+export const subscribeLiveMeasurements = (
+  deviceIds: string[],
+  token: string,
+  onMeasurement: (event: LiveMeasurementEvent) => void,
+  onDropped?: (count: number) => void
+): (() => void) => {
+  const controller = new AbortController();
+  const params = deviceIds.length ? `?device_ids=${deviceIds.join(',')}` : '';
+
+  const run = async () => {
+    const response = await fetch(`${API_BASE_URL}/live/${params}`, {
+      headers: { Authorization: `Bearer ${token}`, Accept: 'text/event-stream' },
+      signal: controller.signal
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Live stream failed with status ${response.status}`);
+    }
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += value;
+      const messages = buffer.split('\n\n');
+      buffer = messages.pop() ?? '';
+      for (const message of messages) {
+        let eventType = 'message';
+        let data = '';
+        for (const line of message.split('\n')) {
+          if (line.startsWith('event: ')) eventType = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        }
+        if (eventType === 'measurement') onMeasurement(JSON.parse(data));
+        else if (eventType === 'dropped') onDropped?.(JSON.parse(data).count);
+      }
+    }
+  };
+
+  run().catch((error) => {
+    if (!controller.signal.aborted) console.error('Live measurement stream closed:', error);
+  });
+  return () => controller.abort();
+};
+
 /**
  * Get list of synchronized devices
  */
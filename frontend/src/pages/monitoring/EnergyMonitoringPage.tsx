@@ -6,10 +6,46 @@ import { getAccessToken } from '../../utils/auth';
 import {
   getDailyConsumption,
   getMonitoringDevices,
+  subscribeLiveMeasurements,
   type Device,
   type DailyConsumptionResponse,
+  type LiveMeasurementEvent,
 } from '../../api/monitoringApi';
 
+/**
+ * Fold one live reading into the day's hourly data. The event carries the hour's
+ * new total and count, so only min/max/last need to be folded in here.
+ */
+const applyLiveMeasurement = (
+  data: DailyConsumptionResponse,
+  event: LiveMeasurementEvent
+): DailyConsumptionResponse => {
+  const value = event.measurement_value;
+  const hourlyData = data.hourly_data.map((h) =>
+    h.hour === event.hour
+      ? {
+          ...h,
+          total_consumption: event.hour_total_consumption,
+          measurement_count: event.hour_measurement_count,
+          avg_value: event.hour_total_consumption / event.hour_measurement_count,
+          min_value: h.min_value == null ? value : Math.min(h.min_value, value),
+          max_value: h.max_value == null ? value : Math.max(h.max_value, value),
+          last_value: value,
+          last_timestamp: event.timestamp,
+        }
+      : h
+  );
+  const peaks = hourlyData
+    .map((h) => h.max_value)
+    .filter((v): v is number => v != null);
+  return {
+    ...data,
+    hourly_data: hourlyData,
+    total_daily_consumption: hourlyData.reduce((sum, h) => sum + h.total_consumption, 0),
+    peak_value: peaks.length ? Math.max(...peaks) : null,
+  };
+};
+
 const EnergyMonitoringPage: React.FC = () => {
   const token = getAccessToken();
   const [devices, setDevices] = useState<Device[]>([]);
@@ -21,6 +57,8 @@ const EnergyMonitoringPage: React.FC = () => {
   const [consumptionData, setConsumptionData] = useState<DailyConsumptionResponse | null>(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
+  // Bumped to refetch the day after the live stream reports dropped events
+  const [refreshKey, setRefreshKey] = useState(0);
 
   // Fetch devices on mount
   useEffect(() => {
@@ -60,6 +98,21 @@ const EnergyMonitoringPage: React.FC = () => {
     };
 
     fetchConsumption();
+  }, [token, selectedDevice, selectedDate, refreshKey]);
+
+  // Push new readings for today instead of polling
+  useEffect(() => {
+    if (!token || !selectedDevice || selectedDate !== format(new Date(), 'yyyy-MM-dd')) return;
+
+    return subscribeLiveMeasurements(
+      [selectedDevice],
+      token,
+      (event) => {
+        if (event.device_id !== selectedDevice || event.date !== selectedDate) return;
+        setConsumptionData((current) => (current ? applyLiveMeasurement(current, event) : current));
+      },
+      () => setRefreshKey((key) => key + 1)
+    );
   }, [token, selectedDevice, selectedDate]);
 
   const handleDeviceChange = (e: React.ChangeEvent<HTMLSelectElement>) => {
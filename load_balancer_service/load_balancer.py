@@ -8,11 +8,14 @@ import json
 import time
 import os
 import sys
+import uuid
 from dotenv import load_dotenv
 from consistent_hash import ConsistentHash
 
 load_dotenv()
 
+BINARY_CONTENT_TYPE = 'application/x-ems-measurement'
+
 
 class LoadBalancer:
     """Load balancer for distributing device measurements"""
@@ -78,8 +81,12 @@ class LoadBalancer:
     def callback(self, ch, method, properties, body):
         """Process incoming device measurement"""
         try:
-            data = json.loads(body)
-            device_id = data.get('device_id')
+            content_type = properties.content_type or 'application/json'
+            if content_type == BINARY_CONTENT_TYPE:
+                # Device UUID is the first 16 bytes - no need to decode the rest
+                device_id = str(uuid.UUID(bytes=body[:16]))
+            else:
+                device_id = json.loads(body).get('device_id')
             
             if not device_id:
                 print("⚠️  Message missing device_id, skipping")
@@ -97,7 +104,7 @@ class LoadBalancer:
                 body=body,
                 properties=pika.BasicProperties(
                     delivery_mode=2,  # Persistent
-                    content_type='application/json'
+                    content_type=content_type
                 )
             )
             
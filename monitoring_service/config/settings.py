@@ -81,6 +81,15 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Serving mode (see entrypoint.sh): 'dev' runs runserver, 'wsgi' gunicorn thread
+# workers, 'asgi' gunicorn + uvicorn workers with async read views
+SERVER_MODE = os.environ.get('SERVER_MODE', 'dev')
+
+# Persistent connections live per thread. runserver and ASGI start a new thread
+# per request, so they close connections after each request (ASGI reuses server
+# connections through PgBouncer instead); gthread workers keep theirs open.
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60)) if SERVER_MODE == 'wsgi' else 0
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -89,10 +98,38 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD', 'postgres'),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_MAX_AGE > 0,
     }
 }
 
 
+# Cache
+# Consumers run in separate processes from the web server, so cache invalidation
+# from the ingest/sync path only reaches the API when a shared cache is configured.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Per-user device access sets are cached this long (seconds)
+ACCESS_CACHE_TTL = int(os.environ.get('ACCESS_CACHE_TTL', 60))
+
+# Daily consumption and heatmap responses for the current day / year are cached
+# this long (seconds); closed periods are cached until aggregation invalidates them
+DAILY_CACHE_TODAY_TTL = int(os.environ.get('DAILY_CACHE_TODAY_TTL', 15))
+HEATMAP_CACHE_CURRENT_TTL = int(os.environ.get('HEATMAP_CACHE_CURRENT_TTL', 60))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -142,6 +179,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'monitoring.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
@@ -158,6 +199,43 @@ SIMPLE_JWT = {
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 
+# Measurements API: keyset page sizes and streaming export chunk size
+MEASUREMENTS_PAGE_SIZE = int(os.environ.get('MEASUREMENTS_PAGE_SIZE', 500))
+MEASUREMENTS_MAX_PAGE_SIZE = int(os.environ.get('MEASUREMENTS_MAX_PAGE_SIZE', 5000))
+MEASUREMENTS_STREAM_CHUNK_SIZE = int(os.environ.get('MEASUREMENTS_STREAM_CHUNK_SIZE', 2000))
+MEASUREMENTS_MAX_POINTS = int(os.environ.get('MEASUREMENTS_MAX_POINTS', 5000))
+
+# Per-device analytics (hour-of-week baseline and anomaly z-scores)
+BASELINE_DEFAULT_DAYS = int(os.environ.get('BASELINE_DEFAULT_DAYS', 28))
+BASELINE_MAX_DAYS = int(os.environ.get('BASELINE_MAX_DAYS', 365))
+BASELINE_RECENT_HOURS = int(os.environ.get('BASELINE_RECENT_HOURS', 24))
+BASELINE_Z_THRESHOLD = float(os.environ.get('BASELINE_Z_THRESHOLD', 3.0))
+# Upper bound only - entries are retired as soon as the device gets new hourly data
+ANALYTICS_CACHE_TTL = int(os.environ.get('ANALYTICS_CACHE_TTL', 3600))
+
+# Per-day DDSketch of measurement values: relative quantile error, bucket cap
+# per sketch, and the longest range the percentiles endpoint merges
+SKETCH_RELATIVE_ACCURACY = float(os.environ.get('SKETCH_RELATIVE_ACCURACY', 0.01))
+SKETCH_MAX_BUCKETS = int(os.environ.get('SKETCH_MAX_BUCKETS', 2048))
+PERCENTILES_MAX_DAYS = int(os.environ.get('PERCENTILES_MAX_DAYS', 366))
+# The threaded consumer buffers readings and merges them into the daily sketches
+# in one write per (device, day) after this many readings or seconds. Cached daily
+# responses are invalidated on the same flush, so keep the interval near DAILY_CACHE_TODAY_TTL
+SKETCH_FLUSH_READINGS = int(os.environ.get('SKETCH_FLUSH_READINGS', 5000))
+SKETCH_FLUSH_SECONDS = int(os.environ.get('SKETCH_FLUSH_SECONDS', 10))
+
+# Rolling hourly window endpoint (last N hours ending at the current hour)
+HOURLY_WINDOW_DEFAULT_HOURS = int(os.environ.get('HOURLY_WINDOW_DEFAULT_HOURS', 24))
+HOURLY_WINDOW_MAX_HOURS = int(os.environ.get('HOURLY_WINDOW_MAX_HOURS', 24 * 31))
+
+# CSV / Parquet export: rows fetched from the server-side cursor and encoded per chunk
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 10000))
+
+# Multi-device batch consumption and cost endpoint limits
+BATCH_MAX_DEVICES = int(os.environ.get('BATCH_MAX_DEVICES', 200))
+BATCH_MAX_DAYS = int(os.environ.get('BATCH_MAX_DAYS', 31))
+COST_MAX_DAYS = int(os.environ.get('COST_MAX_DAYS', 732))
+
 # Spectacular Settings
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Monitoring Service API',
@@ -176,6 +254,67 @@ RABBITMQ_PASS = os.environ.get('RABBITMQ_PASS', 'admin123')
 DEVICE_DATA_QUEUE = 'device_data_queue'
 SYNC_QUEUE = 'sync_queue'
 
+# Queues consumed by DeviceDataConsumer, partitioned across `consume_messages --workers N`
+# processes. Defaults to the load balancer's ingest_queue_1..NUM_REPLICAS when NUM_REPLICAS
+# is set (same variable as load_balancer_service), otherwise to DEVICE_DATA_QUEUE
+INGEST_REPLICAS = int(os.environ.get('NUM_REPLICAS', 0))
+INGEST_QUEUES = [
+    name.strip()
+    for name in os.environ.get(
+        'INGEST_QUEUES',
+        ','.join(f'ingest_queue_{replica}' for replica in range(1, INGEST_REPLICAS + 1)) or DEVICE_DATA_QUEUE
+    ).split(',')
+    if name.strip()
+]
+
+# Retry Topology: failed messages wait in TTL delay queues (base * 2^attempt)
+# and are parked in <queue>.parked after MAX_RETRIES
+MAX_RETRIES = int(os.environ.get('MAX_RETRIES', 5))
+RETRY_BASE_DELAY_MS = int(os.environ.get('RETRY_BASE_DELAY_MS', 1000))
+
+# Raw Data Retention
+RAW_RETENTION_DAYS = int(os.environ.get('RAW_RETENTION_DAYS', 30))
+RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', 5000))
+RETENTION_BATCH_SLEEP = float(os.environ.get('RETENTION_BATCH_SLEEP', 0.05))
+
+# Hourly Aggregate Reconciliation (reconcile_hourly): devices per chunk, worker
+# processes, minutes an hour must have been closed before it is compared, and
+# relative tolerance for float sum differences
+RECONCILE_CHUNK_DEVICES = int(os.environ.get('RECONCILE_CHUNK_DEVICES', 50))
+RECONCILE_WORKERS = int(os.environ.get('RECONCILE_WORKERS', 4))
+RECONCILE_SETTLE_MINUTES = int(os.environ.get('RECONCILE_SETTLE_MINUTES', 15))
+RECONCILE_TOLERANCE = float(os.environ.get('RECONCILE_TOLERANCE', 1e-6))
+
+# Measurement Deduplication (Bloom filter in front of the unique constraint)
+DEDUP_FILTER_CAPACITY = int(os.environ.get('DEDUP_FILTER_CAPACITY', 1_000_000))
+DEDUP_FILTER_ERROR_RATE = float(os.environ.get('DEDUP_FILTER_ERROR_RATE', 0.001))
+DEDUP_WINDOW_SECONDS = int(os.environ.get('DEDUP_WINDOW_SECONDS', 3600))
+
+# Ingest Instrumentation: per-stage timing summary interval and sampled per-message logs
+INGEST_METRICS_INTERVAL = int(os.environ.get('INGEST_METRICS_INTERVAL', 60))
+INGEST_LOG_SAMPLES_PER_SECOND = float(os.environ.get('INGEST_LOG_SAMPLES_PER_SECOND', 1))
+
+# Fleet hourly rollup rows per hour; spreads ingest writes across rows
+FLEET_SHARDS = int(os.environ.get('FLEET_SHARDS', 16))
+FLEET_MAX_WINDOW_DAYS = int(os.environ.get('FLEET_MAX_WINDOW_DAYS', 31))
+FLEET_MAX_TOP = int(os.environ.get('FLEET_MAX_TOP', 100))
+
+# Live stream (Server-Sent Events fed by Postgres LISTEN/NOTIFY). Served in the asgi and
+# dev modes only: a wsgi gthread worker would give up a thread per open stream
+# Off by default: Postgres serializes commits of transactions that send a NOTIFY,
+# which caps ingest throughput even when nobody is listening
+LIVE_EVENTS_ENABLED = os.environ.get('LIVE_EVENTS_ENABLED', 'False') == 'True'
+LIVE_SUBSCRIBER_BUFFER = int(os.environ.get('LIVE_SUBSCRIBER_BUFFER', 256))
+LIVE_MAX_SUBSCRIBERS = int(os.environ.get('LIVE_MAX_SUBSCRIBERS', 500))
+LIVE_HEARTBEAT_SECONDS = float(os.environ.get('LIVE_HEARTBEAT_SECONDS', 15))
+LIVE_RECONNECT_DELAY = float(os.environ.get('LIVE_RECONNECT_DELAY', 2))
+
+# Async Ingest (manage.py consume_messages_async)
+ASYNC_INGEST_MAX_IN_FLIGHT = int(os.environ.get('ASYNC_INGEST_MAX_IN_FLIGHT', 1000))
+ASYNC_INGEST_BATCH_SIZE = int(os.environ.get('ASYNC_INGEST_BATCH_SIZE', 200))
+ASYNC_INGEST_FLUSH_INTERVAL = float(os.environ.get('ASYNC_INGEST_FLUSH_INTERVAL', 0.05))
+ASYNC_INGEST_POOL_SIZE = int(os.environ.get('ASYNC_INGEST_POOL_SIZE', 10))
+
 # Logging Configuration
 LOGGING = {
     'version': 1,
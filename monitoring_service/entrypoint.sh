@@ -21,5 +21,30 @@ echo "Starting RabbitMQ consumers in background..."
 python manage.py consume_messages &
 python manage.py consume_sync &
 
-echo "Starting Django server..."
-python manage.py runserver 0.0.0.0:8003
+# SERVER_MODE: dev (runserver), wsgi (gunicorn threads) or asgi (gunicorn + uvicorn, async read views).
+# The /live/ SSE stream needs asgi: in wsgi mode every open stream would hold one of the
+# worker's WEB_THREADS indefinitely, so the endpoint answers 503 there.
+WEB_WORKERS=${WEB_WORKERS:-$(( $(nproc) * 2 + 1 ))}
+WEB_THREADS=${WEB_THREADS:-8}
+
+case "${SERVER_MODE:-dev}" in
+  asgi)
+    echo "Starting ASGI server with $WEB_WORKERS uvicorn workers..."
+    exec gunicorn config.asgi:application \
+      --worker-class uvicorn.workers.UvicornWorker \
+      --workers "$WEB_WORKERS" \
+      --bind 0.0.0.0:8003
+    ;;
+  wsgi)
+    echo "Starting WSGI server with $WEB_WORKERS workers x $WEB_THREADS threads..."
+    exec gunicorn config.wsgi:application \
+      --worker-class gthread \
+      --workers "$WEB_WORKERS" \
+      --threads "$WEB_THREADS" \
+      --bind 0.0.0.0:8003
+    ;;
+  *)
+    echo "Starting Django server..."
+    python manage.py runserver 0.0.0.0:8003
+    ;;
+esac
@@ -0,0 +1,84 @@
+"""
+Device access control for monitoring endpoints.
+
+Admins can see every device and are answered without touching the database.
+For clients the set of assigned device ids is loaded once and cached for
+ACCESS_CACHE_TTL seconds, so each check is an O(1) set lookup. The sync
+consumer invalidates entries when assignments change.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from .models import UserDeviceMapping
+
+
+def _cache_key(user_id):
+    return f"device_access:{user_id}"
+
+
+def is_admin(user):
+    return user.role == 'admin'
+
+
+def get_accessible_device_ids(user):
+    """Return the frozenset of device id strings a client can access"""
+    key = _cache_key(user.id)
+    device_ids = cache.get(key)
+    if device_ids is None:
+        device_ids = frozenset(
+            str(device_id)
+            for device_id in UserDeviceMapping.objects.filter(user_id=user.id).values_list('device_id', flat=True)
+        )
+        cache.set(key, device_ids, settings.ACCESS_CACHE_TTL)
+    return device_ids
+
+
+def can_access(user, device_id):
+    """Whether the user may read data for device_id"""
+    if is_admin(user):
+        return True
+    return str(device_id) in get_accessible_device_ids(user)
+
+
+def inaccessible_devices(user, device_ids):
+    """Return the subset of device_ids the user may not read (empty for admins)"""
+    if is_admin(user):
+        return []
+    allowed = get_accessible_device_ids(user)
+    return [device_id for device_id in device_ids if str(device_id) not in allowed]
+
+
+def filter_accessible(queryset, user, field='device_id'):
+    """Restrict a queryset to the user's devices (no-op for admins)"""
+    if is_admin(user):
+        return queryset
+    return queryset.filter(**{f'{field}__in': get_accessible_device_ids(user)})
+
+
+async def aget_accessible_device_ids(user):
+    """Async variant of get_accessible_device_ids for the ASGI read views"""
+    key = _cache_key(user.id)
+    device_ids = await cache.aget(key)
+    if device_ids is None:
+        device_ids = frozenset([
+            str(device_id)
+            async for device_id in UserDeviceMapping.objects.filter(user_id=user.id).values_list('device_id', flat=True)
+        ])
+        await cache.aset(key, device_ids, settings.ACCESS_CACHE_TTL)
+    return device_ids
+
+
+async def acan_access(user, device_id):
+    if is_admin(user):
+        return True
+    return str(device_id) in await aget_accessible_device_ids(user)
+
+
+async def afilter_accessible(queryset, user, field='device_id'):
+    if is_admin(user):
+        return queryset
+    return queryset.filter(**{f'{field}__in': await aget_accessible_device_ids(user)})
+
+
+def invalidate_user_access(user_id):
+    """Drop the cached device set for a user after their assignments change"""
+    cache.delete(_cache_key(user_id))
@@ -1,3 +1,20 @@
 from django.contrib import admin
+from .models import RetentionPolicy, Tariff, TariffRate
 
-# Register your models here.
+
+@admin.register(RetentionPolicy)
+class RetentionPolicyAdmin(admin.ModelAdmin):
+    list_display = ['device_id', 'raw_retention_days', 'updated_at']
+    search_fields = ['device_id']
+
+
+class TariffRateInline(admin.TabularInline):
+    model = TariffRate
+    extra = 1
+
+
+@admin.register(Tariff)
+class TariffAdmin(admin.ModelAdmin):
+    list_display = ['name', 'currency', 'base_rate', 'is_default', 'updated_at']
+    search_fields = ['name']
+    inlines = [TariffRateInline]
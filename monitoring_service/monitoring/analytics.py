@@ -0,0 +1,160 @@
+"""
+Vectorized per-device consumption statistics.
+
+A device's trailing window of hourly totals is fetched with one values_list
+query into a dense NumPy array (NaN where the device reported nothing), and the
+hour-of-week baseline, percentiles and z-scores are computed with array
+operations - no per-row Python work beyond the fetch itself. Percentiles over
+arbitrary ranges come from merging the per-day value sketches instead.
+"""
+from datetime import date, timedelta
+import numpy as np
+from django.utils import timezone
+from .models import DeviceDailyConsumption, HourlyEnergyConsumption
+from .rollups import load_sketch
+
+HOURS_PER_WEEK = 168
+PERCENTILES = (5, 25, 50, 75, 95, 99)
+
+
+def nullable(values):
+    """NumPy floats -> JSON-ready list with NaN as None"""
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def load_hourly_series(device_id, start_date, end_date):
+    """Dense series of hourly totals from start_date 00:00 to end_date 23:00, NaN for missing hours"""
+    num_days = (end_date - start_date).days + 1
+    series = np.full(num_days * 24, np.nan)
+    rows = list(
+        HourlyEnergyConsumption.objects.filter(
+            device_id=device_id
+        ).between_days(start_date, end_date).values_list('date', 'hour', 'total_consumption')
+    )
+    if rows:
+        dates, hours, totals = zip(*rows)
+        day_offsets = (np.array(dates, dtype='datetime64[D]') - np.datetime64(start_date, 'D')).astype(np.int64)
+        series[day_offsets * 24 + np.array(hours, dtype=np.int64)] = np.array(totals, dtype=np.float64)
+    return series
+
+
+def device_baseline(device_id, days, recent_hours, z_threshold, now=None):
+    """
+    Compare the last `recent_hours` complete hours against an hour-of-week
+    baseline built from the `days` days before them.
+    """
+    now = now or timezone.now()
+    # Only complete hours are compared; the baseline ends where the recent window starts
+    recent_end = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
+    recent_start = recent_end - timedelta(hours=recent_hours - 1)
+    history_start = recent_start - timedelta(days=days)
+
+    start_date = history_start.date()
+    series = load_hourly_series(device_id, start_date, recent_end.date())
+
+    history_from = history_start.hour
+    recent_from = history_from + days * 24
+    recent_to = recent_from + recent_hours
+
+    # Monday 00:00 is hour-of-week 0
+    hour_of_week = (start_date.weekday() * 24 + np.arange(series.size)) % HOURS_PER_WEEK
+
+    history = series[history_from:recent_from]
+    history_how = hour_of_week[history_from:recent_from]
+    valid = ~np.isnan(history)
+    history, history_how = history[valid], history_how[valid]
+
+    samples = np.bincount(history_how, minlength=HOURS_PER_WEEK)
+    sums = np.bincount(history_how, weights=history, minlength=HOURS_PER_WEEK)
+    squares = np.bincount(history_how, weights=history * history, minlength=HOURS_PER_WEEK)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sums / samples
+        std = np.sqrt(np.clip(squares / samples - mean * mean, 0.0, None))
+
+    recent = series[recent_from:recent_to]
+    recent_how = hour_of_week[recent_from:recent_to]
+    expected = mean[recent_how]
+    spread = std[recent_how]
+    # A z-score needs at least two samples and some spread to mean anything
+    usable = (samples[recent_how] >= 2) & (spread > 1e-9) & ~np.isnan(recent)
+    z_scores = np.full(recent.size, np.nan)
+    z_scores[usable] = (recent[usable] - expected[usable]) / spread[usable]
+    anomalies = np.abs(np.nan_to_num(z_scores)) >= z_threshold
+
+    percentiles = np.percentile(history, PERCENTILES) if history.size else np.full(len(PERCENTILES), np.nan)
+
+    return {
+        'device_id': str(device_id),
+        'baseline_start': history_start.isoformat(),
+        'recent_start': recent_start.isoformat(),
+        'recent_end': recent_end.isoformat(),
+        'days': days,
+        'z_threshold': z_threshold,
+        'baseline': {
+            'mean': nullable(mean),
+            'std': nullable(std),
+            'samples': samples.tolist(),
+        },
+        'percentiles': dict(zip((f'p{p}' for p in PERCENTILES), nullable(percentiles))),
+        'recent': [
+            {
+                'timestamp': (recent_start + timedelta(hours=offset)).isoformat(),
+                'hour_of_week': how,
+                'total_consumption': value,
+                'expected': mean_value,
+                'z_score': z_score,
+                'anomaly': anomaly,
+            }
+            for offset, (how, value, mean_value, z_score, anomaly) in enumerate(zip(
+                recent_how.tolist(), nullable(recent), nullable(expected), nullable(z_scores), anomalies.tolist()
+            ))
+        ],
+        'anomaly_count': int(anomalies.sum()),
+    }
+
+
+def year_heatmap(device_id, year):
+    """Days x 24 float32 matrix of hourly totals for a calendar year, NaN where nothing was reported"""
+    start_date = date(year, 1, 1)
+    end_date = date(year, 12, 31)
+    return load_hourly_series(device_id, start_date, end_date).reshape(-1, 24).astype(np.float32)
+
+
+def range_percentiles(device_id, start_date, end_date, percentiles, per_day=False):
+    """
+    Percentiles of individual readings between two dates (inclusive), merged
+    from the daily sketches - raw measurements are never read.
+    """
+    merged = load_sketch(None)
+    days = []
+    measurement_count = 0
+    for day, count, data in DeviceDailyConsumption.objects.filter(
+        device_id=device_id, date__gte=start_date, date__lte=end_date
+    ).order_by('date').values_list('date', 'measurement_count', 'value_sketch'):
+        measurement_count += count
+        if data is None:
+            continue
+        sketch = load_sketch(data)
+        merged.merge(sketch)
+        if per_day:
+            days.append({
+                'date': day.isoformat(),
+                'count': sketch.count,
+                'percentiles': {f'p{p:g}': sketch.quantile(p / 100) for p in percentiles},
+            })
+
+    result = {
+        'device_id': str(device_id),
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'relative_accuracy': merged.relative_accuracy,
+        'count': merged.count,
+        # Readings ingested before sketches existed are counted but not in any sketch
+        'measurement_count': measurement_count,
+        'min': merged.min if merged.count else None,
+        'max': merged.max if merged.count else None,
+        'percentiles': {f'p{p:g}': merged.quantile(p / 100) for p in percentiles},
+    }
+    if per_day:
+        result['days'] = days
+    return result
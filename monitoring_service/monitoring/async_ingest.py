@@ -0,0 +1,382 @@
+"""
+Asyncio ingest engine for device measurements.
+
+Alternative to DeviceDataConsumer: consumes with aio-pika and writes batches
+through an asyncpg pool, so many DB writes are in flight at once instead of one
+blocking ORM round trip per message.
+"""
+import asyncio
+import logging
+import signal
+from collections import defaultdict
+import aio_pika
+import asyncpg
+from django.conf import settings
+from .codec import decode_measurement
+from .models import (
+    Device,
+    DeviceMeasurement,
+    HourlyEnergyConsumption,
+    DeviceDailyConsumption,
+    FleetHourlyConsumption,
+)
+from .rollups import HOURLY_UPSERT_CONFLICT_SQL, add_to_sketch, crossed_limit, fleet_shard
+from .caching import ainvalidate_daily_many, ainvalidate_analytics
+from .live import apublish_many, measurement_event
+from .rabbitmq import retry_target, retry_topology
+
+logger = logging.getLogger(__name__)
+
+# Duplicates are dropped by the unique (device_id, timestamp) constraint and
+# only rows actually inserted are returned, so the hourly upsert never double counts
+INSERT_MEASUREMENTS_SQL = f"""
+    INSERT INTO {DeviceMeasurement._meta.db_table}
+        (id, device_id, timestamp, measurement_value, created_at)
+    SELECT gen_random_uuid(), m.device_id, m.timestamp, m.measurement_value, now()
+    FROM unnest($1::uuid[], $2::timestamptz[], $3::float8[])
+        AS m(device_id, timestamp, measurement_value)
+    ON CONFLICT (device_id, timestamp) DO NOTHING
+    RETURNING device_id, timestamp, measurement_value
+"""
+
+UPSERT_HOURLY_SQL = f"""
+    INSERT INTO {HourlyEnergyConsumption._meta.db_table}
+        (id, device_id, date, hour, bucket_start, total_consumption, measurement_count,
+         min_value, max_value, last_value, last_timestamp, created_at, updated_at)
+    SELECT gen_random_uuid(), h.device_id, h.date, h.hour,
+        (h.date + make_interval(hours => h.hour)) AT TIME ZONE 'UTC', h.total, h.count,
+        h.min_value, h.max_value, h.last_value, h.last_timestamp, now(), now()
+    FROM unnest(
+        $1::uuid[], $2::date[], $3::int[], $4::float8[], $5::int[],
+        $6::float8[], $7::float8[], $8::float8[], $9::timestamptz[]
+    ) AS h(device_id, date, hour, total, count, min_value, max_value, last_value, last_timestamp)
+    {HOURLY_UPSERT_CONFLICT_SQL}
+    RETURNING device_id, date, hour, total_consumption, measurement_count
+"""
+
+DEVICE_LIMITS_SQL = f"""
+    SELECT id, max_consumption FROM {Device._meta.db_table} WHERE id = ANY($1::uuid[])
+"""
+
+UPSERT_DAILY_SQL = f"""
+    INSERT INTO {DeviceDailyConsumption._meta.db_table}
+        (id, device_id, date, total_consumption, measurement_count, updated_at)
+    SELECT gen_random_uuid(), d.device_id, d.date, d.total, d.count, now()
+    FROM unnest($1::uuid[], $2::date[], $3::float8[], $4::int[])
+        AS d(device_id, date, total, count)
+    ON CONFLICT (device_id, date) DO UPDATE SET
+        total_consumption = {DeviceDailyConsumption._meta.db_table}.total_consumption + EXCLUDED.total_consumption,
+        measurement_count = {DeviceDailyConsumption._meta.db_table}.measurement_count + EXCLUDED.measurement_count,
+        updated_at = now()
+"""
+
+# Daily rows are locked by UPSERT_DAILY_SQL earlier in the same transaction,
+# so the sketch read-merge-write below cannot interleave with another batch
+SELECT_DAILY_SKETCHES_SQL = f"""
+    SELECT d.device_id, d.date, d.value_sketch
+    FROM {DeviceDailyConsumption._meta.db_table} d
+    JOIN unnest($1::uuid[], $2::date[]) AS k(device_id, date) ON d.device_id = k.device_id AND d.date = k.date
+"""
+
+UPDATE_DAILY_SKETCHES_SQL = f"""
+    UPDATE {DeviceDailyConsumption._meta.db_table} AS d
+    SET value_sketch = v.sketch
+    FROM unnest($1::uuid[], $2::date[], $3::bytea[]) AS v(device_id, date, sketch)
+    WHERE d.device_id = v.device_id AND d.date = v.date
+"""
+
+UPSERT_FLEET_SQL = f"""
+    INSERT INTO {FleetHourlyConsumption._meta.db_table}
+        (id, date, hour, shard, total_consumption, measurement_count, devices_over_limit, updated_at)
+    SELECT gen_random_uuid(), f.date, f.hour, f.shard, f.total, f.count, f.over, now()
+    FROM unnest($1::date[], $2::int[], $3::int[], $4::float8[], $5::int[], $6::int[])
+        AS f(date, hour, shard, total, count, over)
+    ON CONFLICT (date, hour, shard) DO UPDATE SET
+        total_consumption = {FleetHourlyConsumption._meta.db_table}.total_consumption + EXCLUDED.total_consumption,
+        measurement_count = {FleetHourlyConsumption._meta.db_table}.measurement_count + EXCLUDED.measurement_count,
+        devices_over_limit = {FleetHourlyConsumption._meta.db_table}.devices_over_limit + EXCLUDED.devices_over_limit,
+        updated_at = now()
+"""
+
+
+class AsyncIngestEngine:
+    """Consumes device measurements and writes them in batches with asyncio"""
+
+    def __init__(self, max_in_flight=None, batch_size=None, flush_interval=None, pool_size=None):
+        self.max_in_flight = max_in_flight or settings.ASYNC_INGEST_MAX_IN_FLIGHT
+        self.batch_size = batch_size or settings.ASYNC_INGEST_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.ASYNC_INGEST_FLUSH_INTERVAL
+        self.pool_size = pool_size or settings.ASYNC_INGEST_POOL_SIZE
+
+        self.pool = None
+        self.connection = None
+        self.channel = None
+        self.buffer = []
+        self.write_slots = None
+        self.pending_writes = set()
+        self.stopping = None
+
+    async def connect(self):
+        """Open the AMQP connection and the PostgreSQL pool"""
+        db = settings.DATABASES['default']
+        self.pool = await asyncpg.create_pool(
+            host=db['HOST'],
+            port=int(db['PORT']),
+            user=db['USER'],
+            password=db['PASSWORD'],
+            database=db['NAME'],
+            min_size=1,
+            max_size=self.pool_size
+        )
+        self.connection = await aio_pika.connect_robust(
+            host=settings.RABBITMQ_HOST,
+            port=settings.RABBITMQ_PORT,
+            login=settings.RABBITMQ_USER,
+            password=settings.RABBITMQ_PASS,
+            heartbeat=600
+        )
+        logger.info("Async ingest connected to RabbitMQ and PostgreSQL")
+
+    async def on_message(self, message):
+        """Decode a delivery and queue it for the next batch"""
+        try:
+            device_id, timestamp, measurement_value = decode_measurement(message.body, message.content_type)
+        except Exception as e:
+            logger.error(f"Malformed device data: {e}")
+            await self.retry_or_park(message, e, permanent=True)
+            return
+
+        self.buffer.append((message, device_id, timestamp, measurement_value))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    async def retry_or_park(self, message, error, permanent=False):
+        """
+        Move a failed message to its delay or parking queue, then ack it.
+
+        Same retry topology and headers as rabbitmq.retry_or_park, so messages
+        move between the threaded and async consumers without losing their
+        retry count.
+        """
+        target, headers = retry_target(message.headers, error, message.routing_key, permanent)
+        await self.channel.default_exchange.publish(
+            aio_pika.Message(
+                message.body,
+                content_type=message.content_type,
+                headers=headers,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+            ),
+            routing_key=target
+        )
+        await message.ack()
+
+    def flush(self):
+        """Hand the current buffer to a background write task"""
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        task = asyncio.create_task(self.write_batch(batch))
+        self.pending_writes.add(task)
+        task.add_done_callback(self.pending_writes.discard)
+
+    async def write_batch(self, batch):
+        """Write one batch while holding a write slot"""
+        async with self.write_slots:
+            await self.write(batch)
+
+    async def write(self, batch):
+        """
+        Store a batch and ack its messages.
+
+        A failed batch is rolled back as a whole, so it is written again one
+        message at a time. Only the message that still fails is sent to its
+        retry or parking queue, and the rest are stored and acked.
+        """
+        try:
+            inserted = await self.store(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                await self.retry_or_park(batch[0][0], e)
+                return
+            logger.error(f"Error writing batch of {len(batch)} measurements, retrying one at a time: {e}")
+            for item in batch:
+                await self.write([item])
+            return
+
+        for message, *_ in batch:
+            await message.ack()
+        logger.info(f"Stored batch: {len(inserted)} new of {len(batch)} measurements")
+
+    async def store(self, batch):
+        """Insert raw rows and upsert hourly totals and rollups for one batch in a single transaction"""
+        # Sorting keeps row-lock order consistent across concurrent batches (no deadlocks)
+        rows = sorted(
+            {(str(device_id), timestamp): value for _, device_id, timestamp, value in batch}.items()
+        )
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                inserted = await conn.fetch(
+                    INSERT_MEASUREMENTS_SQL,
+                    [key[0] for key, _ in rows],
+                    [key[1] for key, _ in rows],
+                    [value for _, value in rows]
+                )
+
+                # [total, count, min, max, last value, last timestamp] per (device, date, hour)
+                hourly = defaultdict(lambda: [0.0, 0, None, None, None, None])
+                for record in inserted:
+                    timestamp = record['timestamp']
+                    value = record['measurement_value']
+                    stats = hourly[(record['device_id'], timestamp.date(), timestamp.hour)]
+                    stats[0] += value
+                    stats[1] += 1
+                    stats[2] = value if stats[2] is None else min(stats[2], value)
+                    stats[3] = value if stats[3] is None else max(stats[3], value)
+                    if stats[5] is None or timestamp >= stats[5]:
+                        stats[4], stats[5] = value, timestamp
+
+                if hourly:
+                    keys = sorted(hourly)
+                    updated = await conn.fetch(
+                        UPSERT_HOURLY_SQL,
+                        [key[0] for key in keys],
+                        [key[1] for key in keys],
+                        [key[2] for key in keys],
+                        [hourly[key][0] for key in keys],
+                        [hourly[key][1] for key in keys],
+                        [hourly[key][2] for key in keys],
+                        [hourly[key][3] for key in keys],
+                        [hourly[key][4] for key in keys],
+                        [hourly[key][5] for key in keys]
+                    )
+                    await self.write_rollups(conn, hourly, updated)
+                    await self.write_daily_sketches(conn, inserted)
+                    if settings.LIVE_EVENTS_ENABLED:
+                        await self.publish_live(conn, inserted, updated)
+
+        try:
+            await ainvalidate_daily_many((device_id, date) for device_id, date, _ in hourly)
+            await ainvalidate_analytics({device_id for device_id, _, _ in hourly})
+        except Exception as e:
+            logger.error(f"Error invalidating cached daily responses and analytics: {e}")
+        return inserted
+
+    async def publish_live(self, conn, inserted, updated):
+        """Notify live subscribers of each stored reading; delivered when the batch commits"""
+        hour_rows = {
+            (record['device_id'], record['date'], record['hour']): record
+            for record in updated
+        }
+        events = []
+        for record in inserted:
+            timestamp = record['timestamp']
+            hour_row = hour_rows[(record['device_id'], timestamp.date(), timestamp.hour)]
+            events.append(measurement_event(
+                record['device_id'], timestamp, record['measurement_value'],
+                timestamp.date(), timestamp.hour,
+                hour_row['total_consumption'], hour_row['measurement_count']
+            ))
+        await apublish_many(conn, events)
+
+    async def write_rollups(self, conn, hourly, updated):
+        """Add a batch's hourly deltas to the daily and fleet rollups"""
+        limits = dict(await conn.fetch(DEVICE_LIMITS_SQL, list({record['device_id'] for record in updated})))
+
+        daily = defaultdict(lambda: [0.0, 0])
+        fleet = defaultdict(lambda: [0.0, 0, 0])
+        for record in updated:
+            device_id, date, hour = record['device_id'], record['date'], record['hour']
+            delta, count = hourly[(device_id, date, hour)][:2]
+            new_total = record['total_consumption']
+
+            daily_totals = daily[(device_id, date)]
+            daily_totals[0] += delta
+            daily_totals[1] += count
+
+            fleet_totals = fleet[(date, hour, fleet_shard(device_id))]
+            fleet_totals[0] += delta
+            fleet_totals[1] += count
+            fleet_totals[2] += int(crossed_limit(new_total - delta, new_total, limits.get(device_id)))
+
+        daily_keys = sorted(daily)
+        await conn.execute(
+            UPSERT_DAILY_SQL,
+            [key[0] for key in daily_keys],
+            [key[1] for key in daily_keys],
+            [daily[key][0] for key in daily_keys],
+            [daily[key][1] for key in daily_keys]
+        )
+        fleet_keys = sorted(fleet)
+        await conn.execute(
+            UPSERT_FLEET_SQL,
+            [key[0] for key in fleet_keys],
+            [key[1] for key in fleet_keys],
+            [key[2] for key in fleet_keys],
+            [fleet[key][0] for key in fleet_keys],
+            [fleet[key][1] for key in fleet_keys],
+            [fleet[key][2] for key in fleet_keys]
+        )
+
+    async def write_daily_sketches(self, conn, inserted):
+        """Merge a batch's readings into the per-day value sketches"""
+        values = defaultdict(list)
+        for record in inserted:
+            values[(record['device_id'], record['timestamp'].date())].append(record['measurement_value'])
+
+        keys = sorted(values)
+        stored = {
+            (record['device_id'], record['date']): record['value_sketch']
+            for record in await conn.fetch(
+                SELECT_DAILY_SKETCHES_SQL,
+                [key[0] for key in keys],
+                [key[1] for key in keys]
+            )
+        }
+        await conn.execute(
+            UPDATE_DAILY_SKETCHES_SQL,
+            [key[0] for key in keys],
+            [key[1] for key in keys],
+            [add_to_sketch(stored.get(key), values[key]) for key in keys]
+        )
+
+    async def flush_periodically(self):
+        """Flush partial batches so low-traffic queues are not delayed"""
+        while not self.stopping.is_set():
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    async def run(self):
+        """Consume until SIGINT/SIGTERM, then drain in-flight writes"""
+        self.stopping = asyncio.Event()
+        self.write_slots = asyncio.Semaphore(self.pool_size)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stopping.set)
+
+        await self.connect()
+        self.channel = await self.connection.channel()
+        # prefetch bounds the number of unacked (in-flight) messages
+        await self.channel.set_qos(prefetch_count=self.max_in_flight)
+        consumers = []
+        for queue_name in settings.INGEST_QUEUES:
+            for name, arguments in retry_topology(queue_name):
+                await self.channel.declare_queue(name, durable=True, arguments=arguments)
+            queue = await self.channel.declare_queue(queue_name, durable=True)
+            consumers.append((queue, await queue.consume(self.on_message)))
+
+        flusher = asyncio.create_task(self.flush_periodically())
+        logger.info(f"Async ingest consuming from {', '.join(settings.INGEST_QUEUES)}")
+
+        await self.stopping.wait()
+        logger.info("Stopping async ingest, draining in-flight writes...")
+
+        for queue, consumer_tag in consumers:
+            await queue.cancel(consumer_tag)
+        flusher.cancel()
+        self.flush()
+        if self.pending_writes:
+            await asyncio.gather(*self.pending_writes, return_exceptions=True)
+
+        await self.connection.close()
+        await self.pool.close()
+        logger.info("Async ingest stopped")
@@ -0,0 +1,183 @@
+"""
+Async read views for the ASGI serving mode (SERVER_MODE=asgi).
+
+Same URLs, parameters and responses as the DRF viewsets for the hot dashboard
+endpoints, written against Django's async ORM and cache API: a worker keeps
+serving other requests while queries are in flight instead of parking one
+thread per request. urls.py routes these ahead of the DRF router in ASGI mode.
+"""
+import uuid
+from datetime import datetime
+from functools import wraps
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from .access import acan_access, afilter_accessible
+from .authentication import MonitoringJWTAuthentication
+from .caching import (
+    DAILY_VALUES_FIELDS,
+    daily_cache_entry,
+    daily_cache_key,
+    daily_cache_timeout,
+    is_not_modified,
+    apply_validators,
+)
+from .downsampling import downsample_measurements
+from .models import DeviceMeasurement, HourlyEnergyConsumption
+from .pagination import TimestampKeysetPagination
+from .renderers import ORJSONRenderer
+from .serializers import HOURLY_VALUES_FIELDS, hourly_rows_to_dicts
+from .views import parse_downsample_params, downsampled_point, measurement_row
+
+renderer = ORJSONRenderer()
+
+
+def json_response(data, status=200):
+    return HttpResponse(renderer.render(data), status=status, content_type='application/json')
+
+
+def jwt_authenticated(view):
+    """GET-only async view guarded by the same JWT authentication as the DRF views"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+        try:
+            # Token checks are CPU only - no database lookup to move off the event loop
+            result = MonitoringJWTAuthentication().authenticate(request)
+        except AuthenticationFailed as e:
+            return json_response(e.detail, status=401)
+        if result is None:
+            return json_response({'detail': 'Authentication credentials were not provided.'}, status=401)
+        request.user = result[0]
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+@jwt_authenticated
+async def measurement_list(request):
+    """Async DeviceMeasurementViewSet.list: keyset page or downsampled buckets"""
+    queryset = await afilter_accessible(DeviceMeasurement.objects.all(), request.user)
+
+    device_id = request.GET.get('device_id')
+    start_date = request.GET.get('start_date')
+    end_date = request.GET.get('end_date')
+
+    if device_id:
+        try:
+            device_id = str(uuid.UUID(device_id))
+        except ValueError:
+            return json_response({'error': 'Invalid device_id'}, status=400)
+        if not await acan_access(request.user, device_id):
+            return json_response({'error': 'You do not have access to this device'}, status=403)
+        queryset = queryset.filter(device_id=device_id)
+    if start_date:
+        queryset = queryset.filter(timestamp__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(timestamp__lte=end_date)
+
+    if 'resolution' in request.GET or 'max_points' in request.GET:
+        try:
+            start, end, resolution = parse_downsample_params(request.GET)
+        except ValueError as e:
+            return json_response({'error': str(e)}, status=400)
+        points = [
+            downsampled_point(row)
+            async for row in downsample_measurements(queryset, start, resolution)
+        ]
+        return json_response({
+            'start_date': start,
+            'end_date': end,
+            'resolution_seconds': resolution,
+            'points': points,
+        })
+
+    paginator = TimestampKeysetPagination()
+    try:
+        page = await paginator.apaginate_queryset(queryset, request)
+    except APIException as e:
+        return json_response({'detail': e.detail}, status=e.status_code)
+
+    return json_response({
+        'next': paginator.get_next_link(),
+        'results': [
+            measurement_row(row.id, row.device_id, row.timestamp, row.measurement_value, row.created_at)
+            for row in page
+        ],
+    })
+
+
+@jwt_authenticated
+async def hourly_daily(request):
+    """Async HourlyEnergyConsumptionViewSet.daily"""
+    device_id = request.GET.get('device_id')
+    date_str = request.GET.get('date')
+
+    if not device_id or not date_str:
+        return json_response({'error': 'device_id and date parameters are required'}, status=400)
+
+    # Normalize first so the access check sees the canonical id
+    try:
+        device_id = str(uuid.UUID(device_id))
+    except ValueError:
+        return json_response({'error': 'Invalid device_id'}, status=400)
+
+    if not await acan_access(request.user, device_id):
+        return json_response({'error': 'You do not have access to this device'}, status=403)
+
+    try:
+        date = datetime.strptime(date_str, '%Y-%m-%d').date()
+    except ValueError:
+        return json_response({'error': 'Invalid date format (use YYYY-MM-DD)'}, status=400)
+
+    key = daily_cache_key(device_id, date)
+    entry = await cache.aget(key)
+    if entry is None:
+        rows = HourlyEnergyConsumption.objects.filter(
+            device_id=device_id
+        ).between_days(date, date).values_list(*DAILY_VALUES_FIELDS)
+        entry = daily_cache_entry(device_id, date, [row async for row in rows])
+        await cache.aset(key, entry, daily_cache_timeout(date))
+
+    if is_not_modified(request, entry['etag'], entry['last_modified']):
+        return apply_validators(HttpResponse(status=304), entry['etag'], entry['last_modified'])
+
+    return apply_validators(json_response(entry['payload']), entry['etag'], entry['last_modified'])
+
+
+@jwt_authenticated
+async def hourly_range(request):
+    """Async HourlyEnergyConsumptionViewSet.range"""
+    device_id = request.GET.get('device_id')
+    start_date_str = request.GET.get('start_date')
+    end_date_str = request.GET.get('end_date')
+
+    if not all([device_id, start_date_str, end_date_str]):
+        return json_response({'error': 'device_id, start_date, and end_date parameters are required'}, status=400)
+
+    try:
+        device_id = str(uuid.UUID(device_id))
+    except ValueError:
+        return json_response({'error': 'Invalid device_id'}, status=400)
+
+    if not await acan_access(request.user, device_id):
+        return json_response({'error': 'You do not have access to this device'}, status=403)
+
+    try:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+    except ValueError:
+        return json_response({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=400)
+
+    rows = HourlyEnergyConsumption.objects.filter(
+        device_id=device_id
+    ).between_days(start_date, end_date).order_by('bucket_start').values_list(*HOURLY_VALUES_FIELDS)
+    data, total = hourly_rows_to_dicts([row async for row in rows])
+
+    return json_response({
+        'device_id': device_id,
+        'start_date': start_date_str,
+        'end_date': end_date_str,
+        'data': data,
+        'total_consumption': total
+    })
@@ -0,0 +1,167 @@
+"""
+Response caching and HTTP validators for hourly consumption endpoints.
+
+A closed day never changes unless late data arrives, so its daily payload is
+cached indefinitely; the current day is cached briefly. Ingest deletes the
+(device, date) entry after each batch or flush that touches that day, and the API answers
+conditional requests with 304 using an ETag/Last-Modified derived from the
+newest hourly row.
+"""
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe
+
+
+def daily_cache_key(device_id, date):
+    # v2: hourly_data entries carry min/max/avg/last statistics
+    return f"daily:v2:{device_id}:{date.isoformat()}"
+
+
+def daily_cache_timeout(date):
+    """None (keep forever) for closed days, a short TTL for today and later"""
+    if date < timezone.now().date():
+        return None
+    return settings.DAILY_CACHE_TODAY_TTL
+
+
+def heatmap_cache_key(device_id, year):
+    return f"heatmap:{device_id}:{year}"
+
+
+def heatmap_cache_timeout(year):
+    """None (keep forever) for closed years, a short TTL for the current one"""
+    if year < timezone.now().year:
+        return None
+    return settings.HEATMAP_CACHE_CURRENT_TTL
+
+
+def cost_month_cache_key(device_id, year, month):
+    return f"cost_month:{device_id}:{year}-{month:02d}"
+
+
+def date_cache_keys(device_id, date):
+    """Every cached entry covering this device and day: daily payload, year heatmap and month cost"""
+    return [
+        daily_cache_key(device_id, date),
+        heatmap_cache_key(device_id, date.year),
+        cost_month_cache_key(device_id, date.year, date.month),
+    ]
+
+
+def invalidate_daily(device_id, date):
+    cache.delete_many(date_cache_keys(device_id, date))
+
+
+def invalidate_daily_many(device_dates):
+    """Invalidate several (device_id, date) entries in one cache round trip"""
+    keys = {key for device_id, date in device_dates for key in date_cache_keys(device_id, date)}
+    if keys:
+        cache.delete_many(list(keys))
+
+
+async def ainvalidate_daily_many(device_dates):
+    """Async variant of invalidate_daily_many for the asyncio ingest engine"""
+    keys = {key for device_id, date in device_dates for key in date_cache_keys(device_id, date)}
+    if keys:
+        await cache.adelete_many(list(keys))
+
+
+def _analytics_generation_key(device_id):
+    return f"analytics_gen:{device_id}"
+
+
+def analytics_cache_key(name, device_id, *params):
+    """
+    Cache key for a derived per-device result. It embeds the device's current
+    generation, so invalidate_analytics() retires every variant at once.
+    """
+    generation = cache.get(_analytics_generation_key(device_id), 0)
+    return f"{name}:{device_id}:{generation}:" + ':'.join(str(param) for param in params)
+
+
+def invalidate_analytics(device_ids):
+    """Start a new generation for each device after its hourly data changed"""
+    generation = time.time_ns()
+    cache.set_many({_analytics_generation_key(device_id): generation for device_id in device_ids}, None)
+
+
+async def ainvalidate_analytics(device_ids):
+    generation = time.time_ns()
+    await cache.aset_many({_analytics_generation_key(device_id): generation for device_id in device_ids}, None)
+
+
+# Columns daily_cache_entry() expects, in order
+DAILY_VALUES_FIELDS = (
+    'hour', 'total_consumption', 'measurement_count',
+    'min_value', 'max_value', 'last_value', 'last_timestamp', 'updated_at'
+)
+
+
+def daily_cache_entry(device_id, date, rows):
+    """
+    Build the cached daily entry from DAILY_VALUES_FIELDS rows: the zero-filled
+    24-hour payload plus its ETag and Last-Modified validators
+    """
+    hours = [
+        {'hour': hour, 'total_consumption': 0.0, 'measurement_count': 0, 'min_value': None,
+         'max_value': None, 'avg_value': None, 'last_value': None, 'last_timestamp': None}
+        for hour in range(24)
+    ]
+    last_modified = None
+    for hour, total, count, min_value, max_value, last_value, last_timestamp, updated_at in rows:
+        hours[hour].update({
+            'total_consumption': total,
+            'measurement_count': count,
+            'min_value': min_value,
+            'max_value': max_value,
+            'avg_value': total / count if count else None,
+            'last_value': last_value,
+            'last_timestamp': last_timestamp,
+        })
+        if last_modified is None or updated_at > last_modified:
+            last_modified = updated_at
+
+    measurement_count = sum(entry['measurement_count'] for entry in hours)
+    peaks = [entry['max_value'] for entry in hours if entry['max_value'] is not None]
+    return {
+        'payload': {
+            'device_id': device_id,
+            'date': date.isoformat(),
+            'hourly_data': hours,
+            'total_daily_consumption': sum(entry['total_consumption'] for entry in hours),
+            'peak_value': max(peaks) if peaks else None
+        },
+        'etag': make_etag(device_id, date, last_modified and last_modified.isoformat(), measurement_count),
+        'last_modified': last_modified,
+    }
+
+
+def make_etag(*parts):
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'"{digest}"'
+
+
+def is_not_modified(request, etag, last_modified):
+    """Evaluate If-None-Match (preferred) or If-Modified-Since against the validators"""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in candidates or any(tag.removeprefix('W/') == etag for tag in candidates)
+
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since and last_modified is not None:
+        since = parse_http_date_safe(if_modified_since)
+        return since is not None and int(last_modified.timestamp()) <= since
+    return False
+
+
+def apply_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Let clients keep the body but always revalidate - a 304 is nearly free
+    response['Cache-Control'] = 'private, no-cache'
+    return response
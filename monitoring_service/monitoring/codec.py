@@ -0,0 +1,58 @@
+"""
+Wire formats for device measurements.
+
+Publishers pick the encoding and set it as the AMQP content_type:
+- application/json: {"timestamp": "ISO8601", "device_id": "uuid", "measurement_value": float}
+- application/x-ems-measurement: fixed 28-byte little-endian struct of
+  16-byte device UUID, int64 epoch milliseconds and float32 value
+"""
+import json
+import struct
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from django.utils import timezone
+
+JSON_CONTENT_TYPE = 'application/json'
+BINARY_CONTENT_TYPE = 'application/x-ems-measurement'
+
+MEASUREMENT_STRUCT = struct.Struct('<16sqf')
+
+
+def parse_measurement(data):
+    """
+    Extract (device_id, timestamp, measurement_value) from a decoded JSON message.
+    Expected format: {"timestamp": "ISO8601", "device_id": "uuid", "measurement_value": float}
+    """
+    device_id = str(uuid.UUID(str(data.get('device_id'))))
+    timestamp_str = data.get('timestamp')
+    measurement_value = float(data.get('measurement_value'))
+
+    # Parse timestamp
+    timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+
+    return device_id, timestamp, measurement_value
+
+
+def encode_binary(device_id, timestamp, measurement_value):
+    """Pack one measurement into the fixed binary layout"""
+    epoch_ms = int(timestamp.timestamp() * 1000)
+    return MEASUREMENT_STRUCT.pack(uuid.UUID(str(device_id)).bytes, epoch_ms, measurement_value)
+
+
+def decode_binary(body):
+    """Unpack (device_id, timestamp, measurement_value) from the fixed binary layout"""
+    device_bytes, epoch_ms, measurement_value = MEASUREMENT_STRUCT.unpack(body)
+    timestamp = datetime.fromtimestamp(epoch_ms / 1000, tz=dt_timezone.utc)
+    # Format the canonical UUID string directly; much cheaper than str(uuid.UUID(...))
+    h = device_bytes.hex()
+    device_id = f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+    return device_id, timestamp, measurement_value
+
+
+def decode_measurement(body, content_type=None):
+    """Decode a message body according to its content_type (JSON when unset)"""
+    if content_type == BINARY_CONTENT_TYPE:
+        return decode_binary(body)
+    return parse_measurement(json.loads(body))
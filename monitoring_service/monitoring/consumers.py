@@ -1,92 +1,202 @@
 import json
 import logging
-from datetime import datetime
+import time
+from datetime import timezone as dt_timezone
 from django.utils import timezone
-from django.db import transaction
-from .models import User, Device, DeviceMeasurement, HourlyEnergyConsumption, UserDeviceMapping
-from .rabbitmq import get_rabbitmq_connection
+from django.db import connection, transaction, IntegrityError
+from .models import User, Device, DeviceMeasurement, HourlyEnergyConsumption, UserDeviceMapping, bucket_start_for
+from .rabbitmq import get_rabbitmq_connection, retry_or_park
+from .dedup import RecentMeasurementFilter
+from .codec import decode_measurement
+from .metrics import StageMetrics, LogSampler
+from .access import invalidate_user_access
+from .rollups import HOURLY_UPSERT_CONFLICT_SQL, DailySketchBuffer, DeviceLimitCache, apply_rollups, crossed_limit
+from .live import measurement_event, publish
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+UPSERT_HOURLY_ROW_RETURNING = (
+    'id', 'bucket_start', 'total_consumption', 'measurement_count',
+    'min_value', 'max_value', 'last_value', 'last_timestamp', 'created_at', 'updated_at'
+)
+
+UPSERT_HOURLY_ROW_SQL = f"""
+    INSERT INTO {HourlyEnergyConsumption._meta.db_table}
+        (id, device_id, date, hour, bucket_start, total_consumption, measurement_count,
+         min_value, max_value, last_value, last_timestamp, created_at, updated_at)
+    VALUES (gen_random_uuid(), %s, %s, %s, %s, %s, 1, %s, %s, %s, %s, now(), now())
+    {HOURLY_UPSERT_CONFLICT_SQL}
+    RETURNING {', '.join(UPSERT_HOURLY_ROW_RETURNING)}
+"""
+
 
 class DeviceDataConsumer:
     """Consumes device measurement data from smart meters"""
     
-    def __init__(self):
+    STAGES = ['decode', 'dedup', 'raw_insert', 'aggregate', 'ack', 'lag', 'total']
+    
+    def __init__(self, queue_names=None):
         self.connection = get_rabbitmq_connection()
+        self.queue_names = queue_names or settings.INGEST_QUEUES
+        self.recent = RecentMeasurementFilter(
+            capacity=settings.DEDUP_FILTER_CAPACITY,
+            error_rate=settings.DEDUP_FILTER_ERROR_RATE,
+            window_seconds=settings.DEDUP_WINDOW_SECONDS
+        )
+        self.metrics = StageMetrics('ingest', self.STAGES, settings.INGEST_METRICS_INTERVAL)
+        self.log_sampler = LogSampler(settings.INGEST_LOG_SAMPLES_PER_SECOND)
+        self.duplicate_log_sampler = LogSampler(settings.INGEST_LOG_SAMPLES_PER_SECOND)
+        self.device_limits = DeviceLimitCache()
+        self.sketches = DailySketchBuffer()
+    
+    def is_duplicate(self, device_id, timestamp):
+        """Check whether this (device_id, timestamp) was already stored"""
+        key = RecentMeasurementFilter.make_key(device_id, timestamp)
+        if not self.recent.might_contain(key):
+            # Definitely not seen recently - no database round trip needed
+            return False
+        # Possible hit (or false positive): confirm against the unique constraint's index
+        return DeviceMeasurement.objects.filter(device_id=device_id, timestamp=timestamp).exists()
+    
+    def log_duplicate(self, device_id, timestamp):
+        """Warn about a skipped duplicate, sampled so a redelivery storm cannot flood the log"""
+        suppressed = self.duplicate_log_sampler.allow()
+        if suppressed is not None:
+            logger.warning(
+                f"Duplicate measurement for device {device_id} at {timestamp} - skipping "
+                f"({suppressed} similar lines suppressed)"
+            )
     
     def callback(self, ch, method, properties, body):
         """Process incoming device measurement"""
+        started = time.perf_counter()
         try:
-            data = json.loads(body)
-            logger.info(f"Received device data: {data}")
-            
-            # Expected format: {"timestamp": "ISO8601", "device_id": "uuid", "measurement_value": float}
-            device_id = data.get('device_id')
-            timestamp_str = data.get('timestamp')
-            measurement_value = float(data.get('measurement_value'))
-            
-            # Parse timestamp
-            timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-            if timezone.is_naive(timestamp):
-                timestamp = timezone.make_aware(timestamp)
+            device_id, timestamp, measurement_value = decode_measurement(body, properties.content_type)
+        except Exception as e:
+            logger.error(f"Malformed device data: {e}")
+            # Retrying cannot fix a bad payload - park it straight away
+            retry_or_park(ch, method, properties, body, e, permanent=True)
+            return
+        decoded = time.perf_counter()
+        self.metrics.observe('decode', (decoded - started) * 1000)
+        
+        try:
+            duplicate = self.is_duplicate(device_id, timestamp)
+            checked = time.perf_counter()
+            self.metrics.observe('dedup', (checked - decoded) * 1000)
+            if duplicate:
+                self.log_duplicate(device_id, timestamp)
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+                return
             
-            # Store raw measurement
-            measurement = DeviceMeasurement.objects.create(
-                device_id=device_id,
-                timestamp=timestamp,
-                measurement_value=measurement_value
-            )
-            logger.info(f"Stored measurement: {measurement}")
+            hourly = None
+            try:
+                # Raw insert and hourly aggregate commit together, so a redelivery
+                # either finds both or neither
+                with transaction.atomic():
+                    DeviceMeasurement.objects.create(
+                        device_id=device_id,
+                        timestamp=timestamp,
+                        measurement_value=measurement_value
+                    )
+                    inserted = time.perf_counter()
+                    self.metrics.observe('raw_insert', (inserted - checked) * 1000)
+                    
+                    # Aggregate into hourly consumption
+                    hourly = self.aggregate_hourly(device_id, timestamp, measurement_value)
+                # Aggregate time includes the commit
+                self.metrics.observe('aggregate', (time.perf_counter() - inserted) * 1000)
+                # Sketch and cache invalidation for the day are batched until the next flush
+                self.sketches.add(device_id, hourly.date, measurement_value)
+            except IntegrityError:
+                # Unique (device_id, timestamp) constraint caught a duplicate the filter missed
+                self.log_duplicate(device_id, timestamp)
             
-            # Aggregate into hourly consumption
-            self.aggregate_hourly(device_id, timestamp, measurement_value)
+            self.recent.add(RecentMeasurementFilter.make_key(device_id, timestamp))
             
             # Acknowledge message
+            acking = time.perf_counter()
             ch.basic_ack(delivery_tag=method.delivery_tag)
+            finished = time.perf_counter()
+            self.metrics.observe('ack', (finished - acking) * 1000)
+            self.metrics.observe('lag', (timezone.now() - timestamp).total_seconds() * 1000)
+            self.metrics.observe('total', (finished - started) * 1000)
+            
+            if hourly is not None:
+                suppressed = self.log_sampler.allow()
+                if suppressed is not None:
+                    logger.info(
+                        f"Stored measurement: device {device_id} at {timestamp} = {measurement_value} kWh "
+                        f"(hour total {hourly.total_consumption:.3f} kWh, {suppressed} similar lines suppressed)"
+                    )
+            self.metrics.maybe_report()
+            self.flush_sketches(force=False)
             
         except Exception as e:
             logger.error(f"Error processing device data: {e}")
-            # Reject and requeue message
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            # Retry with backoff instead of requeueing in a tight loop
+            retry_or_park(ch, method, properties, body, e)
     
     def aggregate_hourly(self, device_id, timestamp, measurement_value):
         """Aggregate measurement into hourly total"""
+        # Hourly buckets are UTC hours; a reading sent with another offset must not shift buckets
+        utc_timestamp = timestamp.astimezone(dt_timezone.utc)
+        date = utc_timestamp.date()
+        hour = utc_timestamp.hour
+        
+        # One atomic upsert instead of get_or_create + save, so concurrent
+        # consumers cannot lose each other's increments
+        with connection.cursor() as cursor:
+            cursor.execute(UPSERT_HOURLY_ROW_SQL, [
+                device_id, date, hour, bucket_start_for(date, hour), measurement_value,
+                measurement_value, measurement_value, measurement_value, timestamp
+            ])
+            hourly = HourlyEnergyConsumption(device_id=device_id, date=date, hour=hour, **dict(
+                zip(UPSERT_HOURLY_ROW_RETURNING, cursor.fetchone())
+            ))
+        previous_total = hourly.total_consumption - measurement_value
+        
+        # Keep daily and fleet-wide rollups in step with the hourly row
+        over_limit = crossed_limit(previous_total, hourly.total_consumption, self.device_limits.get(device_id))
+        apply_rollups(device_id, date, hour, measurement_value, over_limit)
+        
+        # pg_notify is transactional - live subscribers only see committed readings
+        if settings.LIVE_EVENTS_ENABLED:
+            publish(measurement_event(
+                device_id, timestamp, measurement_value, date, hour,
+                hourly.total_consumption, hourly.measurement_count
+            ))
+        
+        return hourly
+    
+    def flush_sketches(self, force=True):
+        """
+        Write buffered readings into the daily sketches and retire the touched days'
+        cached responses; a failed sketch write is retried on the next flush
+        """
         try:
-            date = timestamp.date()
-            hour = timestamp.hour
-            
-            # Get or create hourly record
-            hourly, created = HourlyEnergyConsumption.objects.get_or_create(
-                device_id=device_id,
-                date=date,
-                hour=hour,
-                defaults={
-                    'total_consumption': 0.0,
-                    'measurement_count': 0
-                }
-            )
-            
-            # Update totals
-            hourly.total_consumption += measurement_value
-            hourly.measurement_count += 1
-            hourly.save()
-            
-            logger.info(f"Updated hourly consumption: {hourly}")
-            
+            if force:
+                self.sketches.flush()
+            else:
+                self.sketches.maybe_flush()
         except Exception as e:
-            logger.error(f"Error aggregating hourly data: {e}")
+            logger.error(f"Error flushing daily value sketches ({self.sketches.pending} readings kept): {e}")
     
     def start(self):
         """Start consuming messages"""
         logger.info("Starting Device Data Consumer...")
-        self.connection.consume_messages(settings.DEVICE_DATA_QUEUE, self.callback)
+        try:
+            self.connection.consume_messages(self.queue_names, self.callback)
+        finally:
+            self.flush_sketches()
 
 
 class SyncConsumer:
     """Consumes synchronization events for users and devices"""
     
+    queue_name = 'monitoring_service_sync_queue'
+    
     def __init__(self):
         self.connection = get_rabbitmq_connection()
     
@@ -124,8 +234,8 @@ class SyncConsumer:
             
         except Exception as e:
             logger.error(f"Error processing sync event: {e}")
-            # Requeue for retry
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            # Retry with backoff, park after MAX_RETRIES
+            retry_or_park(ch, method, properties, body, e, queue_name=self.queue_name)
     
     def handle_user_created(self, data):
         """Handle user creation event"""
@@ -163,6 +273,7 @@ class SyncConsumer:
         try:
             user_id = data.get('data', {}).get('id')
             deleted_count, _ = User.objects.filter(id=user_id).delete()
+            transaction.on_commit(lambda: invalidate_user_access(user_id))
             
             if deleted_count > 0:
                 logger.info(f"Deleted user: {user_id}")
@@ -210,8 +321,15 @@ class SyncConsumer:
         try:
             device_id = data.get('data', {}).get('id')
             
+            # Users who could see this device must reload their access sets
+            affected_user_ids = list(
+                UserDeviceMapping.objects.filter(device_id=device_id).values_list('user_id', flat=True)
+            )
+            for affected_user_id in affected_user_ids:
+                transaction.on_commit(lambda uid=affected_user_id: invalidate_user_access(uid))
+            
             # Check for orphaned mappings
-            remaining_mappings = UserDeviceMapping.objects.filter(device_id=device_id).count()
+            remaining_mappings = len(affected_user_ids)
             if remaining_mappings > 0:
                 logger.warning(
                     f"Device {device_id} still has {remaining_mappings} mappings! "
@@ -267,6 +385,8 @@ class SyncConsumer:
                 device=device
             )
             
+            transaction.on_commit(lambda: invalidate_user_access(user_id))
+            
             action = "Created" if created else "Already exists"
             logger.info(f"{action} assignment: {device.name} -> {user.username}")
         except Exception as e:
@@ -285,6 +405,7 @@ class SyncConsumer:
                 user_id=user_id,
                 device_id=device_id
             ).delete()
+            transaction.on_commit(lambda: invalidate_user_access(user_id))
             
             if deleted_count > 0:
                 logger.info(f"Deleted assignment: device {device_id} from user {user_id}")
@@ -309,7 +430,7 @@ class SyncConsumer:
         )
         
         # Declare exclusive queue for monitoring service
-        result = self.connection.channel.queue_declare(queue='monitoring_service_sync_queue', durable=True)
+        result = self.connection.channel.queue_declare(queue=self.queue_name, durable=True)
         queue_name = result.method.queue
         
         # Bind queue to exchange
@@ -0,0 +1,71 @@
+"""
+Time-windowed Bloom filter for spotting redelivered measurements cheaply
+"""
+import hashlib
+import math
+import time
+import threading
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter backed by a bytearray"""
+
+    def __init__(self, capacity, error_rate):
+        # Standard sizing: m = -n ln(p) / ln(2)^2, k = m/n ln(2)
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing (Kirsch-Mitzenmacher) from a single 128-bit digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RecentMeasurementFilter:
+    """
+    Remembers measurement keys seen within roughly the last `window_seconds`.
+
+    Two Bloom filter generations are kept and rotated every window, so memory
+    stays bounded no matter how long the consumer runs. A miss means the key is
+    definitely new; a hit only means "maybe seen" and must be confirmed against
+    the database unique constraint.
+    """
+
+    def __init__(self, capacity, error_rate, window_seconds):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.window_seconds = window_seconds
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = BloomFilter(capacity, error_rate)
+        self.rotated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(device_id, timestamp):
+        return f"{device_id}|{timestamp.isoformat()}"
+
+    def _maybe_rotate(self):
+        if time.monotonic() - self.rotated_at >= self.window_seconds:
+            self.previous = self.current
+            self.current = BloomFilter(self.capacity, self.error_rate)
+            self.rotated_at = time.monotonic()
+
+    def might_contain(self, key):
+        with self.lock:
+            self._maybe_rotate()
+            return key in self.current or key in self.previous
+
+    def add(self, key):
+        with self.lock:
+            self._maybe_rotate()
+            self.current.add(key)
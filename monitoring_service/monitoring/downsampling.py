@@ -0,0 +1,45 @@
+"""
+Server-side time-bucket downsampling of raw measurements
+"""
+import math
+from datetime import timedelta
+from django.db.models import Avg, Count, DateTimeField, DurationField, Func, Max, Min, Value
+
+
+class DateBin(Func):
+    """PostgreSQL date_bin(stride, source, origin)"""
+    function = 'date_bin'
+    output_field = DateTimeField()
+
+    def __init__(self, stride, expression, origin, **extra):
+        super().__init__(
+            Value(stride, output_field=DurationField()),
+            expression,
+            Value(origin, output_field=DateTimeField()),
+            **extra
+        )
+
+
+def resolution_for(start, end, max_points):
+    """Smallest whole-second bucket width that keeps the range within max_points buckets"""
+    span = (end - start).total_seconds()
+    return max(1, math.ceil(span / max_points))
+
+
+def downsample_measurements(queryset, start, resolution_seconds):
+    """
+    Bucket measurements into fixed-width windows aligned to `start` and
+    return avg/min/max/count per (device, bucket), computed in one GROUP BY.
+    """
+    return (
+        queryset
+        .annotate(bucket=DateBin(timedelta(seconds=resolution_seconds), 'timestamp', start))
+        .values('device_id', 'bucket')
+        .annotate(
+            avg=Avg('measurement_value'),
+            min=Min('measurement_value'),
+            max=Max('measurement_value'),
+            count=Count('id'),
+        )
+        .order_by('device_id', 'bucket')
+    )
@@ -0,0 +1,197 @@
+"""
+Bounded-memory CSV / Parquet export of raw and hourly consumption history.
+
+Rows are read from a server-side cursor EXPORT_CHUNK_SIZE at a time and each
+chunk is encoded and handed on (HTTP response or file) before the next one is
+fetched, so memory stays constant however many devices or years are exported.
+Encoders are push-based (encode(rows) -> bytes, finish() -> bytes) so the same
+code serves the sync and async streaming paths and the management command.
+"""
+import csv
+import io
+import zlib
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.utils import timezone
+from .models import DeviceMeasurement, HourlyEnergyConsumption
+
+EXPORT_KINDS = {
+    'raw': {
+        'model': DeviceMeasurement,
+        'columns': ('device_id', 'timestamp', 'measurement_value'),
+        'order_by': ('device_id', 'timestamp'),
+    },
+    'hourly': {
+        'model': HourlyEnergyConsumption,
+        'columns': ('device_id', 'date', 'hour', 'total_consumption', 'measurement_count'),
+        'order_by': ('device_id', 'bucket_start'),
+    },
+}
+
+EXPORT_FORMATS = ('csv', 'parquet')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'csv.gz': 'application/gzip',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def export_queryset(kind, device_ids, start_date, end_date):
+    """
+    values_list rows for one kind between two dates (inclusive), ordered per device.
+    device_ids=None exports every device.
+    """
+    spec = EXPORT_KINDS[kind]
+    queryset = spec['model'].objects.all()
+    if device_ids is not None:
+        queryset = queryset.filter(device_id__in=device_ids)
+    if kind == 'raw':
+        start = timezone.make_aware(datetime.combine(start_date, time.min))
+        end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+        queryset = queryset.filter(timestamp__gte=start, timestamp__lt=end)
+    else:
+        queryset = queryset.between_days(start_date, end_date)
+    return queryset.order_by(*spec['order_by']).values_list(*spec['columns'])
+
+
+def export_filename(kind, file_format, start_date, end_date, compress):
+    extension = file_format + ('.gz' if compress and file_format == 'csv' else '')
+    return f"{kind}_{start_date.isoformat()}_{end_date.isoformat()}.{extension}"
+
+
+def export_content_type(file_format, compress):
+    return CONTENT_TYPES['csv.gz' if compress and file_format == 'csv' else file_format]
+
+
+class CSVEncoder:
+    """CSV with a header row, optionally wrapped in a streaming gzip container"""
+
+    def __init__(self, kind, compress=False):
+        self.columns = EXPORT_KINDS[kind]['columns']
+        self.header_pending = True
+        # wbits=31 writes a gzip header/trailer instead of a raw zlib stream
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def output(self, data):
+        return self.compressor.compress(data) if self.compressor else data
+
+    def encode(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if self.header_pending:
+            writer.writerow(self.columns)
+            self.header_pending = False
+        writer.writerows(
+            [value.isoformat() if hasattr(value, 'isoformat') else value for value in row]
+            for row in rows
+        )
+        return self.output(buffer.getvalue().encode('utf-8'))
+
+    def finish(self):
+        data = self.encode([]) if self.header_pending else b''
+        if self.compressor:
+            data += self.compressor.flush()
+        return data
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+class ParquetEncoder:
+    """Columnar Parquet, one row group per chunk; gzip selects the column codec"""
+
+    def __init__(self, kind, compress=False):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.kind = kind
+        if kind == 'raw':
+            self.schema = pa.schema([
+                ('device_id', pa.string()),
+                ('timestamp', pa.timestamp('us', tz='UTC')),
+                ('measurement_value', pa.float64()),
+            ])
+        else:
+            self.schema = pa.schema([
+                ('device_id', pa.string()),
+                ('date', pa.date32()),
+                ('hour', pa.int8()),
+                ('total_consumption', pa.float64()),
+                ('measurement_count', pa.int32()),
+            ])
+        self.sink = _ChunkSink()
+        self.writer = pq.ParquetWriter(self.sink, self.schema, compression='gzip' if compress else 'snappy')
+
+    def encode(self, rows):
+        if not rows:
+            return b''
+        columns = list(zip(*rows))
+        columns[0] = [str(device_id) for device_id in columns[0]]
+        table = self.pa.Table.from_arrays(
+            [self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        )
+        self.writer.write_table(table)
+        return self.sink.drain()
+
+    def finish(self):
+        # Footer with the row-group index is only written on close
+        self.writer.close()
+        return self.sink.drain()
+
+
+def get_encoder(kind, file_format, compress=False):
+    if file_format == 'parquet':
+        return ParquetEncoder(kind, compress)
+    return CSVEncoder(kind, compress)
+
+
+def iter_export(rows, encoder, chunk_size=None):
+    """Encode a queryset chunk by chunk from a server-side cursor"""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield encoder.encode(chunk)
+            chunk = []
+    if chunk:
+        yield encoder.encode(chunk)
+    yield encoder.finish()
+
+
+async def aiter_export(rows, encoder, chunk_size=None):
+    """iter_export for ASGI streaming responses"""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    chunk = []
+    async for row in rows.aiterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield encoder.encode(chunk)
+            chunk = []
+    if chunk:
+        yield encoder.encode(chunk)
+    yield encoder.finish()
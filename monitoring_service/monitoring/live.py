@@ -0,0 +1,219 @@
+"""
+Live measurement fan-out for the Server-Sent Events stream.
+
+Ingest publishes stored readings with pg_notify inside its write transaction,
+so events are only delivered once committed and reach every web process
+regardless of which consumer process stored them. Postgres serializes commits
+of notifying transactions, so publishing is off unless LIVE_EVENTS_ENABLED is
+set, and the async engine packs a whole batch into a few notifications. Each
+web process keeps one LISTEN connection and fans events out to its subscribers
+through bounded per-subscriber buffers: a slow client loses its oldest events
+instead of growing memory or holding up everyone else.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import deque
+import psycopg2
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+LIVE_CHANNEL = 'monitoring_live'
+
+# NOTIFY payloads must stay under 8000 bytes
+NOTIFY_MAX_BYTES = 7900
+
+
+def measurement_event(device_id, timestamp, measurement_value, date, hour, hour_total, hour_count):
+    """A stored reading plus the hourly row it was added to"""
+    return {
+        'device_id': str(device_id),
+        'timestamp': timestamp.isoformat(),
+        'measurement_value': measurement_value,
+        'date': date.isoformat(),
+        'hour': hour,
+        'hour_total_consumption': hour_total,
+        'hour_measurement_count': hour_count,
+    }
+
+
+def pack_events(events):
+    """Encode events as JSON array payloads, each small enough for one NOTIFY"""
+    payloads = []
+    chunk = []
+    size = 2
+    for event in events:
+        encoded = json.dumps(event)
+        if chunk and size + len(encoded) + 1 > NOTIFY_MAX_BYTES:
+            payloads.append(f"[{','.join(chunk)}]")
+            chunk = []
+            size = 2
+        chunk.append(encoded)
+        size += len(encoded) + 1
+    if chunk:
+        payloads.append(f"[{','.join(chunk)}]")
+    return payloads
+
+
+def publish(event):
+    """Queue an event for delivery when the current transaction commits"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", [LIVE_CHANNEL, pack_events([event])[0]])
+
+
+async def apublish_many(conn, events):
+    """asyncpg variant of publish: a batch's events coalesced into as few notifications as fit"""
+    payloads = pack_events(events)
+    if payloads:
+        await conn.executemany(
+            "SELECT pg_notify($1, $2)",
+            [(LIVE_CHANNEL, payload) for payload in payloads]
+        )
+
+
+class Subscription:
+    """One client's filtered, bounded event buffer"""
+
+    def __init__(self, device_ids, buffer_size):
+        # None means every device (admins)
+        self.device_ids = device_ids
+        self.events = deque(maxlen=buffer_size)
+        self.dropped = 0
+        self.condition = threading.Condition()
+        # (loop, asyncio.Event) once an async consumer starts waiting
+        self.waiter = None
+
+    def wants(self, device_id):
+        return self.device_ids is None or device_id in self.device_ids
+
+    def restrict(self, device_ids):
+        """Replace the device filter after an access change, dropping buffered events for removed devices"""
+        with self.condition:
+            if device_ids == self.device_ids:
+                return
+            self.device_ids = device_ids
+            kept = [payload for payload in self.events if json.loads(payload)['device_id'] in device_ids]
+            self.events.clear()
+            self.events.extend(kept)
+
+    def offer(self, payload):
+        with self.condition:
+            if len(self.events) == self.events.maxlen:
+                # deque(maxlen) discards the oldest on append
+                self.dropped += 1
+            self.events.append(payload)
+            self.condition.notify()
+            waiter = self.waiter
+        if waiter is not None:
+            loop, ready = waiter
+            loop.call_soon_threadsafe(ready.set)
+
+    def take(self):
+        """Return (payloads, dropped since last take) without waiting"""
+        with self.condition:
+            payloads = list(self.events)
+            self.events.clear()
+            dropped, self.dropped = self.dropped, 0
+        return payloads, dropped
+
+    def drain(self, timeout):
+        """Wait up to timeout seconds for payloads, then take them"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.events, timeout)
+        return self.take()
+
+    async def adrain(self, timeout):
+        """drain() for async consumers, woken through the event loop"""
+        if self.waiter is None:
+            self.waiter = (asyncio.get_running_loop(), asyncio.Event())
+        _, ready = self.waiter
+        with self.condition:
+            pending = bool(self.events)
+        if not pending:
+            try:
+                await asyncio.wait_for(ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        ready.clear()
+        return self.take()
+
+
+class LiveHub:
+    """Per-process LISTEN connection and subscriber registry"""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.listener = None
+
+    def subscribe(self, device_ids):
+        """Register a subscriber, or return None when the process is at LIVE_MAX_SUBSCRIBERS"""
+        with self.lock:
+            if len(self.subscribers) >= settings.LIVE_MAX_SUBSCRIBERS:
+                return None
+            if self.listener is None or not self.listener.is_alive():
+                self.listener = threading.Thread(target=self.listen, name='live-listener', daemon=True)
+                self.listener.start()
+            subscription = Subscription(device_ids, settings.LIVE_SUBSCRIBER_BUFFER)
+            self.subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def dispatch(self, payload):
+        """Offer each event in a notification to every subscriber watching its device"""
+        try:
+            events = [(event['device_id'], json.dumps(event)) for event in json.loads(payload)]
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignoring malformed live event: {payload[:200]}")
+            return
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            for device_id, event in events:
+                if subscription.wants(device_id):
+                    subscription.offer(event)
+
+    def connect(self):
+        db = settings.DATABASES['default']
+        conn = psycopg2.connect(
+            dbname=db['NAME'],
+            user=db['USER'],
+            password=db['PASSWORD'],
+            host=db['HOST'],
+            port=db['PORT'],
+        )
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {LIVE_CHANNEL}")
+        return conn
+
+    def listen(self):
+        """Forward notifications to subscribers until the process exits, reconnecting on errors"""
+        while True:
+            conn = None
+            try:
+                conn = self.connect()
+                logger.info(f"Listening for live events on '{LIVE_CHANNEL}'")
+                while True:
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.dispatch(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.error(f"Live event listener failed, reconnecting: {e}")
+                time.sleep(settings.LIVE_RECONNECT_DELAY)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+hub = LiveHub()
@@ -0,0 +1,63 @@
+"""
+Django management command to compare measurement wire formats
+Usage: python manage.py benchmark_codec [--messages N]
+"""
+from django.core.management.base import BaseCommand
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from monitoring.codec import (
+    encode_binary,
+    decode_measurement,
+    JSON_CONTENT_TYPE,
+    BINARY_CONTENT_TYPE,
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark JSON vs binary measurement encoding (size and decode CPU)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=100000, help='Messages per format (default: 100000)')
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        start = datetime.now(timezone.utc)
+        samples = [
+            (str(uuid.uuid4()), start + timedelta(seconds=i), round(random.uniform(0.05, 0.5), 3))
+            for i in range(count)
+        ]
+
+        json_bodies = [
+            json.dumps({
+                'timestamp': ts.replace(tzinfo=None).isoformat() + 'Z',
+                'device_id': device_id,
+                'measurement_value': value,
+            }).encode('utf-8')
+            for device_id, ts, value in samples
+        ]
+        binary_bodies = [encode_binary(device_id, ts, value) for device_id, ts, value in samples]
+
+        results = []
+        for name, bodies, content_type in (
+            ('json', json_bodies, JSON_CONTENT_TYPE),
+            ('binary', binary_bodies, BINARY_CONTENT_TYPE),
+        ):
+            started = time.perf_counter()
+            for body in bodies:
+                decode_measurement(body, content_type)
+            elapsed = time.perf_counter() - started
+
+            avg_size = sum(len(body) for body in bodies) / count
+            results.append((name, avg_size, elapsed / count * 1e6))
+
+        self.stdout.write(f"{'format':<8} {'bytes/msg':>10} {'decode us/msg':>14}")
+        for name, avg_size, decode_us in results:
+            self.stdout.write(f"{name:<8} {avg_size:>10.1f} {decode_us:>14.2f}")
+
+        (_, json_size, json_us), (_, binary_size, binary_us) = results
+        self.stdout.write(self.style.SUCCESS(
+            f"binary is {json_size / binary_size:.1f}x smaller and decodes {json_us / binary_us:.1f}x faster"
+        ))
@@ -0,0 +1,85 @@
+"""
+Django management command to compare hourly read-path serialization costs
+Usage: python manage.py benchmark_serialization [--rows N] [--repeat N]
+"""
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+import random
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from monitoring.models import HourlyEnergyConsumption, bucket_start_for
+from monitoring.renderers import ORJSONRenderer
+from monitoring.serializers import HourlyEnergyConsumptionSerializer, hourly_rows_to_dicts
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ModelSerializer + JSONRenderer vs values_list + orjson for hourly rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Hourly rows per run (default: 10000)')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per path, best is reported (default: 5)')
+
+    def handle(self, *args, **options):
+        count = options['rows']
+        device_id = uuid.uuid4()
+        start_day = date.today() - timedelta(days=count // 24 + 1)
+        now = datetime.now(timezone.utc)
+
+        # Same data as model instances (current path) and as values_list tuples (lean path)
+        rows = [
+            (
+                uuid.uuid4(),
+                device_id,
+                start_day + timedelta(days=i // 24),
+                i % 24,
+                bucket_start_for(start_day + timedelta(days=i // 24), i % 24),
+                round(random.uniform(1.0, 30.0), 3),
+                random.randint(1, 360),
+                0.01,
+                0.2,
+                0.05,
+                now,
+                now,
+                now,
+            )
+            for i in range(count)
+        ]
+        instances = [
+            HourlyEnergyConsumption(
+                id=row_id, device_id=dev_id, date=day, hour=hour, bucket_start=bucket_start,
+                total_consumption=consumption, measurement_count=measurements,
+                min_value=min_value, max_value=max_value, last_value=last_value, last_timestamp=last_timestamp,
+                created_at=created_at, updated_at=updated_at
+            )
+            for (row_id, dev_id, day, hour, bucket_start, consumption, measurements,
+                 min_value, max_value, last_value, last_timestamp, created_at, updated_at) in rows
+        ]
+
+        def current_path():
+            data = HourlyEnergyConsumptionSerializer(instances, many=True).data
+            total = sum(instance.total_consumption for instance in instances)
+            return JSONRenderer().render({'data': data, 'total_consumption': total})
+
+        def lean_path():
+            data, total = hourly_rows_to_dicts(rows)
+            return ORJSONRenderer().render({'data': data, 'total_consumption': total})
+
+        results = []
+        for name, func in (('serializer', current_path), ('values_list', lean_path)):
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                body = func()
+                timings.append(time.perf_counter() - started)
+            best = min(timings)
+            results.append((name, best * 1000, best / count * 1e6, len(body)))
+
+        self.stdout.write(f"{'path':<12} {'total ms':>10} {'us/row':>8} {'bytes':>10}")
+        for name, total_ms, per_row_us, size in results:
+            self.stdout.write(f"{name:<12} {total_ms:>10.1f} {per_row_us:>8.2f} {size:>10}")
+
+        (_, serializer_ms, _, _), (_, lean_ms, _, _) = results
+        self.stdout.write(self.style.SUCCESS(
+            f"values_list + orjson is {serializer_ms / lean_ms:.1f}x faster on {count} rows"
+        ))
@@ -0,0 +1,76 @@
+"""
+Django management command to build per-day value sketches from retained raw measurements
+Usage: python manage.py build_daily_sketches [--device-id UUID ...] [--start-date YYYY-MM-DD] [--end-date YYYY-MM-DD]
+       [--stale] [--force]
+
+Fills value_sketch on daily rollups written before sketches existed, and with
+--stale rebuilds sketches that hold fewer readings than the day's count (a
+consumer stopped before flushing its buffered readings). A day is only written
+when its raw rows still account for every aggregated reading, so days already
+thinned out by retention are left alone.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from datetime import datetime, time, timedelta, timezone
+from monitoring.models import DeviceDailyConsumption, DeviceMeasurement
+from monitoring.rollups import add_to_sketch, load_sketch
+
+
+class Command(BaseCommand):
+    help = 'Backfill daily value sketches from raw measurements that are still retained'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device-id', action='append', dest='device_ids', help='Device to backfill (repeatable, default: all)')
+        parser.add_argument('--start-date', help='First UTC day (YYYY-MM-DD, default: RAW_RETENTION_DAYS ago)')
+        parser.add_argument('--end-date', help='Last UTC day, inclusive (YYYY-MM-DD, default: yesterday)')
+        parser.add_argument('--stale', action='store_true', help='Also rebuild sketches missing some of the day\'s readings')
+        parser.add_argument('--force', action='store_true', help='Rebuild days that already have a sketch')
+
+    def handle(self, *args, **options):
+        today = datetime.now(timezone.utc).date()
+        try:
+            start_date = (
+                datetime.strptime(options['start_date'], '%Y-%m-%d').date() if options['start_date']
+                else today - timedelta(days=settings.RAW_RETENTION_DAYS)
+            )
+            end_date = (
+                datetime.strptime(options['end_date'], '%Y-%m-%d').date() if options['end_date']
+                else today - timedelta(days=1)
+            )
+        except ValueError:
+            raise CommandError('Dates must be YYYY-MM-DD')
+
+        days = DeviceDailyConsumption.objects.filter(date__gte=start_date, date__lte=end_date)
+        if options['device_ids']:
+            days = days.filter(device_id__in=options['device_ids'])
+        if not options['force'] and not options['stale']:
+            days = days.filter(value_sketch__isnull=True)
+
+        built = skipped = 0
+        for row_id, device_id, date, count, data in days.order_by('device_id', 'date').values_list(
+            'id', 'device_id', 'date', 'measurement_count', 'value_sketch'
+        ).iterator():
+            if data is not None and not options['force'] and load_sketch(data).count == count:
+                continue
+            values = list(DeviceMeasurement.objects.filter(
+                device_id=device_id,
+                timestamp__gte=datetime.combine(date, time.min, tzinfo=timezone.utc),
+                timestamp__lt=datetime.combine(date + timedelta(days=1), time.min, tzinfo=timezone.utc)
+            ).values_list('measurement_value', flat=True))
+            if len(values) != count:
+                skipped += 1
+                continue
+
+            # Guarded write: skipped if ingest touched the day since it was read
+            target = DeviceDailyConsumption.objects.filter(id=row_id, measurement_count=count)
+            if not options['force']:
+                target = target.filter(value_sketch__isnull=True) if data is None else target.filter(value_sketch=data)
+            if target.update(value_sketch=add_to_sketch(None, values)):
+                built += 1
+            else:
+                skipped += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {built} daily sketches between {start_date} and {end_date}, "
+            f"skipped {skipped} days without complete raw data"
+        ))
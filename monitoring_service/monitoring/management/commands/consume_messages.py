@@ -1,7 +1,9 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
 import threading
 import logging
 from monitoring.consumers import DeviceDataConsumer, SyncConsumer
+from monitoring.workers import WorkerPool
 
 logger = logging.getLogger(__name__)
 
@@ -9,7 +11,30 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Start RabbitMQ message consumers'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=0,
+            help='Run N supervised ingest worker processes, each owning a subset of INGEST_QUEUES '
+                 '(default: single process with consumer threads)'
+        )
+
     def handle(self, *args, **options):
+        if options['workers'] > len(settings.INGEST_QUEUES):
+            # Each queue has exactly one consumer, so extra workers would sit idle
+            raise CommandError(
+                f"--workers {options['workers']} exceeds the {len(settings.INGEST_QUEUES)} INGEST_QUEUES "
+                f"({', '.join(settings.INGEST_QUEUES)}); set NUM_REPLICAS or INGEST_QUEUES to match"
+            )
+        if options['workers'] > 0:
+            self.stdout.write(self.style.SUCCESS(
+                f"Starting {options['workers']} ingest worker processes over {len(settings.INGEST_QUEUES)} queues..."
+            ))
+            WorkerPool(settings.INGEST_QUEUES, options['workers']).run()
+            self.stdout.write(self.style.WARNING('Worker pool stopped'))
+            return
+
         self.stdout.write(self.style.SUCCESS('Starting RabbitMQ consumers...'))
         
         # Start Device Data Consumer in a separate thread
@@ -0,0 +1,39 @@
+"""
+Django management command to start the asyncio ingest engine
+Usage: python manage.py consume_messages_async [--max-in-flight N] [--batch-size N] [--pool-size N]
+
+Alternative to consume_messages for device data; sync events are still
+handled by consume_messages' SyncConsumer.
+"""
+from django.core.management.base import BaseCommand
+import asyncio
+import logging
+from monitoring.async_ingest import AsyncIngestEngine
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Start the asyncio device data ingest consumer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-in-flight', type=int, help='Maximum unacked messages')
+        parser.add_argument('--batch-size', type=int, help='Measurements written per batch')
+        parser.add_argument('--flush-interval', type=float, help='Seconds before a partial batch is written')
+        parser.add_argument('--pool-size', type=int, help='PostgreSQL connections (concurrent batch writes)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Starting async ingest consumer...'))
+
+        engine = AsyncIngestEngine(
+            max_in_flight=options['max_in_flight'],
+            batch_size=options['batch_size'],
+            flush_interval=options['flush_interval'],
+            pool_size=options['pool_size']
+        )
+
+        try:
+            asyncio.run(engine.run())
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Async ingest error: {e}'))
+            raise
@@ -0,0 +1,61 @@
+"""
+Django management command to purge aged-out raw measurements
+Usage: python manage.py enforce_retention [--device-id UUID] [--dry-run] [--interval SECONDS]
+"""
+from django.core.management.base import BaseCommand, CommandError
+import time
+import logging
+import uuid
+from monitoring.retention import RawDataRetention
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Delete raw measurements past their retention window once hourly aggregates cover them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device-id', help='Only apply retention to this device')
+        parser.add_argument('--batch-size', type=int, help='Rows deleted per batch')
+        parser.add_argument('--batch-sleep', type=float, help='Seconds to pause between batches')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted')
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Run as a background worker, repeating every N seconds (default: run once)'
+        )
+
+    def handle(self, *args, **options):
+        if options['device_id']:
+            try:
+                uuid.UUID(options['device_id'])
+            except ValueError:
+                raise CommandError('--device-id must be a UUID')
+
+        retention = RawDataRetention(
+            batch_size=options['batch_size'],
+            batch_sleep=options['batch_sleep'],
+            dry_run=options['dry_run']
+        )
+
+        try:
+            while True:
+                summary = retention.run(device_id=options['device_id'])
+                verb = 'Would reclaim' if options['dry_run'] else 'Reclaimed'
+                self.stdout.write(self.style.SUCCESS(
+                    f"{verb} {summary['rows_deleted']} raw rows from {summary['devices_purged']}/"
+                    f"{summary['devices_checked']} devices in {summary['elapsed_seconds']}s "
+                    f"({summary['rows_per_second']} rows/s)"
+                ))
+                if summary['devices_incomplete']:
+                    self.stdout.write(self.style.WARNING(
+                        f"{summary['devices_incomplete']} devices have incomplete hourly aggregates "
+                        f"and were only partially purged"
+                    ))
+
+                if not options['interval']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Retention worker stopped'))
@@ -0,0 +1,110 @@
+"""
+Django management command to load test the monitoring read API
+Usage: python manage.py load_test [--url URL] [--endpoint daily|range|measurements] [--users N] [--duration S]
+
+Run it once per SERVER_MODE (dev, wsgi, asgi) against the same data to compare.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+import http.client
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
+from monitoring.models import Device
+
+
+class Command(BaseCommand):
+    help = 'Hammer a monitoring read endpoint with concurrent dashboard users and report latency percentiles and RPS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8003', help='Monitoring service base URL')
+        parser.add_argument('--endpoint', choices=['daily', 'range', 'measurements'], default='daily')
+        parser.add_argument('--device-id', type=str, help='Device to query (default: first synchronized device)')
+        parser.add_argument('--users', type=int, default=100, help='Concurrent users, one keep-alive connection each (default: 100)')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run (default: 30)')
+        parser.add_argument('--token', type=str, help='JWT to send (default: mint an admin token with JWT_SECRET_KEY)')
+
+    def handle(self, *args, **options):
+        device_id = options['device_id'] or Device.objects.values_list('id', flat=True).first()
+        if not device_id:
+            raise CommandError('No devices synchronized yet - pass --device-id')
+
+        token = options['token'] or self.mint_token()
+        path = self.build_path(options['endpoint'], device_id)
+        target = urlsplit(options['url'])
+
+        latencies = []
+        statuses = {}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['duration']
+
+        def user():
+            conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+            local_latencies = []
+            local_statuses = {}
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    conn.request('GET', path, headers={'Authorization': f'Bearer {token}'})
+                    response = conn.getresponse()
+                    response.read()
+                    status = response.status
+                except (OSError, http.client.HTTPException):
+                    status = 'error'
+                    conn.close()
+                    conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+                local_latencies.append((time.perf_counter() - started) * 1000)
+                local_statuses[status] = local_statuses.get(status, 0) + 1
+            conn.close()
+            with lock:
+                latencies.extend(local_latencies)
+                for status, count in local_statuses.items():
+                    statuses[status] = statuses.get(status, 0) + count
+
+        self.stdout.write(f"GET {options['url']}{path} with {options['users']} users for {options['duration']:g}s...")
+        started = time.perf_counter()
+        threads = [threading.Thread(target=user, daemon=True) for _ in range(options['users'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if not latencies:
+            raise CommandError('No requests completed')
+        latencies.sort()
+
+        def percentile(fraction):
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+        self.stdout.write(f"requests  {len(latencies)}")
+        self.stdout.write(f"statuses  {', '.join(f'{status}: {count}' for status, count in sorted(statuses.items(), key=str))}")
+        self.stdout.write(f"rps       {len(latencies) / elapsed:.1f}")
+        self.stdout.write(
+            f"latency   p50={percentile(0.5):.1f}ms p90={percentile(0.9):.1f}ms "
+            f"p99={percentile(0.99):.1f}ms max={latencies[-1]:.1f}ms"
+        )
+        ok = statuses.get(200, 0) + statuses.get(304, 0)
+        style = self.style.SUCCESS if ok == len(latencies) else self.style.WARNING
+        self.stdout.write(style(f"{ok}/{len(latencies)} successful"))
+
+    def mint_token(self):
+        token = AccessToken()
+        token['user_id'] = str(uuid.uuid4())
+        token['username'] = 'load-test'
+        token['role'] = 'admin'
+        return str(token)
+
+    def build_path(self, endpoint, device_id):
+        today = date.today()
+        if endpoint == 'daily':
+            return '/api/monitoring/hourly/daily/?' + urlencode({'device_id': device_id, 'date': today.isoformat()})
+        if endpoint == 'range':
+            return '/api/monitoring/hourly/range/?' + urlencode({
+                'device_id': device_id,
+                'start_date': (today - timedelta(days=6)).isoformat(),
+                'end_date': today.isoformat(),
+            })
+        return '/api/monitoring/measurements/?' + urlencode({'device_id': device_id, 'page_size': 100})
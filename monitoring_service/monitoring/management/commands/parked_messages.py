@@ -0,0 +1,113 @@
+"""
+Django management command to inspect and replay parked (poison) messages
+Usage:
+    python manage.py parked_messages                       # list parked messages
+    python manage.py parked_messages --replay [--limit N]  # move them back to their work queue
+    python manage.py parked_messages --purge               # drop them
+"""
+from django.core.management.base import BaseCommand
+from django.conf import settings
+import pika
+import logging
+from monitoring.consumers import SyncConsumer
+from monitoring.rabbitmq import (
+    get_rabbitmq_connection,
+    parked_queue_name,
+    ORIGIN_QUEUE_HEADER,
+    RETRY_COUNT_HEADER,
+    LAST_ERROR_HEADER,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Inspect, replay or purge messages parked after exhausting their retries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue',
+            action='append',
+            help='Work queue whose parking queue to use (repeatable, default: all ingest and sync queues)'
+        )
+        parser.add_argument('--limit', type=int, default=100, help='Maximum messages per queue (default: 100)')
+        parser.add_argument('--replay', action='store_true', help='Republish parked messages to their work queue')
+        parser.add_argument('--purge', action='store_true', help='Delete parked messages')
+
+    def handle(self, *args, **options):
+        queues = options['queue'] or settings.INGEST_QUEUES + [SyncConsumer.queue_name]
+
+        connection = get_rabbitmq_connection()
+        if not connection.channel:
+            self.stdout.write(self.style.ERROR('Could not connect to RabbitMQ'))
+            return
+        channel = connection.channel
+
+        try:
+            for queue_name in queues:
+                parked = parked_queue_name(queue_name)
+                channel.queue_declare(queue=parked, durable=True)
+
+                if options['purge']:
+                    result = channel.queue_purge(queue=parked)
+                    self.stdout.write(self.style.SUCCESS(
+                        f"{parked}: purged {result.method.message_count} messages"
+                    ))
+                    continue
+
+                if options['replay']:
+                    self.replay(channel, parked, options['limit'])
+                else:
+                    self.inspect(channel, parked, options['limit'])
+        finally:
+            connection.stop()
+
+    def inspect(self, channel, parked, limit):
+        """Print parked messages, leaving them in the queue"""
+        last_tag = None
+        count = 0
+        while count < limit:
+            method, properties, body = channel.basic_get(queue=parked, auto_ack=False)
+            if method is None:
+                break
+            last_tag = method.delivery_tag
+            count += 1
+
+            headers = properties.headers or {}
+            self.stdout.write(
+                f"[{count}] retries={headers.get(RETRY_COUNT_HEADER, 0)} "
+                f"error={headers.get(LAST_ERROR_HEADER, '')!r}\n    {body[:200]!r}"
+            )
+
+        if last_tag is not None:
+            # Put everything we peeked at back
+            channel.basic_nack(delivery_tag=last_tag, multiple=True, requeue=True)
+        self.stdout.write(self.style.SUCCESS(f"{parked}: {count} messages shown"))
+
+    def replay(self, channel, parked, limit):
+        """Move parked messages back to their origin queue with a fresh retry budget"""
+        count = 0
+        while count < limit:
+            method, properties, body = channel.basic_get(queue=parked, auto_ack=False)
+            if method is None:
+                break
+
+            headers = dict(properties.headers or {})
+            origin = headers.pop(ORIGIN_QUEUE_HEADER, None) or parked[:-len('.parked')]
+            headers.pop(RETRY_COUNT_HEADER, None)
+            headers.pop(LAST_ERROR_HEADER, None)
+
+            channel.basic_publish(
+                exchange='',
+                routing_key=origin,
+                body=body,
+                properties=pika.BasicProperties(
+                    delivery_mode=2,
+                    content_type=properties.content_type,
+                    headers=headers
+                )
+            )
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"{parked}: replayed {count} messages"))
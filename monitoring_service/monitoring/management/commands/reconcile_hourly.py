@@ -0,0 +1,68 @@
+"""
+Django management command to reconcile hourly aggregates with raw measurements
+Usage: python manage.py reconcile_hourly [--device-id UUID ...] [--start-date YYYY-MM-DD] [--end-date YYYY-MM-DD]
+       [--workers N] [--chunk-size N] [--dry-run]
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from datetime import datetime, time, timedelta, timezone
+from monitoring.reconcile import HourlyReconciler
+
+
+class Command(BaseCommand):
+    help = 'Compare hourly totals with raw measurement sums and repair mismatching hours in place'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device-id', action='append', dest='device_ids', help='Device to reconcile (repeatable, default: all)')
+        parser.add_argument('--start-date', help='First UTC day (YYYY-MM-DD, default: RAW_RETENTION_DAYS ago)')
+        parser.add_argument('--end-date', help='Last UTC day, inclusive (YYYY-MM-DD, default: today)')
+        parser.add_argument('--workers', type=int, help='Worker processes (default: RECONCILE_WORKERS)')
+        parser.add_argument('--chunk-size', type=int, help='Devices per chunk (default: RECONCILE_CHUNK_DEVICES)')
+        parser.add_argument('--tolerance', type=float, help='Relative total difference ignored (default: RECONCILE_TOLERANCE)')
+        parser.add_argument('--report', type=int, default=20, help='Mismatching hours to list (default: 20)')
+        parser.add_argument('--dry-run', action='store_true', help='Report mismatches without repairing them')
+
+    def handle(self, *args, **options):
+        today = datetime.now(timezone.utc).date()
+        try:
+            start_date = (
+                datetime.strptime(options['start_date'], '%Y-%m-%d').date() if options['start_date']
+                else today - timedelta(days=settings.RAW_RETENTION_DAYS)
+            )
+            end_date = datetime.strptime(options['end_date'], '%Y-%m-%d').date() if options['end_date'] else today
+        except ValueError:
+            raise CommandError('Dates must be YYYY-MM-DD')
+        if start_date > end_date:
+            raise CommandError('--start-date must not be after --end-date')
+
+        reconciler = HourlyReconciler(
+            repair=not options['dry_run'],
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            tolerance=options['tolerance'],
+            report_limit=options['report']
+        )
+        summary = reconciler.run(
+            datetime.combine(start_date, time.min, tzinfo=timezone.utc),
+            datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=timezone.utc),
+            options['device_ids']
+        )
+
+        for sample in summary['samples']:
+            self.stdout.write(
+                f"{sample['device_id']} {sample['bucket_start']} {sample['kind']:<7} "
+                f"hourly {sample['hourly_total']:.3f} kWh / {sample['hourly_count']} - "
+                f"raw {sample['raw_total']:.3f} kWh / {sample['raw_count']}"
+            )
+        if summary['mismatches'] > len(summary['samples']):
+            self.stdout.write(f"... and {summary['mismatches'] - len(summary['samples'])} more")
+
+        kinds = summary['kinds']
+        verb = 'Repaired' if summary['repaired'] else 'Found'
+        style = self.style.SUCCESS if not summary['mismatches'] or summary['repaired'] else self.style.WARNING
+        self.stdout.write(style(
+            f"{verb} {summary['mismatches']} mismatching hours "
+            f"({', '.join(f'{count} {kind}' for kind, count in kinds.items())}) "
+            f"across {summary['devices_checked']} devices in {summary['chunks']} chunks, "
+            f"{summary['start']} to {summary['end']}, {summary['elapsed_seconds']}s"
+        ))
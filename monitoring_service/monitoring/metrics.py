@@ -0,0 +1,115 @@
+"""
+Lightweight in-process ingest instrumentation.
+
+Per-stage latencies go into fixed-bucket histograms that are summarized in one
+log line every INGEST_METRICS_INTERVAL seconds, and per-message logging is
+replaced with a rate-limited sampler so logging never dominates the hot path.
+"""
+import bisect
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds in milliseconds (last bucket catches everything above)
+BUCKET_BOUNDS_MS = [
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+    1000, 2500, 5000, 10000, 30000, 60000, 300000, float('inf'),
+]
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; percentiles are bucket upper bounds"""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKET_BOUNDS_MS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_MS, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, bucket_count in zip(BUCKET_BOUNDS_MS, self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        mean = self.total / self.count if self.count else 0.0
+        return (
+            f"n={self.count} mean={mean:.2f} p50={self.percentile(0.5):g} "
+            f"p95={self.percentile(0.95):g} p99={self.percentile(0.99):g} max={self.max:.2f}"
+        )
+
+
+class StageMetrics:
+    """Histograms per named stage, reported and reset every interval"""
+
+    def __init__(self, name, stages, interval_seconds):
+        self.name = name
+        self.stages = stages
+        self.interval_seconds = interval_seconds
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.histograms = {stage: Histogram() for stage in self.stages}
+        self.window_started = time.monotonic()
+
+    def observe(self, stage, value_ms):
+        with self.lock:
+            self.histograms[stage].observe(value_ms)
+
+    def maybe_report(self):
+        """Log one summary line per stage if the reporting interval has elapsed"""
+        now = time.monotonic()
+        if now - self.window_started < self.interval_seconds:
+            return
+        with self.lock:
+            elapsed = now - self.window_started
+            histograms = self.histograms
+            self._reset()
+
+        processed = histograms[self.stages[-1]].count
+        logger.info(f"[{self.name}] {processed} messages in {elapsed:.0f}s ({processed / elapsed:.1f}/s), times in ms:")
+        for stage, histogram in histograms.items():
+            if histogram.count:
+                logger.info(f"[{self.name}]   {stage:<10} {histogram.summary()}")
+
+
+class LogSampler:
+    """Token bucket allowing at most `per_second` log lines per second"""
+
+    def __init__(self, per_second):
+        self.per_second = per_second
+        # Rates below one line per second still need room for a whole token
+        self.capacity = max(1.0, per_second)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Return the number of suppressed lines since the last allowed one, or None to skip"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_second)
+            self.updated = now
+            if self.tokens < 1:
+                self.suppressed += 1
+                return None
+            self.tokens -= 1
+            suppressed, self.suppressed = self.suppressed, 0
+            return suppressed
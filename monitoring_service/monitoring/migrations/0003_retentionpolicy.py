@@ -0,0 +1,27 @@
+# Migration to add per-device raw data retention policies
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0002_add_user_device_mapping'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetentionPolicy',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('device_id', models.UUIDField(unique=True)),
+                ('raw_retention_days', models.PositiveIntegerField(help_text='Days to keep raw measurements before they are purged (0 = keep forever)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'retention_policies',
+            },
+        ),
+    ]
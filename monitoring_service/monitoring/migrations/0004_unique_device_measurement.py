@@ -0,0 +1,59 @@
+# Migration to make (device_id, timestamp) unique on raw measurements
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0003_retentionpolicy'),
+    ]
+
+    operations = [
+        # Drop redelivered duplicates, keeping the first stored copy. Duplicates were
+        # also counted into their hourly rows, so the affected hours are recomputed
+        # from the remaining raw rows. Databases that applied this migration before
+        # the recompute was added should run `manage.py reconcile_hourly` once.
+        migrations.RunSQL(
+            sql="""
+                CREATE TEMPORARY TABLE dedup_affected_hours ON COMMIT DROP AS
+                SELECT DISTINCT dm.device_id,
+                       (dm.timestamp AT TIME ZONE 'UTC')::date AS date,
+                       EXTRACT(HOUR FROM dm.timestamp AT TIME ZONE 'UTC')::int AS hour
+                FROM device_measurements dm
+                JOIN device_measurements keep
+                  ON dm.device_id = keep.device_id
+                 AND dm.timestamp = keep.timestamp
+                 AND (dm.created_at, dm.id) > (keep.created_at, keep.id);
+
+                DELETE FROM device_measurements dm
+                USING device_measurements keep
+                WHERE dm.device_id = keep.device_id
+                  AND dm.timestamp = keep.timestamp
+                  AND (dm.created_at, dm.id) > (keep.created_at, keep.id);
+
+                UPDATE hourly_energy_consumption h
+                SET total_consumption = raw.total,
+                    measurement_count = raw.count,
+                    updated_at = now()
+                FROM (
+                    SELECT a.device_id, a.date, a.hour,
+                           SUM(dm.measurement_value) AS total, COUNT(*) AS count
+                    FROM dedup_affected_hours a
+                    JOIN device_measurements dm
+                      ON dm.device_id = a.device_id
+                     AND dm.timestamp >= (a.date + make_interval(hours => a.hour)) AT TIME ZONE 'UTC'
+                     AND dm.timestamp < (a.date + make_interval(hours => a.hour + 1)) AT TIME ZONE 'UTC'
+                    GROUP BY a.device_id, a.date, a.hour
+                ) raw
+                WHERE h.device_id = raw.device_id
+                  AND h.date = raw.date
+                  AND h.hour = raw.hour;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='devicemeasurement',
+            constraint=models.UniqueConstraint(fields=('device_id', 'timestamp'), name='unique_device_measurement'),
+        ),
+    ]
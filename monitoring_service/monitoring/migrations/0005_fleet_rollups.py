@@ -0,0 +1,66 @@
+# Migration to add daily device and fleet hourly rollups, backfilled from hourly data
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0004_unique_device_measurement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceDailyConsumption',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('device_id', models.UUIDField()),
+                ('date', models.DateField()),
+                ('total_consumption', models.FloatField(default=0.0, help_text='Total energy consumed in day (kWh)')),
+                ('measurement_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'device_daily_consumption',
+                'unique_together': {('device_id', 'date')},
+                'indexes': [models.Index(fields=['date', '-total_consumption'], name='daily_date_total_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='FleetHourlyConsumption',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('hour', models.IntegerField(help_text='Hour of day (0-23)')),
+                ('shard', models.IntegerField(default=0)),
+                ('total_consumption', models.FloatField(default=0.0)),
+                ('measurement_count', models.IntegerField(default=0)),
+                ('devices_over_limit', models.IntegerField(default=0, help_text='Devices whose hourly total exceeded max_consumption')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'fleet_hourly_consumption',
+                'unique_together': {('date', 'hour', 'shard')},
+            },
+        ),
+        # Backfill both rollups from existing hourly aggregates (into shard 0)
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO device_daily_consumption (id, device_id, date, total_consumption, measurement_count, updated_at)
+                SELECT gen_random_uuid(), device_id, date, SUM(total_consumption), SUM(measurement_count), now()
+                FROM hourly_energy_consumption
+                GROUP BY device_id, date;
+
+                INSERT INTO fleet_hourly_consumption
+                    (id, date, hour, shard, total_consumption, measurement_count, devices_over_limit, updated_at)
+                SELECT gen_random_uuid(), h.date, h.hour, 0, SUM(h.total_consumption), SUM(h.measurement_count),
+                       COUNT(*) FILTER (WHERE d.max_consumption > 0 AND h.total_consumption > d.max_consumption),
+                       now()
+                FROM hourly_energy_consumption h
+                LEFT JOIN devices d ON d.id = h.device_id
+                GROUP BY h.date, h.hour;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
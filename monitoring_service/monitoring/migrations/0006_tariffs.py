@@ -0,0 +1,53 @@
+# Migration to add time-of-use tariffs and per-device tariff assignment
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0005_fleet_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tariff',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('currency', models.CharField(default='EUR', max_length=3)),
+                ('base_rate', models.FloatField(help_text='Price per kWh when no rate rule matches')),
+                ('is_default', models.BooleanField(default=False, help_text='Used for devices without a tariff')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'tariffs',
+            },
+        ),
+        migrations.CreateModel(
+            name='TariffRate',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('start_month', models.PositiveSmallIntegerField(default=1, help_text='First month of the season (1-12)')),
+                ('end_month', models.PositiveSmallIntegerField(default=12, help_text='Last month of the season, inclusive (1-12)')),
+                ('days_of_week', models.CharField(default='0123456', help_text='Weekdays as digits, Monday=0', max_length=7)),
+                ('start_hour', models.PositiveSmallIntegerField(default=0, help_text='First hour (0-23)')),
+                ('end_hour', models.PositiveSmallIntegerField(default=24, help_text='Hour the rate stops, exclusive (1-24)')),
+                ('price_per_kwh', models.FloatField()),
+                ('priority', models.IntegerField(default=0)),
+                ('tariff', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rates', to='monitoring.tariff')),
+            ],
+            options={
+                'db_table': 'tariff_rates',
+                'ordering': ['priority'],
+            },
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='tariff',
+            field=models.ForeignKey(blank=True, help_text='Billing tariff (falls back to the default tariff)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='devices', to='monitoring.tariff'),
+        ),
+    ]
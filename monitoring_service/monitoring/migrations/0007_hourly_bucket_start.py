@@ -0,0 +1,35 @@
+# Migration to add a timestamptz bucket_start to hourly rows for single-column range scans
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0006_tariffs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hourlyenergyconsumption',
+            name='bucket_start',
+            field=models.DateTimeField(null=True, help_text='UTC start of the hour (date + hour)'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE hourly_energy_consumption
+                SET bucket_start = (date + make_interval(hours => hour)) AT TIME ZONE 'UTC'
+                WHERE bucket_start IS NULL
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='hourlyenergyconsumption',
+            name='bucket_start',
+            field=models.DateTimeField(help_text='UTC start of the hour (date + hour)'),
+        ),
+        migrations.AddIndex(
+            model_name='hourlyenergyconsumption',
+            index=models.Index(fields=['device_id', 'bucket_start'], name='hourly_device_bucket_idx'),
+        ),
+    ]
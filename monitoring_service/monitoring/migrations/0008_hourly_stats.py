@@ -0,0 +1,34 @@
+# Migration to add per-hour min/max/last measurement statistics to hourly rows
+# Existing rows stay NULL; reconcile_hourly fills them wherever raw data is still retained
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0007_hourly_bucket_start'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hourlyenergyconsumption',
+            name='min_value',
+            field=models.FloatField(blank=True, null=True, help_text='Smallest measurement in the hour (kWh)'),
+        ),
+        migrations.AddField(
+            model_name='hourlyenergyconsumption',
+            name='max_value',
+            field=models.FloatField(blank=True, null=True, help_text='Largest measurement in the hour (kWh)'),
+        ),
+        migrations.AddField(
+            model_name='hourlyenergyconsumption',
+            name='last_value',
+            field=models.FloatField(blank=True, null=True, help_text='Latest measurement in the hour (kWh)'),
+        ),
+        migrations.AddField(
+            model_name='hourlyenergyconsumption',
+            name='last_timestamp',
+            field=models.DateTimeField(blank=True, null=True, help_text='Timestamp of last_value'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Migration to add a mergeable quantile sketch of measurement values to daily rollups
+# Existing days stay NULL; build_daily_sketches fills them from retained raw data
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0008_hourly_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicedailyconsumption',
+            name='value_sketch',
+            field=models.BinaryField(blank=True, null=True, help_text="Serialized DDSketch of the day's measurement values"),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
 from django.db import models
 import uuid
 
@@ -22,6 +23,10 @@ class Device(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     max_consumption = models.FloatField()
+    tariff = models.ForeignKey(
+        'Tariff', null=True, blank=True, on_delete=models.SET_NULL, related_name='devices',
+        help_text="Billing tariff (falls back to the default tariff)"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -60,29 +65,169 @@ class DeviceMeasurement(models.Model):
         indexes = [
             models.Index(fields=['device_id', 'timestamp']),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['device_id', 'timestamp'], name='unique_device_measurement'),
+        ]
 
     def __str__(self):
         return f"Device {self.device_id} - {self.timestamp} - {self.measurement_value} kWh"
 
 
+def bucket_start_for(date, hour):
+    """UTC start of the hourly bucket for a (date, hour) pair"""
+    return datetime.combine(date, time(hour), tzinfo=dt_timezone.utc)
+
+
+class HourlyQuerySet(models.QuerySet):
+    """Time filters expressed as one bucket_start range so they use the (device_id, bucket_start) index"""
+
+    def between_days(self, start_date, end_date):
+        """Whole UTC days start_date..end_date inclusive"""
+        return self.filter(
+            bucket_start__gte=bucket_start_for(start_date, 0),
+            bucket_start__lt=bucket_start_for(end_date + timedelta(days=1), 0)
+        )
+
+    def last_hours(self, hours, now):
+        """Rolling window of the last `hours` buckets, including the current partial hour"""
+        current = now.replace(minute=0, second=0, microsecond=0)
+        return self.filter(bucket_start__gt=current - timedelta(hours=hours), bucket_start__lte=current)
+
+
 class HourlyEnergyConsumption(models.Model):
     """Aggregated hourly energy consumption"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     device_id = models.UUIDField(db_index=True)
     date = models.DateField(db_index=True)
     hour = models.IntegerField(help_text="Hour of day (0-23)")
+    bucket_start = models.DateTimeField(help_text="UTC start of the hour (date + hour)")
     total_consumption = models.FloatField(help_text="Total energy consumed in hour (kWh)")
     measurement_count = models.IntegerField(default=0, help_text="Number of measurements aggregated")
+    min_value = models.FloatField(null=True, blank=True, help_text="Smallest measurement in the hour (kWh)")
+    max_value = models.FloatField(null=True, blank=True, help_text="Largest measurement in the hour (kWh)")
+    last_value = models.FloatField(null=True, blank=True, help_text="Latest measurement in the hour (kWh)")
+    last_timestamp = models.DateTimeField(null=True, blank=True, help_text="Timestamp of last_value")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = HourlyQuerySet.as_manager()
+
     class Meta:
         db_table = 'hourly_energy_consumption'
         ordering = ['-date', '-hour']
         unique_together = ['device_id', 'date', 'hour']
         indexes = [
             models.Index(fields=['device_id', 'date', 'hour']),
+            # Day ranges and rolling windows are one ordered scan of this index
+            models.Index(fields=['device_id', 'bucket_start'], name='hourly_device_bucket_idx'),
         ]
 
+    @property
+    def avg_value(self):
+        """Mean measurement in the hour, None for an empty row"""
+        return self.total_consumption / self.measurement_count if self.measurement_count else None
+
     def __str__(self):
         return f"Device {self.device_id} - {self.date} {self.hour}:00 - {self.total_consumption} kWh"
+
+
+class RetentionPolicy(models.Model):
+    """Per-device retention window for raw measurements"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    device_id = models.UUIDField(unique=True)
+    raw_retention_days = models.PositiveIntegerField(
+        help_text="Days to keep raw measurements before they are purged (0 = keep forever)"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'retention_policies'
+
+    def __str__(self):
+        return f"Device {self.device_id} - keep raw data {self.raw_retention_days} days"
+
+
+class DeviceDailyConsumption(models.Model):
+    """Per-device daily rollup, maintained incrementally by ingest"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    device_id = models.UUIDField()
+    date = models.DateField()
+    total_consumption = models.FloatField(default=0.0, help_text="Total energy consumed in day (kWh)")
+    measurement_count = models.IntegerField(default=0)
+    value_sketch = models.BinaryField(null=True, blank=True, help_text="Serialized DDSketch of the day's measurement values")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'device_daily_consumption'
+        unique_together = ['device_id', 'date']
+        indexes = [
+            # Top-N consumers for a day is an ordered scan of this index
+            models.Index(fields=['date', '-total_consumption'], name='daily_date_total_idx'),
+        ]
+
+    def __str__(self):
+        return f"Device {self.device_id} - {self.date} - {self.total_consumption} kWh"
+
+
+class FleetHourlyConsumption(models.Model):
+    """
+    Fleet-wide hourly totals, maintained incrementally by ingest.
+    Split into a few shards (by device hash) so concurrent ingest workers
+    do not all contend on one row; readers sum the shards.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    date = models.DateField()
+    hour = models.IntegerField(help_text="Hour of day (0-23)")
+    shard = models.IntegerField(default=0)
+    total_consumption = models.FloatField(default=0.0)
+    measurement_count = models.IntegerField(default=0)
+    devices_over_limit = models.IntegerField(default=0, help_text="Devices whose hourly total exceeded max_consumption")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'fleet_hourly_consumption'
+        unique_together = ['date', 'hour', 'shard']
+
+    def __str__(self):
+        return f"Fleet {self.date} {self.hour}:00 (shard {self.shard}) - {self.total_consumption} kWh"
+
+
+class Tariff(models.Model):
+    """Time-of-use tariff: base_rate applies wherever no TariffRate matches"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=100, unique=True)
+    currency = models.CharField(max_length=3, default='EUR')
+    base_rate = models.FloatField(help_text="Price per kWh when no rate rule matches")
+    is_default = models.BooleanField(default=False, help_text="Used for devices without a tariff")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'tariffs'
+
+    def __str__(self):
+        return f"{self.name} ({self.currency})"
+
+
+class TariffRate(models.Model):
+    """
+    Price for a season (month span), set of weekdays and hour span.
+    Spans may wrap (e.g. months 11-2, hours 22-6); higher priority wins on overlap.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tariff = models.ForeignKey(Tariff, on_delete=models.CASCADE, related_name='rates')
+    start_month = models.PositiveSmallIntegerField(default=1, help_text="First month of the season (1-12)")
+    end_month = models.PositiveSmallIntegerField(default=12, help_text="Last month of the season, inclusive (1-12)")
+    days_of_week = models.CharField(max_length=7, default='0123456', help_text="Weekdays as digits, Monday=0")
+    start_hour = models.PositiveSmallIntegerField(default=0, help_text="First hour (0-23)")
+    end_hour = models.PositiveSmallIntegerField(default=24, help_text="Hour the rate stops, exclusive (1-24)")
+    price_per_kwh = models.FloatField()
+    priority = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'tariff_rates'
+        ordering = ['priority']
+
+    def __str__(self):
+        return f"{self.tariff.name}: months {self.start_month}-{self.end_month}, hours {self.start_hour}-{self.end_hour} = {self.price_per_kwh}"
@@ -0,0 +1,111 @@
+"""
+Keyset (cursor) pagination for high-volume time series tables
+"""
+import base64
+import uuid
+from datetime import datetime
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class TimestampKeysetPagination(BasePagination):
+    """
+    Pages newest-first on (timestamp, id).
+
+    The cursor encodes the last row of the previous page, so each page is one
+    index range scan no matter how deep the client pages - unlike OFFSET,
+    which re-reads every skipped row.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def encode_cursor(self, row):
+        raw = f"{row.timestamp.isoformat()}|{row.id}"
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+            timestamp_str, row_id = raw.split('|', 1)
+            return datetime.fromisoformat(timestamp_str), uuid.UUID(row_id)
+        except (ValueError, UnicodeError):
+            raise NotFound('Invalid cursor')
+
+    def get_page_size(self, params):
+        try:
+            page_size = int(params.get(self.page_size_query_param, settings.MEASUREMENTS_PAGE_SIZE))
+        except ValueError:
+            page_size = settings.MEASUREMENTS_PAGE_SIZE
+        return max(1, min(page_size, settings.MEASUREMENTS_MAX_PAGE_SIZE))
+
+    def page_queryset(self, queryset, params):
+        """Apply the cursor and limit; the page holds one extra row to detect a next page"""
+        page_size = self.get_page_size(params)
+
+        cursor = params.get(self.cursor_query_param)
+        if cursor:
+            timestamp, row_id = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=row_id)
+            )
+        return queryset.order_by('-timestamp', '-id')[:page_size + 1], page_size
+
+    def finish_page(self, rows, page_size):
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_cursor = self.encode_cursor(rows[-1]) if self.has_next else None
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        queryset, page_size = self.page_queryset(queryset, request.query_params)
+        return self.finish_page(list(queryset), page_size)
+
+    async def apaginate_queryset(self, queryset, request):
+        """paginate_queryset for async views on a plain Django request"""
+        self.request = request
+        queryset, page_size = self.page_queryset(queryset, request.GET)
+        return self.finish_page([row async for row in queryset], page_size)
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Cursor from the previous page\'s "next" link',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Rows per page (max {settings.MEASUREMENTS_MAX_PAGE_SIZE})',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
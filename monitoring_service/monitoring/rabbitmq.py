@@ -5,6 +5,84 @@ from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+# Headers carried by messages moving through the retry topology
+RETRY_COUNT_HEADER = 'x-retry-count'
+ORIGIN_QUEUE_HEADER = 'x-origin-queue'
+LAST_ERROR_HEADER = 'x-last-error'
+
+
+def retry_queue_name(queue_name, attempt):
+    """Delay queue for the given retry attempt (0-based)"""
+    return f"{queue_name}.retry.{attempt}"
+
+
+def parked_queue_name(queue_name):
+    """Final parking queue for messages that exhausted their retries"""
+    return f"{queue_name}.parked"
+
+
+def retry_delay_ms(attempt):
+    """Exponential backoff: base, 2x base, 4x base, ..."""
+    return settings.RETRY_BASE_DELAY_MS * (2 ** attempt)
+
+
+def retry_topology(queue_name):
+    """(name, arguments) for each delay queue of a work queue, then its parking queue"""
+    for attempt in range(settings.MAX_RETRIES):
+        yield retry_queue_name(queue_name, attempt), {
+            'x-message-ttl': retry_delay_ms(attempt),
+            'x-dead-letter-exchange': '',
+            'x-dead-letter-routing-key': queue_name,
+        }
+    yield parked_queue_name(queue_name), None
+
+
+def retry_target(headers, error, queue_name, permanent=False):
+    """
+    Work out where a failed message goes next.
+
+    Returns the queue to republish to and the headers to carry: the delay queue
+    for the message's current attempt, or the parking queue for permanent
+    failures and messages past MAX_RETRIES.
+    """
+    headers = dict(headers or {})
+    origin = headers.get(ORIGIN_QUEUE_HEADER) or queue_name
+    attempt = int(headers.get(RETRY_COUNT_HEADER, 0))
+
+    headers[ORIGIN_QUEUE_HEADER] = origin
+    headers[LAST_ERROR_HEADER] = str(error)[:500]
+
+    if permanent or attempt >= settings.MAX_RETRIES:
+        logger.error(f"Parking message from {origin} after {attempt} retries: {error}")
+        return parked_queue_name(origin), headers
+
+    headers[RETRY_COUNT_HEADER] = attempt + 1
+    logger.warning(f"Retrying message from {origin} in {retry_delay_ms(attempt)} ms (attempt {attempt + 1}): {error}")
+    return retry_queue_name(origin, attempt), headers
+
+
+def retry_or_park(ch, method, properties, body, error, queue_name=None, permanent=False):
+    """
+    Move a failed message out of the work queue instead of requeueing it.
+
+    The message is republished to the delay queue for its current attempt; when
+    that queue's TTL expires RabbitMQ dead-letters it back onto the work queue.
+    Permanent failures (malformed payloads) and messages past MAX_RETRIES go
+    straight to the parking queue. The original delivery is then acked.
+    """
+    target, headers = retry_target(properties.headers, error, queue_name or method.routing_key, permanent)
+    ch.basic_publish(
+        exchange='',
+        routing_key=target,
+        body=body,
+        properties=pika.BasicProperties(
+            delivery_mode=2,
+            content_type=properties.content_type,
+            headers=headers
+        )
+    )
+    ch.basic_ack(delivery_tag=method.delivery_tag)
+
 
 class RabbitMQConnection:
     """RabbitMQ connection manager"""
@@ -41,6 +119,13 @@ class RabbitMQConnection:
             self.channel.queue_declare(queue=queue_name, durable=durable)
             logger.info(f"Queue '{queue_name}' declared")
     
+    def declare_retry_topology(self, queue_name):
+        """Declare the delay queues and parking queue for a work queue"""
+        if not self.channel:
+            return
+        for name, arguments in retry_topology(queue_name):
+            self.channel.queue_declare(queue=name, durable=True, arguments=arguments)
+    
     def publish_message(self, queue_name, message):
         """Publish a message to a queue"""
         try:
@@ -62,20 +147,23 @@ class RabbitMQConnection:
             return False
     
     def consume_messages(self, queue_name, callback):
-        """Consume messages from a queue"""
+        """Consume messages from a queue (or a list of queues)"""
         try:
             if not self.channel:
                 self.connect()
             
-            self.declare_queue(queue_name)
+            queue_names = [queue_name] if isinstance(queue_name, str) else list(queue_name)
             self.channel.basic_qos(prefetch_count=1)
-            self.channel.basic_consume(
-                queue=queue_name,
-                on_message_callback=callback,
-                auto_ack=False
-            )
+            for name in queue_names:
+                self.declare_queue(name)
+                self.declare_retry_topology(name)
+                self.channel.basic_consume(
+                    queue=name,
+                    on_message_callback=callback,
+                    auto_ack=False
+                )
             
-            logger.info(f"Started consuming from {queue_name}")
+            logger.info(f"Started consuming from {', '.join(queue_names)}")
             self.channel.start_consuming()
         except KeyboardInterrupt:
             logger.info("Stopping consumer...")
@@ -84,6 +172,14 @@ class RabbitMQConnection:
             logger.error(f"Error consuming messages: {e}")
             raise
     
+    def request_stop(self):
+        """
+        Ask start_consuming() to return after the in-flight message is acked.
+        Safe to call from a signal handler or another thread.
+        """
+        if self.connection and self.connection.is_open:
+            self.connection.add_callback_threadsafe(self.channel.stop_consuming)
+    
     def stop(self):
         """Close connection"""
         try:
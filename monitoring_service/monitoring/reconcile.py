@@ -0,0 +1,334 @@
+"""
+Set-wise reconciliation of hourly aggregates against raw measurements.
+
+For a chunk of devices and a time range, one SQL statement sums the raw rows
+per (device, hour) and full-outer-joins them with the hourly rows, so drift
+from redeliveries or lost read-modify-write updates shows up as a list of
+mismatching hours without moving the raw data into Python. Repairs rewrite
+those hourly rows in place (update, insert missing, delete orphans) with a few
+array statements, and push the same deltas into the daily and fleet rollups.
+Hours whose totals agree but whose min/max/last statistics do not (including
+rows written before those columns existed) are refreshed the same way.
+Device chunks are independent, so they are spread over worker processes.
+"""
+import logging
+import multiprocessing
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from functools import partial
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from .caching import invalidate_analytics, invalidate_daily_many
+from .models import DeviceDailyConsumption, DeviceMeasurement, FleetHourlyConsumption, HourlyEnergyConsumption
+from .rollups import fleet_shard, increment
+
+logger = logging.getLogger(__name__)
+
+RAW_TABLE = DeviceMeasurement._meta.db_table
+HOURLY_TABLE = HourlyEnergyConsumption._meta.db_table
+
+# Hours before a device's oldest raw reading have been purged by retention and
+# cannot be checked; that oldest hour itself may be partially purged, so it is
+# skipped too whenever aggregates exist before it.
+DIFF_SQL = f"""
+    WITH floors AS (
+        SELECT d.device_id,
+            CASE WHEN EXISTS (
+                SELECT 1 FROM {HOURLY_TABLE} h
+                WHERE h.device_id = d.device_id AND h.bucket_start < date_trunc('hour', m.oldest)
+            ) THEN date_trunc('hour', m.oldest) + interval '1 hour'
+            ELSE date_trunc('hour', m.oldest) END AS compare_from
+        FROM unnest(%(device_ids)s::uuid[]) AS d(device_id)
+        CROSS JOIN LATERAL (
+            SELECT MIN(timestamp) AS oldest FROM {RAW_TABLE} WHERE device_id = d.device_id
+        ) m
+    ),
+    raw AS (
+        SELECT device_id, date_trunc('hour', timestamp) AS bucket_start,
+            SUM(measurement_value) AS total, COUNT(*) AS count,
+            MIN(measurement_value) AS min_value, MAX(measurement_value) AS max_value,
+            (array_agg(measurement_value ORDER BY timestamp DESC))[1] AS last_value,
+            MAX(timestamp) AS last_timestamp
+        FROM {RAW_TABLE}
+        WHERE device_id = ANY(%(device_ids)s::uuid[]) AND timestamp >= %(start)s AND timestamp < %(end)s
+        GROUP BY 1, 2
+    ),
+    hourly AS (
+        SELECT id, device_id, bucket_start, total_consumption, measurement_count,
+            min_value, max_value, last_timestamp
+        FROM {HOURLY_TABLE}
+        WHERE device_id = ANY(%(device_ids)s::uuid[]) AND bucket_start >= %(start)s AND bucket_start < %(end)s
+    ),
+    diffs AS (
+        SELECT COALESCE(r.device_id, h.device_id) AS device_id,
+            COALESCE(r.bucket_start, h.bucket_start) AS bucket_start,
+            h.id AS hourly_id,
+            COALESCE(h.total_consumption, 0) AS hourly_total,
+            COALESCE(h.measurement_count, 0) AS hourly_count,
+            COALESCE(r.total, 0) AS raw_total,
+            COALESCE(r.count, 0) AS raw_count,
+            r.min_value AS raw_min, r.max_value AS raw_max, r.last_value AS raw_last, r.last_timestamp AS raw_last_timestamp,
+            h.min_value IS DISTINCT FROM r.min_value
+                OR h.max_value IS DISTINCT FROM r.max_value
+                OR h.last_timestamp IS DISTINCT FROM r.last_timestamp AS stats_differ
+        FROM raw r
+        FULL OUTER JOIN hourly h ON h.device_id = r.device_id AND h.bucket_start = r.bucket_start
+    ),
+    classified AS (
+        SELECT d.*,
+            CASE
+                WHEN d.hourly_id IS NULL THEN 'missing'
+                WHEN d.raw_count = 0 THEN 'orphan'
+                WHEN d.hourly_count <> d.raw_count
+                    OR abs(d.hourly_total - d.raw_total) > %(tolerance)s * greatest(1.0, abs(d.raw_total)) THEN 'drift'
+                WHEN d.stats_differ THEN 'stats'
+            END AS kind
+        FROM diffs d
+        JOIN floors f ON f.device_id = d.device_id
+        WHERE d.bucket_start >= f.compare_from
+    )
+    SELECT device_id, bucket_start, hourly_id, hourly_total, hourly_count, raw_total, raw_count,
+        raw_min, raw_max, raw_last, raw_last_timestamp, kind
+    FROM classified
+    WHERE kind IS NOT NULL
+    ORDER BY device_id, bucket_start
+"""
+
+KINDS = ('drift', 'missing', 'orphan', 'stats')
+
+Mismatch = namedtuple('Mismatch', [
+    'device_id', 'bucket_start', 'hourly_id', 'hourly_total', 'hourly_count', 'raw_total', 'raw_count',
+    'raw_min', 'raw_max', 'raw_last', 'raw_last_timestamp', 'kind',
+])
+
+LOCK_HOURLY_SQL = f"""
+    SELECT id FROM {HOURLY_TABLE}
+    WHERE device_id = ANY(%(device_ids)s::uuid[]) AND bucket_start >= %(start)s AND bucket_start < %(end)s
+    ORDER BY id
+    FOR UPDATE
+"""
+
+UPDATE_HOURLY_SQL = f"""
+    UPDATE {HOURLY_TABLE} AS h
+    SET total_consumption = v.total, measurement_count = v.count,
+        min_value = v.min_value, max_value = v.max_value, last_value = v.last_value,
+        last_timestamp = v.last_timestamp, updated_at = now()
+    FROM unnest(
+        %s::uuid[], %s::float8[], %s::int[], %s::float8[], %s::float8[], %s::float8[], %s::timestamptz[]
+    ) AS v(id, total, count, min_value, max_value, last_value, last_timestamp)
+    WHERE h.id = v.id
+"""
+
+INSERT_HOURLY_SQL = f"""
+    INSERT INTO {HOURLY_TABLE}
+        (id, device_id, date, hour, bucket_start, total_consumption, measurement_count,
+         min_value, max_value, last_value, last_timestamp, created_at, updated_at)
+    SELECT gen_random_uuid(), v.device_id, (v.bucket_start AT TIME ZONE 'UTC')::date,
+        extract(hour FROM v.bucket_start AT TIME ZONE 'UTC')::int, v.bucket_start, v.total, v.count,
+        v.min_value, v.max_value, v.last_value, v.last_timestamp, now(), now()
+    FROM unnest(
+        %s::uuid[], %s::timestamptz[], %s::float8[], %s::int[], %s::float8[], %s::float8[], %s::float8[], %s::timestamptz[]
+    ) AS v(device_id, bucket_start, total, count, min_value, max_value, last_value, last_timestamp)
+    ON CONFLICT (device_id, date, hour) DO NOTHING
+    RETURNING device_id, bucket_start
+"""
+
+DELETE_HOURLY_SQL = f"""
+    DELETE FROM {HOURLY_TABLE} WHERE id = ANY(%s::uuid[])
+"""
+
+
+def _reconcile_chunk(device_ids, start, end, repair, tolerance, report_limit):
+    """Worker-process entry point: reconcile one device chunk on the process's own connection"""
+    try:
+        return HourlyReconciler(repair=repair, tolerance=tolerance, report_limit=report_limit).reconcile_chunk(
+            device_ids, start, end
+        )
+    finally:
+        connections.close_all()
+
+
+class HourlyReconciler:
+    """Compares hourly aggregates with raw measurements and optionally repairs them"""
+
+    def __init__(self, repair=True, workers=None, chunk_size=None, tolerance=None, report_limit=20):
+        self.repair = repair
+        self.workers = workers or settings.RECONCILE_WORKERS
+        self.chunk_size = chunk_size or settings.RECONCILE_CHUNK_DEVICES
+        self.tolerance = settings.RECONCILE_TOLERANCE if tolerance is None else tolerance
+        self.report_limit = report_limit
+
+    def settled_end(self, end):
+        """Clip the range to hours that ended RECONCILE_SETTLE_MINUTES ago - newer ones are still being ingested"""
+        settled = timezone.now() - timedelta(minutes=settings.RECONCILE_SETTLE_MINUTES)
+        return min(end, settled.replace(minute=0, second=0, microsecond=0))
+
+    def get_devices(self, start, end):
+        """Every device with raw or hourly data in the range"""
+        raw = (
+            DeviceMeasurement.objects.filter(timestamp__gte=start, timestamp__lt=end)
+            .order_by().values_list('device_id', flat=True).distinct()
+        )
+        hourly = (
+            HourlyEnergyConsumption.objects.filter(bucket_start__gte=start, bucket_start__lt=end)
+            .order_by().values_list('device_id', flat=True).distinct()
+        )
+        return sorted({str(device_id) for device_id in raw} | {str(device_id) for device_id in hourly})
+
+    def find_mismatches(self, device_ids, start, end):
+        params = {'device_ids': device_ids, 'start': start, 'end': end, 'tolerance': self.tolerance}
+        with connection.cursor() as cursor:
+            cursor.execute(DIFF_SQL, params)
+            return [Mismatch(*row) for row in cursor.fetchall()]
+
+    def apply_repairs(self, mismatches):
+        """Rewrite mismatching hourly rows from the raw sums and move the rollups by the same deltas"""
+        updates = [row for row in mismatches if row.kind in ('drift', 'stats')]
+        inserts = [row for row in mismatches if row.kind == 'missing']
+        deletes = [row for row in mismatches if row.kind == 'orphan']
+
+        skipped = set()
+        with connection.cursor() as cursor:
+            if updates:
+                cursor.execute(UPDATE_HOURLY_SQL, [
+                    [row.hourly_id for row in updates],
+                    [row.raw_total for row in updates],
+                    [row.raw_count for row in updates],
+                    [row.raw_min for row in updates],
+                    [row.raw_max for row in updates],
+                    [row.raw_last for row in updates],
+                    [row.raw_last_timestamp for row in updates],
+                ])
+            if inserts:
+                cursor.execute(INSERT_HOURLY_SQL, [
+                    [row.device_id for row in inserts],
+                    [row.bucket_start for row in inserts],
+                    [row.raw_total for row in inserts],
+                    [row.raw_count for row in inserts],
+                    [row.raw_min for row in inserts],
+                    [row.raw_max for row in inserts],
+                    [row.raw_last for row in inserts],
+                    [row.raw_last_timestamp for row in inserts],
+                ])
+                # Ingest created the row meanwhile - left for the next run, its rollups untouched
+                inserted = {(str(device_id), bucket_start) for device_id, bucket_start in cursor.fetchall()}
+                skipped = {(str(row.device_id), row.bucket_start) for row in inserts} - inserted
+            if deletes:
+                cursor.execute(DELETE_HOURLY_SQL, [[row.hourly_id for row in deletes]])
+
+        # Rollups were fed the same (wrong) increments as the hourly rows, so the same correction applies
+        # (bucket_start comes back in UTC, the connection time zone)
+        for row in mismatches:
+            if row.kind == 'stats' or (str(row.device_id), row.bucket_start) in skipped:
+                continue
+            date = row.bucket_start.date()
+            deltas = {
+                'total_consumption': row.raw_total - row.hourly_total,
+                'measurement_count': row.raw_count - row.hourly_count,
+            }
+            increment(DeviceDailyConsumption, {'device_id': row.device_id, 'date': date}, deltas)
+            increment(
+                FleetHourlyConsumption,
+                {'date': date, 'hour': row.bucket_start.hour, 'shard': fleet_shard(row.device_id)},
+                deltas
+            )
+
+    def reconcile_chunk(self, device_ids, start, end):
+        """Compare (and repair) one device chunk in a single transaction, returns a chunk summary"""
+        started = time.monotonic()
+        params = {'device_ids': device_ids, 'start': start, 'end': end}
+
+        with transaction.atomic():
+            if self.repair:
+                # Late-arriving ingest for these hours waits until the repair commits
+                with connection.cursor() as cursor:
+                    cursor.execute(LOCK_HOURLY_SQL, params)
+            mismatches = self.find_mismatches(device_ids, start, end)
+            if self.repair and mismatches:
+                self.apply_repairs(mismatches)
+                touched = {(str(row.device_id), row.bucket_start.date()) for row in mismatches}
+                devices = sorted({device_id for device_id, _ in touched})
+                transaction.on_commit(lambda: invalidate_daily_many(touched))
+                transaction.on_commit(lambda: invalidate_analytics(devices))
+
+        kinds = dict.fromkeys(KINDS, 0)
+        samples = []
+        for row in mismatches:
+            kinds[row.kind] += 1
+            if len(samples) < self.report_limit:
+                samples.append({
+                    'device_id': str(row.device_id),
+                    'bucket_start': row.bucket_start.isoformat(),
+                    'kind': row.kind,
+                    'hourly_total': row.hourly_total,
+                    'raw_total': row.raw_total,
+                    'hourly_count': row.hourly_count,
+                    'raw_count': row.raw_count,
+                })
+
+        if mismatches:
+            verb = 'repaired' if self.repair else 'found'
+            logger.warning(
+                f"Reconcile {len(device_ids)} devices: {verb} {len(mismatches)} mismatching hours "
+                f"({', '.join(f'{count} {kind}' for kind, count in kinds.items())})"
+            )
+        return {
+            'devices': len(device_ids),
+            'mismatches': len(mismatches),
+            'kinds': kinds,
+            'samples': samples,
+            'elapsed_seconds': time.monotonic() - started,
+        }
+
+    def run(self, start, end, device_ids=None):
+        """Reconcile [start, end) for the given devices (default: all with data), returns a summary dict"""
+        started = time.monotonic()
+        end = self.settled_end(end)
+        summary = {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'devices_checked': 0,
+            'chunks': 0,
+            'mismatches': 0,
+            'kinds': dict.fromkeys(KINDS, 0),
+            'samples': [],
+            'repaired': self.repair,
+        }
+        if start >= end:
+            summary['elapsed_seconds'] = 0.0
+            return summary
+
+        device_ids = sorted({str(device_id) for device_id in device_ids}) if device_ids else self.get_devices(start, end)
+        chunks = [device_ids[i:i + self.chunk_size] for i in range(0, len(device_ids), self.chunk_size)]
+
+        if self.workers > 1 and len(chunks) > 1:
+            # Forked workers must not share the parent's open connection; each opens its own
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=min(self.workers, len(chunks)),
+                mp_context=multiprocessing.get_context('fork')
+            ) as pool:
+                results = list(pool.map(partial(
+                    _reconcile_chunk,
+                    start=start,
+                    end=end,
+                    repair=self.repair,
+                    tolerance=self.tolerance,
+                    report_limit=self.report_limit
+                ), chunks))
+        else:
+            results = [self.reconcile_chunk(chunk, start, end) for chunk in chunks]
+
+        for result in results:
+            summary['devices_checked'] += result['devices']
+            summary['chunks'] += 1
+            summary['mismatches'] += result['mismatches']
+            for kind, count in result['kinds'].items():
+                summary['kinds'][kind] += count
+            summary['samples'].extend(result['samples'][:self.report_limit - len(summary['samples'])])
+
+        summary['elapsed_seconds'] = round(time.monotonic() - started, 3)
+        return summary
@@ -0,0 +1,38 @@
+"""
+Fast JSON rendering for monitoring API responses
+"""
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer backed by orjson.
+
+    orjson serializes dicts, lists, UUIDs, dates and datetimes natively in C,
+    so read paths can hand it raw values_list() data without a serializer.
+    Anything else (lazy strings, Decimals) falls back to DRF's encoder.
+    """
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Accepts text/event-stream in content negotiation for SSE endpoints.
+
+    The stream itself is a StreamingHttpResponse; this only renders error
+    responses (403, 503, ...) as a single SSE 'error' event.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return b'event: error\ndata: ' + orjson.dumps(data, default=str) + b'\n\n'
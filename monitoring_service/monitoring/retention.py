@@ -0,0 +1,139 @@
+import logging
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from .models import DeviceMeasurement, HourlyEnergyConsumption, RetentionPolicy
+
+logger = logging.getLogger(__name__)
+
+
+class RawDataRetention:
+    """Purges aged-out raw measurements once their hourly aggregates are complete"""
+
+    def __init__(self, batch_size=None, batch_sleep=None, dry_run=False):
+        self.batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+        self.batch_sleep = settings.RETENTION_BATCH_SLEEP if batch_sleep is None else batch_sleep
+        self.dry_run = dry_run
+
+    def get_policies(self):
+        """Map device_id -> retention days for devices with an explicit policy"""
+        return dict(RetentionPolicy.objects.values_list('device_id', 'raw_retention_days'))
+
+    def get_candidate_devices(self, policies, device_id=None):
+        """Devices that may have raw rows older than their retention window"""
+        if device_id:
+            # Policies are keyed by UUID; a raw string would never match and fall back to the default
+            return [uuid.UUID(str(device_id))]
+
+        windows = [days for days in policies.values() if days > 0]
+        windows.append(settings.RAW_RETENTION_DAYS)
+        earliest_cutoff = timezone.now() - timedelta(days=min(windows))
+
+        return list(
+            DeviceMeasurement.objects.filter(timestamp__lt=earliest_cutoff)
+            .order_by()
+            .values_list('device_id', flat=True)
+            .distinct()
+        )
+
+    def find_safe_horizon(self, device_id, cutoff):
+        """
+        Return the timestamp before which raw rows are fully aggregated.
+
+        Walks the aged-out hours in order and stops at the first hour whose
+        hourly row is missing or accounts for fewer measurements than remain raw,
+        so nothing is deleted that the aggregates do not already cover.
+        """
+        raw_hours = (
+            DeviceMeasurement.objects.filter(device_id=device_id, timestamp__lt=cutoff)
+            .annotate(bucket=TruncHour('timestamp'))
+            .order_by('bucket')
+            .values('bucket')
+            .annotate(count=Count('id'))
+        )
+
+        hourly_counts = dict(
+            HourlyEnergyConsumption.objects.filter(
+                device_id=device_id,
+                bucket_start__lt=cutoff
+            ).values_list('bucket_start', 'measurement_count')
+        )
+
+        for row in raw_hours:
+            bucket = row['bucket']
+            aggregated = hourly_counts.get(bucket, 0)
+            if aggregated < row['count']:
+                logger.warning(
+                    f"Device {device_id}: hour {bucket} has {row['count']} raw rows but only "
+                    f"{aggregated} aggregated - keeping raw data from this hour on"
+                )
+                return bucket
+
+        return cutoff
+
+    def purge_device(self, device_id, horizon):
+        """Delete raw rows older than horizon in small batches, returns rows deleted"""
+        queryset = DeviceMeasurement.objects.filter(
+            device_id=device_id,
+            timestamp__lt=horizon
+        ).order_by('timestamp')
+
+        if self.dry_run:
+            return queryset.count()
+
+        deleted = 0
+        while True:
+            # Each batch is its own short autocommit transaction on the
+            # (device_id, timestamp) index, so ingestion is never blocked for long
+            batch_ids = list(queryset.values_list('id', flat=True)[:self.batch_size])
+            if not batch_ids:
+                break
+
+            count, _ = DeviceMeasurement.objects.filter(id__in=batch_ids).delete()
+            deleted += count
+
+            if len(batch_ids) < self.batch_size:
+                break
+            if self.batch_sleep:
+                time.sleep(self.batch_sleep)
+
+        return deleted
+
+    def run(self, device_id=None):
+        """Apply retention to every device, returns a summary dict"""
+        started = time.monotonic()
+        now = timezone.now()
+        policies = self.get_policies()
+
+        summary = {
+            'devices_checked': 0,
+            'devices_purged': 0,
+            'rows_deleted': 0,
+            'devices_incomplete': 0,
+        }
+
+        for candidate in self.get_candidate_devices(policies, device_id):
+            days = policies.get(candidate, settings.RAW_RETENTION_DAYS)
+            summary['devices_checked'] += 1
+            if days == 0:
+                continue
+
+            cutoff = now - timedelta(days=days)
+            horizon = self.find_safe_horizon(candidate, cutoff)
+            if horizon < cutoff:
+                summary['devices_incomplete'] += 1
+
+            deleted = self.purge_device(candidate, horizon)
+            if deleted:
+                summary['devices_purged'] += 1
+                summary['rows_deleted'] += deleted
+                logger.info(f"Device {candidate}: reclaimed {deleted} raw rows older than {horizon}")
+
+        elapsed = time.monotonic() - started
+        summary['elapsed_seconds'] = round(elapsed, 3)
+        summary['rows_per_second'] = round(summary['rows_deleted'] / elapsed, 1) if elapsed > 0 else 0.0
+        return summary
@@ -0,0 +1,164 @@
+"""
+Incrementally maintained rollups fed by the ingest path:
+per-device daily totals and value sketches, and sharded fleet-wide hourly totals.
+"""
+import time
+import uuid
+from collections import defaultdict
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .caching import invalidate_analytics, invalidate_daily_many
+from .models import Device, DeviceDailyConsumption, FleetHourlyConsumption, HourlyEnergyConsumption
+from .sketch import DDSketch
+
+HOURLY_TABLE = HourlyEnergyConsumption._meta.db_table
+
+# ON CONFLICT clause shared by the sync and async hourly upserts: totals add up,
+# min/max fold in (LEAST/GREATEST skip NULLs), and last_value only moves forward
+# in time so a late or redelivered reading cannot overwrite a newer one
+HOURLY_UPSERT_CONFLICT_SQL = f"""
+    ON CONFLICT (device_id, date, hour) DO UPDATE SET
+        total_consumption = {HOURLY_TABLE}.total_consumption + EXCLUDED.total_consumption,
+        measurement_count = {HOURLY_TABLE}.measurement_count + EXCLUDED.measurement_count,
+        min_value = LEAST({HOURLY_TABLE}.min_value, EXCLUDED.min_value),
+        max_value = GREATEST({HOURLY_TABLE}.max_value, EXCLUDED.max_value),
+        last_value = CASE
+            WHEN {HOURLY_TABLE}.last_timestamp IS NULL OR EXCLUDED.last_timestamp >= {HOURLY_TABLE}.last_timestamp
+            THEN EXCLUDED.last_value ELSE {HOURLY_TABLE}.last_value END,
+        last_timestamp = GREATEST({HOURLY_TABLE}.last_timestamp, EXCLUDED.last_timestamp),
+        updated_at = now()
+"""
+
+
+def fleet_shard(device_id):
+    """Stable shard for a device's contribution to fleet hourly rows"""
+    return uuid.UUID(str(device_id)).int % settings.FLEET_SHARDS
+
+
+def crossed_limit(old_total, new_total, limit):
+    """True when this update pushed an hourly total over the device's limit"""
+    return bool(limit) and limit > 0 and old_total <= limit < new_total
+
+
+def increment(model, lookup, deltas):
+    """Atomically add deltas to the row matching lookup, creating it if missing"""
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    updates['updated_at'] = timezone.now()
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Another worker created it first
+        model.objects.filter(**lookup).update(**updates)
+
+
+def load_sketch(data):
+    """Deserialize a stored value sketch, or start an empty one"""
+    if data is None:
+        return DDSketch(settings.SKETCH_RELATIVE_ACCURACY, settings.SKETCH_MAX_BUCKETS)
+    return DDSketch.from_bytes(data, settings.SKETCH_MAX_BUCKETS)
+
+
+def add_to_sketch(data, values):
+    """Serialized sketch with values folded in"""
+    sketch = load_sketch(data)
+    for value in values:
+        sketch.add(value)
+    return sketch.to_bytes()
+
+
+def add_to_daily_sketch(device_id, date, values):
+    """
+    Fold readings into the day's value sketch. The daily row must already exist
+    and the caller's transaction holds its lock until commit, so concurrent
+    writers serialize on the row instead of losing each other's readings.
+    """
+    day = DeviceDailyConsumption.objects.select_for_update().filter(device_id=device_id, date=date)
+    row_id, data = day.values_list('id', 'value_sketch').get()
+    DeviceDailyConsumption.objects.filter(id=row_id).update(value_sketch=add_to_sketch(data, values))
+
+
+def apply_rollups(device_id, date, hour, measurement_value, over_limit):
+    """
+    Add one measurement to the daily and fleet rollups (call inside the ingest transaction).
+    The daily value sketch is not touched here; see DailySketchBuffer.
+    """
+    increment(
+        DeviceDailyConsumption,
+        {'device_id': device_id, 'date': date},
+        {'total_consumption': measurement_value, 'measurement_count': 1}
+    )
+    increment(
+        FleetHourlyConsumption,
+        {'date': date, 'hour': hour, 'shard': fleet_shard(device_id)},
+        {'total_consumption': measurement_value, 'measurement_count': 1, 'devices_over_limit': int(over_limit)}
+    )
+
+
+class DeviceLimitCache:
+    """In-process cache of Device.max_consumption so ingest avoids a lookup per message"""
+
+    def __init__(self, ttl_seconds=300):
+        self.ttl_seconds = ttl_seconds
+        self.limits = {}
+
+    def get(self, device_id):
+        cached = self.limits.get(device_id)
+        if cached and time.monotonic() - cached[1] < self.ttl_seconds:
+            return cached[0]
+        limit = Device.objects.filter(id=device_id).values_list('max_consumption', flat=True).first()
+        self.limits[device_id] = (limit, time.monotonic())
+        return limit
+
+
+class DailySketchBuffer:
+    """
+    Collects committed readings per (device, date) and folds them into the daily
+    value sketches in one locked write per day, instead of a locked
+    read-modify-write of the sketch for every message. Each flush then retires
+    the cached daily responses and analytics of the days it touched in two
+    cache round trips, rather than two per reading.
+
+    Readings still buffered when a worker dies are missing from their day's
+    sketch; `build_daily_sketches --stale` rebuilds such days from raw data.
+    """
+
+    def __init__(self, max_readings=None, interval_seconds=None):
+        self.max_readings = max_readings or settings.SKETCH_FLUSH_READINGS
+        self.interval_seconds = interval_seconds or settings.SKETCH_FLUSH_SECONDS
+        self.values = defaultdict(list)
+        self.pending = 0
+        self.flushed = time.monotonic()
+
+    def add(self, device_id, date, value):
+        self.values[(device_id, date)].append(value)
+        self.pending += 1
+
+    def maybe_flush(self):
+        """Flush once enough readings are buffered or the flush interval has elapsed"""
+        if self.pending >= self.max_readings or time.monotonic() - self.flushed >= self.interval_seconds:
+            self.flush()
+
+    def flush(self):
+        values, self.values, self.pending = self.values, defaultdict(list), 0
+        self.flushed = time.monotonic()
+        if not values:
+            return
+        try:
+            # Sorted so concurrent flushes lock daily rows in the same order
+            with transaction.atomic():
+                for (device_id, date), day_values in sorted(values.items()):
+                    add_to_daily_sketch(device_id, date, day_values)
+        except Exception:
+            # Nothing was written; keep the readings for the next flush
+            for key, day_values in values.items():
+                self.values[key].extend(day_values)
+                self.pending += len(day_values)
+            raise
+
+        invalidate_daily_many(values)
+        invalidate_analytics({device_id for device_id, _ in values})
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from django.db.models import OuterRef, Subquery
 from .models import DeviceMeasurement, HourlyEnergyConsumption, Device, User, UserDeviceMapping
 
 
@@ -10,10 +11,54 @@ class DeviceMeasurementSerializer(serializers.ModelSerializer):
 
 
 class HourlyEnergyConsumptionSerializer(serializers.ModelSerializer):
+    avg_value = serializers.FloatField(read_only=True, allow_null=True)
+
     class Meta:
         model = HourlyEnergyConsumption
-        fields = ['id', 'device_id', 'date', 'hour', 'total_consumption', 'measurement_count', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = [
+            'id', 'device_id', 'date', 'hour', 'bucket_start', 'total_consumption', 'measurement_count',
+            'min_value', 'max_value', 'avg_value', 'last_value', 'last_timestamp', 'created_at', 'updated_at'
+        ]
+        read_only_fields = [
+            'id', 'bucket_start', 'min_value', 'max_value', 'last_value', 'last_timestamp', 'created_at', 'updated_at'
+        ]
+
+
+# Columns read by the lean hourly read path, in hourly_rows_to_dicts() order
+HOURLY_VALUES_FIELDS = (
+    'id', 'device_id', 'date', 'hour', 'bucket_start', 'total_consumption', 'measurement_count',
+    'min_value', 'max_value', 'last_value', 'last_timestamp', 'created_at', 'updated_at'
+)
+
+
+def hourly_rows_to_dicts(rows):
+    """
+    Turn HOURLY_VALUES_FIELDS tuples into HourlyEnergyConsumptionSerializer-shaped
+    dicts and sum total_consumption in the same pass.
+    Returns (data, total).
+    """
+    data = []
+    total = 0.0
+    for (row_id, device_id, date, hour, bucket_start, consumption, count,
+         min_value, max_value, last_value, last_timestamp, created_at, updated_at) in rows:
+        data.append({
+            'id': row_id,
+            'device_id': device_id,
+            'date': date,
+            'hour': hour,
+            'bucket_start': bucket_start,
+            'total_consumption': consumption,
+            'measurement_count': count,
+            'min_value': min_value,
+            'max_value': max_value,
+            'avg_value': consumption / count if count else None,
+            'last_value': last_value,
+            'last_timestamp': last_timestamp,
+            'created_at': created_at,
+            'updated_at': updated_at,
+        })
+        total += consumption
+    return data, total
 
 
 class DeviceSerializer(serializers.ModelSerializer):
@@ -25,14 +70,29 @@ class DeviceSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'max_consumption', 'created_at', 'user_id', 'status']
         read_only_fields = ['id', 'created_at', 'user_id', 'status']
     
+    @staticmethod
+    def annotate_queryset(queryset):
+        """
+        Annotate the first mapping's user id in SQL so listing N devices is one
+        query instead of up to three per device
+        """
+        first_assignment = UserDeviceMapping.objects.filter(device_id=OuterRef('pk')).order_by('pk')
+        return queryset.annotate(assigned_user_id=Subquery(first_assignment.values('user_id')[:1]))
+    
+    def _assigned_user_id(self, obj):
+        if hasattr(obj, 'assigned_user_id'):
+            return obj.assigned_user_id
+        # Instance did not come from annotate_queryset()
+        return obj.user_assignments.order_by('pk').values_list('user_id', flat=True).first()
+    
     def get_user_id(self, obj):
         """Get the user_id from the latest mapping"""
-        mapping = obj.user_assignments.first()
-        return str(mapping.user.id) if mapping else None
+        user_id = self._assigned_user_id(obj)
+        return str(user_id) if user_id else None
     
     def get_status(self, obj):
         """Get device status based on assignment"""
-        return 'assigned' if obj.user_assignments.exists() else 'unassigned'
+        return 'assigned' if self._assigned_user_id(obj) else 'unassigned'
 
 
 class UserSerializer(serializers.ModelSerializer):
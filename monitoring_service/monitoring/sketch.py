@@ -0,0 +1,170 @@
+"""
+Mergeable DDSketch quantile summaries of measurement values.
+
+Values are counted in logarithmic buckets of width gamma = (1 + a) / (1 - a),
+so any quantile is answered within relative error `a` of a true reading. Two
+sketches with the same accuracy merge by adding bucket counts, which is what
+lets per-day sketches be combined into any date range. The binary form is a
+small fixed header followed by delta/varint-encoded buckets - typically a few
+hundred bytes for a day of readings.
+"""
+import math
+import struct
+
+SKETCH_VERSION = 1
+
+# version, relative accuracy in basis points, exact min, exact max
+HEADER = struct.Struct('<BHdd')
+
+# Magnitudes below this are counted as zero rather than given a bucket
+MIN_INDEXABLE = 1e-9
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+
+class DDSketch:
+    """Relative-error quantile sketch over positive, negative and zero values"""
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError('relative_accuracy must be between 0 and 1')
+        # Stored as basis points, so a sketch read back from bytes has exactly the same gamma
+        self.accuracy_bp = max(1, round(relative_accuracy * 10000))
+        self.relative_accuracy = self.accuracy_bp / 10000
+        self.gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _key(self, magnitude):
+        return math.ceil(math.log(magnitude) / self.log_gamma)
+
+    def _value(self, key):
+        # Midpoint of the bucket (gamma^(key-1), gamma^key] in the relative-error sense
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def _collapse(self, store):
+        """Fold the lowest-magnitude buckets together once a store exceeds max_buckets"""
+        if len(store) <= self.max_buckets:
+            return
+        keys = sorted(store)
+        excess = keys[:len(keys) - self.max_buckets + 1]
+        target = keys[len(excess)]
+        store[target] += sum(store.pop(key) for key in excess)
+
+    def add(self, value, count=1):
+        if value > MIN_INDEXABLE:
+            key = self._key(value)
+            self.positive[key] = self.positive.get(key, 0) + count
+            self._collapse(self.positive)
+        elif value < -MIN_INDEXABLE:
+            key = self._key(-value)
+            self.negative[key] = self.negative.get(key, 0) + count
+            self._collapse(self.negative)
+        else:
+            self.zero_count += count
+        self.count += count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        if other.accuracy_bp != self.accuracy_bp:
+            raise ValueError(
+                f'Cannot merge sketches with different accuracy ({self.relative_accuracy} vs {other.relative_accuracy})'
+            )
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in other_store.items():
+                store[key] = store.get(key, 0) + count
+            self._collapse(store)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """Estimated value at quantile q (0-1), None for an empty sketch"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+
+        seen = 0
+        # Most negative values first: the negative store walked from the largest magnitude down
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return max(self.min, -self._value(key))
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return min(self.max, self._value(key))
+        return self.max
+
+    def to_bytes(self):
+        out = bytearray(HEADER.pack(SKETCH_VERSION, self.accuracy_bp, self.min, self.max))
+        _write_varint(out, self.zero_count)
+        for store in (self.positive, self.negative):
+            keys = sorted(store)
+            _write_varint(out, len(keys))
+            previous = 0
+            for i, key in enumerate(keys):
+                # First key may be negative (values below 1); the rest are ascending deltas
+                _write_varint(out, _zigzag(key) if i == 0 else key - previous)
+                previous = key
+            for key in keys:
+                _write_varint(out, store[key])
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data, max_buckets=2048):
+        data = bytes(data)
+        version, accuracy_bp, minimum, maximum = HEADER.unpack_from(data)
+        if version != SKETCH_VERSION:
+            raise ValueError(f'Unsupported sketch version {version}')
+        sketch = cls(accuracy_bp / 10000, max_buckets)
+        sketch.min, sketch.max = minimum, maximum
+
+        pos = HEADER.size
+        sketch.zero_count, pos = _read_varint(data, pos)
+        for store in (sketch.positive, sketch.negative):
+            size, pos = _read_varint(data, pos)
+            keys = []
+            for i in range(size):
+                raw, pos = _read_varint(data, pos)
+                keys.append(_unzigzag(raw) if i == 0 else keys[-1] + raw)
+            for key in keys:
+                store[key], pos = _read_varint(data, pos)
+        sketch.count = sketch.zero_count + sum(sketch.positive.values()) + sum(sketch.negative.values())
+        return sketch
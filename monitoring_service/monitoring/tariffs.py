@@ -0,0 +1,185 @@
+"""
+Time-of-use cost engine over hourly aggregates.
+
+Each tariff is expanded once into a dense (12 months, 7 weekdays, 24 hours)
+price table. Costing a range is then one query for the hourly rows followed by
+NumPy gathers and bincounts - price = tables[tariff, month, weekday, hour],
+cost = kWh * price, summed per (device, month). Closed months are cached per
+device and tariff version; ingest deletes a month's entry if late data lands.
+"""
+from datetime import date, timedelta
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+from .caching import cost_month_cache_key
+from .models import Device, HourlyEnergyConsumption, Tariff
+
+
+def _wrapping_span(start, stop, size):
+    """Indices from start up to (not including) stop, wrapping past size; start == stop is the full cycle"""
+    if start < stop:
+        return list(range(start, stop))
+    return list(range(start, size)) + list(range(0, stop))
+
+
+def build_rate_table(tariff):
+    """Dense (12, 7, 24) price array; rates are applied in priority order so later ones win"""
+    table = np.full((12, 7, 24), tariff.base_rate, dtype=np.float64)
+    for rate in sorted(tariff.rates.all(), key=lambda rate: rate.priority):
+        months = _wrapping_span(rate.start_month - 1, rate.end_month % 12, 12)
+        days = sorted({int(day) for day in rate.days_of_week if day.isdigit() and int(day) < 7})
+        hours = _wrapping_span(rate.start_hour, rate.end_hour % 24, 24)
+        table[np.ix_(months, days, hours)] = rate.price_per_kwh
+    return table
+
+
+def tariff_version(tariff):
+    return f"{tariff.id}:{tariff.updated_at.timestamp()}"
+
+
+def get_rate_table(tariff):
+    key = f"tariff_table:{tariff_version(tariff)}"
+    table = cache.get(key)
+    if table is None:
+        table = build_rate_table(tariff)
+        cache.set(key, table, None)
+    return table
+
+
+def resolve_tariffs(device_ids, tariff_id=None):
+    """
+    Map each device id to its Tariff: the explicit tariff_id, else the device's
+    assigned tariff, else the default tariff (None if there is none)
+    """
+    if tariff_id:
+        tariff = Tariff.objects.prefetch_related('rates').get(id=tariff_id)
+        return {device_id: tariff for device_id in device_ids}
+
+    assigned = {
+        str(device.id): device.tariff
+        for device in Device.objects.filter(id__in=device_ids, tariff__isnull=False)
+        .select_related('tariff').prefetch_related('tariff__rates')
+    }
+    default = None
+    if len(assigned) < len(device_ids):
+        default = Tariff.objects.filter(is_default=True).prefetch_related('rates').first()
+    return {device_id: assigned.get(device_id, default) for device_id in device_ids}
+
+
+def month_spans(start_date, end_date):
+    """(year, month, first_day, last_day) for every month touched, clipped to the range"""
+    spans = []
+    first = start_date
+    while first <= end_date:
+        next_month = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+        last = min(next_month - timedelta(days=1), end_date)
+        spans.append((first.year, first.month, first, last))
+        first = next_month
+    return spans
+
+
+def compute_monthly_costs(device_ids, tariffs, start_date, end_date):
+    """
+    kWh and cost per (device, month) between two dates in one query.
+    Returns {device_id: {(year, month): (kwh, cost)}} for months with data.
+    """
+    rows = list(
+        HourlyEnergyConsumption.objects.filter(
+            device_id__in=device_ids
+        ).between_days(start_date, end_date).values_list('device_id', 'date', 'hour', 'total_consumption')
+    )
+    results = {device_id: {} for device_id in device_ids}
+    if not rows:
+        return results
+
+    # One price table per distinct tariff, stacked so a single gather prices every row
+    versions = {}
+    for tariff in tariffs.values():
+        versions.setdefault(tariff_version(tariff), tariff)
+    version_index = {version: i for i, version in enumerate(versions)}
+    tables = np.stack([get_rate_table(tariff) for tariff in versions.values()])
+    device_index = {device_id: i for i, device_id in enumerate(device_ids)}
+    device_tariff = np.array([version_index[tariff_version(tariffs[device_id])] for device_id in device_ids])
+
+    ids, dates, hours, kwh = zip(*rows)
+    devices = np.fromiter((device_index[str(device_id)] for device_id in ids), dtype=np.int64, count=len(rows))
+    days = np.array(dates, dtype='datetime64[D]')
+    hours = np.array(hours, dtype=np.int64)
+    kwh = np.array(kwh, dtype=np.float64)
+
+    months = days.astype('datetime64[M]').astype(np.int64)
+    # 1970-01-01 was a Thursday; shift so Monday is 0 like date.weekday()
+    weekdays = (days.astype(np.int64) + 3) % 7
+    prices = tables[device_tariff[devices], months % 12, weekdays, hours]
+
+    first_month = months.min()
+    num_months = int(months.max() - first_month) + 1
+    buckets = devices * num_months + (months - first_month)
+    size = len(device_ids) * num_months
+    kwh_totals = np.bincount(buckets, weights=kwh, minlength=size)
+    cost_totals = np.bincount(buckets, weights=kwh * prices, minlength=size)
+    counts = np.bincount(buckets, minlength=size)
+
+    for bucket in np.flatnonzero(counts).tolist():
+        device, month_offset = divmod(bucket, num_months)
+        month_number = int(first_month) + month_offset
+        key = (1970 + month_number // 12, month_number % 12 + 1)
+        results[device_ids[device]][key] = (float(kwh_totals[bucket]), float(cost_totals[bucket]))
+    return results
+
+
+def cost_report(device_ids, tariffs, start_date, end_date):
+    """
+    Monthly kWh and cost per device, serving closed full months from the cache
+    and computing the rest in one compute_monthly_costs() call.
+    Returns {device_id: [(year, month, kwh, cost), ...]} in month order.
+    """
+    today = timezone.now().date()
+    spans = month_spans(start_date, end_date)
+    # Only whole months that have ended can be cached; edges and the current month are always fresh
+    closed = {
+        (year, month) for year, month, first, last in spans
+        if first.day == 1 and last.month != (last + timedelta(days=1)).month and last < today
+    }
+
+    keys = {
+        (device_id, year, month): cost_month_cache_key(device_id, year, month)
+        for device_id in device_ids for year, month in closed
+    }
+    cached = cache.get_many(list(keys.values()))
+    values = {}
+    for (device_id, year, month), key in keys.items():
+        versions = cached.get(key) or {}
+        version = tariff_version(tariffs[device_id])
+        if version in versions:
+            values[(device_id, year, month)] = versions[version]
+
+    needed = {
+        (device_id, year, month, first, last)
+        for device_id in device_ids for year, month, first, last in spans
+        if (device_id, year, month) not in values
+    }
+    if needed:
+        compute_ids = sorted({device_id for device_id, *_ in needed})
+        computed = compute_monthly_costs(
+            compute_ids,
+            {device_id: tariffs[device_id] for device_id in compute_ids},
+            min(first for *_, first, _ in needed),
+            max(last for *_, last in needed)
+        )
+        to_cache = {}
+        for device_id, year, month, _, _ in needed:
+            kwh, cost = computed[device_id].get((year, month), (0.0, 0.0))
+            values[(device_id, year, month)] = (kwh, cost)
+            if (year, month) in closed:
+                key = keys[(device_id, year, month)]
+                versions = dict(cached.get(key) or {})
+                versions[tariff_version(tariffs[device_id])] = (kwh, cost)
+                to_cache[key] = versions
+        if to_cache:
+            cache.set_many(to_cache, None)
+
+    return {
+        device_id: [(year, month, *values[(device_id, year, month)]) for year, month, _, _ in spans]
+        for device_id in device_ids
+    }
@@ -1,3 +1,417 @@
-from django.test import TestCase
+import base64
+import json
+import random
+import struct
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .access import invalidate_user_access
+from .authentication import SimpleUser
+from .caching import invalidate_daily
+from .codec import BINARY_CONTENT_TYPE, JSON_CONTENT_TYPE, decode_measurement, encode_binary
+from .consumers import DeviceDataConsumer
+from .dedup import RecentMeasurementFilter
+from .live import NOTIFY_MAX_BYTES, LiveHub, hub as live_hub, pack_events
+from .metrics import LogSampler
+from .models import (
+    Device,
+    DeviceMeasurement,
+    HourlyEnergyConsumption,
+    RetentionPolicy,
+    User,
+    UserDeviceMapping,
+    bucket_start_for,
+)
+from .rabbitmq import ORIGIN_QUEUE_HEADER, RETRY_COUNT_HEADER, retry_or_park
+from .retention import RawDataRetention
+from .sketch import DDSketch
+from .views import parse_downsample_params
 
-# Create your tests here.
+
+class DeviceListQueryCountTest(TestCase):
+    """Listing devices must cost a constant number of queries"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=SimpleUser('00000000-0000-0000-0000-000000000001', 'admin', 'admin'))
+        self.owner = User.objects.create(username='owner', role='client')
+
+    def create_devices(self, count):
+        for i in range(count):
+            device = Device.objects.create(name=f'Device {i}', max_consumption=10.0)
+            # Leave every third device unassigned
+            if i % 3:
+                UserDeviceMapping.objects.create(user=self.owner, device=device)
+
+    def test_query_count_does_not_grow_with_devices(self):
+        self.create_devices(3)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/monitoring/devices/')
+        self.assertEqual(len(response.json()), 3)
+
+        self.create_devices(20)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/monitoring/devices/')
+        self.assertEqual(len(response.json()), 23)
+
+    def test_status_and_user_id(self):
+        self.create_devices(3)
+        response = self.client.get('/api/monitoring/devices/')
+        by_name = {device['name']: device for device in response.json()}
+
+        self.assertEqual(by_name['Device 0']['status'], 'unassigned')
+        self.assertIsNone(by_name['Device 0']['user_id'])
+        self.assertEqual(by_name['Device 1']['status'], 'assigned')
+        self.assertEqual(by_name['Device 1']['user_id'], str(self.owner.id))
+
+
+class DDSketchTest(SimpleTestCase):
+    """Daily sketches must round-trip through bytes and merge within the relative accuracy"""
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.values = [rng.lognormvariate(-3, 1) for _ in range(5000)] + [0.0] * 5
+
+    def test_merged_quantiles_within_accuracy(self):
+        first, second = DDSketch(0.01), DDSketch(0.01)
+        for value in self.values[:2000]:
+            first.add(value)
+        for value in self.values[2000:]:
+            second.add(value)
+        merged = DDSketch.from_bytes(first.to_bytes())
+        merged.merge(DDSketch.from_bytes(second.to_bytes()))
+
+        ordered = sorted(self.values)
+        self.assertEqual(merged.count, len(ordered))
+        for q in (0.5, 0.95, 0.99):
+            expected = ordered[int(q * (len(ordered) - 1))]
+            self.assertAlmostEqual(merged.quantile(q), expected, delta=expected * 0.011)
+        self.assertEqual(merged.quantile(0), 0.0)
+        self.assertEqual(merged.quantile(1), max(self.values))
+
+    def test_empty_and_mismatched_accuracy(self):
+        empty = DDSketch.from_bytes(DDSketch(0.01).to_bytes())
+        self.assertEqual(empty.count, 0)
+        self.assertIsNone(empty.quantile(0.95))
+        with self.assertRaises(ValueError):
+            empty.merge(DDSketch(0.02))
+
+
+class SingleDeviceRetentionTest(TestCase):
+    """enforce_retention --device-id must honour that device's own policy"""
+
+    def setUp(self):
+        self.device_id = uuid.uuid4()
+        timestamp = (timezone.now() - timedelta(days=60)).replace(minute=0, second=0, microsecond=0)
+        DeviceMeasurement.objects.create(device_id=self.device_id, timestamp=timestamp, measurement_value=1.0)
+        HourlyEnergyConsumption.objects.create(
+            device_id=self.device_id, date=timestamp.date(), hour=timestamp.hour,
+            bucket_start=bucket_start_for(timestamp.date(), timestamp.hour),
+            total_consumption=1.0, measurement_count=1
+        )
+
+    def test_keep_forever_policy_is_not_purged(self):
+        RetentionPolicy.objects.create(device_id=self.device_id, raw_retention_days=0)
+        summary = RawDataRetention(batch_sleep=0).run(device_id=str(self.device_id))
+        self.assertEqual(summary['rows_deleted'], 0)
+        self.assertEqual(DeviceMeasurement.objects.filter(device_id=self.device_id).count(), 1)
+
+    def test_default_window_applies_without_policy(self):
+        summary = RawDataRetention(batch_sleep=0).run(device_id=str(self.device_id))
+        self.assertEqual(summary['rows_deleted'], 1)
+
+
+class MalformedDeviceIdTest(TestCase):
+    """Admins skip the access lookup, so a bad device_id must be rejected before it reaches the ORM"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=SimpleUser('00000000-0000-0000-0000-000000000001', 'admin', 'admin'))
+
+    def test_bad_device_id_is_400(self):
+        for url in (
+            '/api/monitoring/hourly/range/?device_id=abc&start_date=2024-01-01&end_date=2024-01-02',
+            '/api/monitoring/hourly/window/?device_id=abc',
+            '/api/monitoring/measurements/?device_id=abc',
+            '/api/monitoring/hourly/daily/?device_id=abc&date=2024-01-01',
+        ):
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+
+    def test_bad_cursor_row_id_is_404(self):
+        cursor = base64.urlsafe_b64encode(b'2024-01-01T00:00:00+00:00|abc').decode('ascii')
+        response = self.client.get(f'/api/monitoring/measurements/?cursor={cursor}')
+        self.assertEqual(response.status_code, 404)
+
+
+class DownsampleParamsTest(SimpleTestCase):
+    """Downsampling bounds the bucket count per device and the bucket width by the range"""
+
+    params = {
+        'device_id': '00000000-0000-0000-0000-000000000002',
+        'start_date': '2024-01-01T00:00:00Z',
+        'end_date': '2024-01-02T00:00:00Z',
+    }
+
+    def test_device_id_required(self):
+        with self.assertRaises(ValueError):
+            parse_downsample_params({**self.params, 'device_id': '', 'max_points': '100'})
+
+    def test_resolution_clamped_to_range(self):
+        _, _, resolution = parse_downsample_params({**self.params, 'resolution': str(10 ** 30)})
+        self.assertEqual(resolution, 86400)
+
+
+class LogSamplerTest(SimpleTestCase):
+    """Sub-one-per-second rates must still let lines through"""
+
+    def test_fractional_rate_allows_first_line(self):
+        sampler = LogSampler(0.5)
+        self.assertEqual(sampler.allow(), 0)
+        self.assertIsNone(sampler.allow())
+
+
+@override_settings(LIVE_HEARTBEAT_SECONDS=0)
+class LiveAccessRevocationTest(TestCase):
+    """Unassigning a device must stop an open live stream from delivering its readings"""
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner', role='client')
+        self.device = Device.objects.create(name='Meter', max_consumption=10.0)
+        self.mapping = UserDeviceMapping.objects.create(user=self.owner, device=self.device)
+        self.client = APIClient()
+        self.client.force_authenticate(user=SimpleUser(str(self.owner.id), 'owner', 'client'))
+
+    def test_revoking_mapping_stops_delivery(self):
+        payload = json.dumps([{'device_id': str(self.device.id)}])
+        # No LISTEN connection: events are dispatched by hand
+        with mock.patch.object(LiveHub, 'listen', lambda hub: None):
+            response = self.client.get(f'/api/monitoring/live/?device_ids={self.device.id}')
+            stream = iter(response.streaming_content)
+            next(stream)
+
+            live_hub.dispatch(payload)
+            self.assertIn(b'event: measurement', next(stream))
+
+            self.mapping.delete()
+            invalidate_user_access(self.owner.id)
+            live_hub.dispatch(payload)
+            rest = b''.join(stream)
+
+        self.assertNotIn(b'event: measurement', rest)
+        self.assertIn(b'event: revoked', rest)
+
+    @override_settings(SERVER_MODE='wsgi')
+    def test_wsgi_mode_refuses_streams(self):
+        response = self.client.get('/api/monitoring/live/')
+        self.assertEqual(response.status_code, 503)
+
+
+class PackEventsTest(SimpleTestCase):
+    """A batch's live events are coalesced into as few NOTIFY payloads as fit"""
+
+    def test_payloads_fit_and_keep_every_event(self):
+        events = [{'device_id': str(uuid.UUID(int=i)), 'measurement_value': i} for i in range(500)]
+        payloads = pack_events(events)
+        self.assertGreater(len(payloads), 1)
+        self.assertLess(len(payloads), len(events))
+        self.assertTrue(all(len(payload) <= NOTIFY_MAX_BYTES for payload in payloads))
+        self.assertEqual([event for payload in payloads for event in json.loads(payload)], events)
+
+
+class RecentMeasurementFilterTest(SimpleTestCase):
+    """Keys are remembered for one to two windows, then forgotten"""
+
+    def test_generations_rotate(self):
+        with mock.patch('monitoring.dedup.time.monotonic', return_value=0):
+            recent = RecentMeasurementFilter(capacity=100, error_rate=0.01, window_seconds=60)
+            recent.add('key')
+        with mock.patch('monitoring.dedup.time.monotonic', return_value=61):
+            # Rotated once: the key now lives in the previous generation
+            self.assertTrue(recent.might_contain('key'))
+        with mock.patch('monitoring.dedup.time.monotonic', return_value=122):
+            self.assertFalse(recent.might_contain('key'))
+
+
+class IngestDeduplicationTest(TestCase):
+    """Redelivered readings are skipped without double counting the hourly row"""
+
+    def setUp(self):
+        with mock.patch('monitoring.consumers.get_rabbitmq_connection'):
+            self.consumer = DeviceDataConsumer(queue_names=['ingest_queue_1'])
+        self.device_id = str(uuid.uuid4())
+        self.timestamp = timezone.now().replace(microsecond=0)
+        self.body = json.dumps({
+            'device_id': self.device_id,
+            'timestamp': self.timestamp.isoformat(),
+            'measurement_value': 1.5,
+        }).encode('utf-8')
+
+    def deliver(self):
+        ch = mock.Mock()
+        self.consumer.callback(ch, mock.Mock(delivery_tag=1), mock.Mock(content_type=None, headers={}), self.body)
+        return ch
+
+    def test_bloom_miss_skips_database(self):
+        with self.assertNumQueries(0):
+            self.assertFalse(self.consumer.is_duplicate(self.device_id, self.timestamp))
+
+    def test_bloom_hit_is_confirmed_against_database(self):
+        self.consumer.recent.add(RecentMeasurementFilter.make_key(self.device_id, self.timestamp))
+        with self.assertNumQueries(1):
+            # False positive: nothing stored yet
+            self.assertFalse(self.consumer.is_duplicate(self.device_id, self.timestamp))
+
+        DeviceMeasurement.objects.create(device_id=self.device_id, timestamp=self.timestamp, measurement_value=1.5)
+        with self.assertNumQueries(1):
+            self.assertTrue(self.consumer.is_duplicate(self.device_id, self.timestamp))
+
+    def test_unique_constraint_catches_duplicate_missed_by_filter(self):
+        self.deliver()
+        # A fresh filter (e.g. after a restart) lets the redelivery through to the insert
+        self.consumer.recent = RecentMeasurementFilter(capacity=100, error_rate=0.01, window_seconds=3600)
+        ch = self.deliver()
+
+        ch.basic_ack.assert_called_once_with(delivery_tag=1)
+        ch.basic_publish.assert_not_called()
+        self.assertEqual(DeviceMeasurement.objects.filter(device_id=self.device_id).count(), 1)
+        hourly = HourlyEnergyConsumption.objects.get(device_id=self.device_id)
+        self.assertEqual(hourly.measurement_count, 1)
+        self.assertEqual(hourly.total_consumption, 1.5)
+
+
+@override_settings(MAX_RETRIES=2)
+class RetryOrParkTest(SimpleTestCase):
+    """Failed messages back off through the delay queues, then park"""
+
+    def fail(self, headers=None, permanent=False):
+        ch = mock.Mock()
+        method = mock.Mock(routing_key='ingest_queue_1', delivery_tag=7)
+        properties = mock.Mock(headers=headers, content_type='application/json')
+        retry_or_park(ch, method, properties, b'{}', ValueError('boom'), permanent=permanent)
+        ch.basic_ack.assert_called_once_with(delivery_tag=7)
+        kwargs = ch.basic_publish.call_args.kwargs
+        return kwargs['routing_key'], kwargs['properties'].headers
+
+    def test_first_failure_goes_to_first_delay_queue(self):
+        target, headers = self.fail()
+        self.assertEqual(target, 'ingest_queue_1.retry.0')
+        self.assertEqual(headers[RETRY_COUNT_HEADER], 1)
+        self.assertEqual(headers[ORIGIN_QUEUE_HEADER], 'ingest_queue_1')
+
+    def test_retry_count_picks_delay_queue(self):
+        # Dead-lettered back from a delay queue: origin comes from the header
+        target, headers = self.fail({RETRY_COUNT_HEADER: 1, ORIGIN_QUEUE_HEADER: 'ingest_queue_1'})
+        self.assertEqual(target, 'ingest_queue_1.retry.1')
+        self.assertEqual(headers[RETRY_COUNT_HEADER], 2)
+
+    def test_exhausted_retries_park(self):
+        target, _ = self.fail({RETRY_COUNT_HEADER: 2, ORIGIN_QUEUE_HEADER: 'ingest_queue_1'})
+        self.assertEqual(target, 'ingest_queue_1.parked')
+
+    def test_permanent_failure_parks_immediately(self):
+        target, headers = self.fail(permanent=True)
+        self.assertEqual(target, 'ingest_queue_1.parked')
+        self.assertNotIn(RETRY_COUNT_HEADER, headers)
+
+
+class MeasurementCodecTest(SimpleTestCase):
+    """Both wire formats round-trip, and bad payloads raise so the consumer parks them"""
+
+    device_id = '6f1c2d3e-4a5b-4c6d-8e7f-9a0b1c2d3e4f'
+    timestamp = datetime(2024, 3, 1, 12, 30, 15, 250000, tzinfo=dt_timezone.utc)
+
+    def json_body(self):
+        return json.dumps({
+            'device_id': self.device_id,
+            'timestamp': self.timestamp.isoformat().replace('+00:00', 'Z'),
+            'measurement_value': 1.5,
+        }).encode('utf-8')
+
+    def test_binary_round_trip(self):
+        body = encode_binary(self.device_id, self.timestamp, 1.5)
+        self.assertEqual(len(body), 28)
+        self.assertEqual(decode_measurement(body, BINARY_CONTENT_TYPE), (self.device_id, self.timestamp, 1.5))
+
+    def test_json_round_trip(self):
+        for content_type in (JSON_CONTENT_TYPE, None):
+            self.assertEqual(
+                decode_measurement(self.json_body(), content_type),
+                (self.device_id, self.timestamp, 1.5)
+            )
+
+    def test_content_type_selects_decoder(self):
+        with self.assertRaises(ValueError):
+            decode_measurement(encode_binary(self.device_id, self.timestamp, 1.5), JSON_CONTENT_TYPE)
+        with self.assertRaises(struct.error):
+            decode_measurement(self.json_body(), BINARY_CONTENT_TYPE)
+
+    def test_truncated_and_oversized_payloads_raise(self):
+        body = encode_binary(self.device_id, self.timestamp, 1.5)
+        for bad in (body[:-1], body + b'\x00'):
+            with self.assertRaises(struct.error):
+                decode_measurement(bad, BINARY_CONTENT_TYPE)
+        with self.assertRaises(ValueError):
+            decode_measurement(self.json_body()[:-5], JSON_CONTENT_TYPE)
+
+
+class DailyConditionalRequestTest(TestCase):
+    """The daily endpoint answers revalidation with 304 until the day's data changes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=SimpleUser('00000000-0000-0000-0000-000000000001', 'admin', 'admin'))
+        self.device_id = str(uuid.uuid4())
+        self.date = (timezone.now() - timedelta(days=3)).date()
+        HourlyEnergyConsumption.objects.create(
+            device_id=self.device_id, date=self.date, hour=5,
+            bucket_start=bucket_start_for(self.date, 5),
+            total_consumption=1.0, measurement_count=1
+        )
+        self.url = f'/api/monitoring/hourly/daily/?device_id={self.device_id}&date={self.date}'
+
+    def test_validators_and_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=f'W/{etag}').status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_changed_day_gets_new_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        HourlyEnergyConsumption.objects.filter(device_id=self.device_id).update(
+            total_consumption=2.0, measurement_count=2, updated_at=timezone.now() + timedelta(seconds=5)
+        )
+        invalidate_daily(self.device_id, self.date)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['total_daily_consumption'], 2.0)
+
+
+class DailyDeviceIdNormalizationTest(TestCase):
+    """Clients get 400 for a malformed id and access to their device in any UUID spelling"""
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner', role='client')
+        self.device = Device.objects.create(name='Meter', max_consumption=10.0)
+        UserDeviceMapping.objects.create(user=self.owner, device=self.device)
+        self.client = APIClient()
+        self.client.force_authenticate(user=SimpleUser(str(self.owner.id), 'owner', 'client'))
+
+    def test_malformed_id_is_400_not_403(self):
+        response = self.client.get('/api/monitoring/hourly/daily/?device_id=abc&date=2024-01-01')
+        self.assertEqual(response.status_code, 400)
+
+    def test_uppercase_id_is_allowed(self):
+        device_id = str(self.device.id).upper()
+        response = self.client.get(f'/api/monitoring/hourly/daily/?device_id={device_id}&date=2024-01-01')
+        self.assertEqual(response.status_code, 200)
@@ -1,18 +1,36 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     DeviceMeasurementViewSet,
     HourlyEnergyConsumptionViewSet,
     DeviceViewSet,
-    UserViewSet
+    UserViewSet,
+    FleetAnalyticsViewSet,
+    LiveStreamViewSet,
+    ExportViewSet
 )
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'measurements', DeviceMeasurementViewSet, basename='measurement')
 router.register(r'hourly', HourlyEnergyConsumptionViewSet, basename='hourly')
 router.register(r'devices', DeviceViewSet, basename='device')
 router.register(r'users', UserViewSet, basename='user')
+router.register(r'fleet', FleetAnalyticsViewSet, basename='fleet')
+router.register(r'live', LiveStreamViewSet, basename='live')
+router.register(r'export', ExportViewSet, basename='export')
 
-urlpatterns = [
+urlpatterns = []
+
+if settings.SERVER_MODE == 'asgi':
+    # Async versions of the hot read endpoints take precedence over the DRF routes
+    urlpatterns += [
+        path('measurements/', async_views.measurement_list),
+        path('hourly/daily/', async_views.hourly_daily),
+        path('hourly/range/', async_views.hourly_range),
+    ]
+
+urlpatterns += [
     path('', include(router.urls)),
 ]
@@ -3,26 +3,144 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Sum
+from django.http import StreamingHttpResponse
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.core.cache import cache
 from datetime import datetime, timedelta
-from .models import DeviceMeasurement, HourlyEnergyConsumption, Device, User, UserDeviceMapping
+import base64
+import json
+import time
+import uuid
+import numpy as np
+from .models import (
+    DeviceMeasurement,
+    HourlyEnergyConsumption,
+    Device,
+    User,
+    DeviceDailyConsumption,
+    FleetHourlyConsumption,
+    Tariff,
+)
+from .access import (
+    aget_accessible_device_ids,
+    can_access,
+    filter_accessible,
+    get_accessible_device_ids,
+    inaccessible_devices,
+    is_admin,
+)
+from .live import hub as live_hub
+from .export import (
+    EXPORT_KINDS,
+    EXPORT_FORMATS,
+    export_queryset,
+    export_filename,
+    export_content_type,
+    get_encoder,
+    iter_export,
+    aiter_export,
+)
+from .renderers import ORJSONRenderer, EventStreamRenderer
+from .caching import (
+    DAILY_VALUES_FIELDS,
+    analytics_cache_key,
+    heatmap_cache_key,
+    heatmap_cache_timeout,
+    daily_cache_entry,
+    daily_cache_key,
+    daily_cache_timeout,
+    is_not_modified,
+    apply_validators,
+)
 from .serializers import (
     DeviceMeasurementSerializer,
     HourlyEnergyConsumptionSerializer,
     DeviceSerializer,
-    UserSerializer
+    UserSerializer,
+    HOURLY_VALUES_FIELDS,
+    hourly_rows_to_dicts,
 )
+from .pagination import TimestampKeysetPagination
+from .downsampling import downsample_measurements, resolution_for
+from .analytics import device_baseline, range_percentiles, year_heatmap
+from .tariffs import resolve_tariffs, cost_report
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
 
 
-def get_user_devices(user):
-    """Get device IDs accessible by the user based on their role"""
-    if user.role == 'admin':
-        # Admin can see all devices
-        return Device.objects.all().values_list('id', flat=True)
-    else:
-        # Client can only see their assigned devices
-        return UserDeviceMapping.objects.filter(user_id=user.id).values_list('device_id', flat=True)
+def parse_datetime_param(value):
+    """Parse an ISO datetime or YYYY-MM-DD query parameter into an aware datetime"""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        parsed_date = parse_date(value)
+        if parsed_date is None:
+            return None
+        parsed = datetime.combine(parsed_date, datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_downsample_params(params):
+    """
+    Validate device_id/start_date/end_date/resolution/max_points for downsampling.
+    Returns (start, end, resolution_seconds); raises ValueError with the error message.
+    """
+    # MEASUREMENTS_MAX_POINTS bounds buckets per device, so a fleet-wide query would be unbounded
+    if not params.get('device_id'):
+        raise ValueError('device_id is required for downsampling')
+    start = parse_datetime_param(params.get('start_date'))
+    end = parse_datetime_param(params.get('end_date'))
+    if not start or not end or end <= start:
+        raise ValueError('start_date and end_date (start before end) are required for downsampling')
+    
+    try:
+        if 'resolution' in params:
+            resolution = int(params['resolution'])
+            if resolution < 1:
+                raise ValueError
+        else:
+            max_points = min(int(params['max_points']), settings.MEASUREMENTS_MAX_POINTS)
+            if max_points < 1:
+                raise ValueError
+            resolution = resolution_for(start, end, max_points)
+    except (ValueError, OverflowError):
+        raise ValueError('resolution and max_points must be positive integers')
+    
+    # Never return more than MEASUREMENTS_MAX_POINTS buckets, and a single bucket
+    # already covers the whole range (wider ones would overflow the interval)
+    resolution = max(resolution, resolution_for(start, end, settings.MEASUREMENTS_MAX_POINTS))
+    resolution = min(resolution, resolution_for(start, end, 1))
+    return start, end, resolution
+
+
+def downsampled_point(row):
+    return {
+        'device_id': str(row['device_id']),
+        'bucket': row['bucket'],
+        'avg': row['avg'],
+        'min': row['min'],
+        'max': row['max'],
+        'count': row['count'],
+    }
+
+
+def measurement_row(row_id, device_id, timestamp, value, created_at):
+    """
+    One measurement as a dict for ORJSONRenderer (stream and async list paths).
+    Datetimes are left to the renderer so they come out in DRF's "Z" form.
+    """
+    return {
+        'id': str(row_id),
+        'device_id': str(device_id),
+        'timestamp': timestamp,
+        'measurement_value': value,
+        'created_at': created_at,
+    }
 
 
 class DeviceMeasurementViewSet(viewsets.ReadOnlyModelViewSet):
@@ -32,30 +150,31 @@ class DeviceMeasurementViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = DeviceMeasurement.objects.all()
     serializer_class = DeviceMeasurementSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = TimestampKeysetPagination
     
-    @extend_schema(
-        parameters=[
-            OpenApiParameter('device_id', OpenApiTypes.UUID, description='Filter by device ID'),
-            OpenApiParameter('start_date', OpenApiTypes.DATETIME, description='Start date'),
-            OpenApiParameter('end_date', OpenApiTypes.DATETIME, description='End date'),
-        ]
-    )
-    def list(self, request):
-        """List measurements - admin sees all, client sees only their devices"""
-        # Get accessible device IDs based on user role
-        accessible_device_ids = get_user_devices(request.user)
-        
-        # Filter queryset to only accessible devices
-        queryset = self.get_queryset().filter(device_id__in=accessible_device_ids)
+    def filter_measurements(self, request):
+        """
+        Apply access control and query filters shared by list and stream.
+        Returns (queryset, None) or (None, error Response).
+        """
+        # Filter queryset to only accessible devices (admins see all)
+        queryset = filter_accessible(self.get_queryset(), request.user)
         
         device_id = request.query_params.get('device_id')
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
         
         if device_id:
+            try:
+                device_id = str(uuid.UUID(device_id))
+            except ValueError:
+                return None, Response(
+                    {'error': 'Invalid device_id'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             # Verify user has access to this specific device
-            if device_id not in [str(did) for did in accessible_device_ids]:
-                return Response(
+            if not can_access(request.user, device_id):
+                return None, Response(
                     {'error': 'You do not have access to this device'},
                     status=status.HTTP_403_FORBIDDEN
                 )
@@ -65,8 +184,94 @@ class DeviceMeasurementViewSet(viewsets.ReadOnlyModelViewSet):
         if end_date:
             queryset = queryset.filter(timestamp__lte=end_date)
         
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return queryset, None
+    
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('device_id', OpenApiTypes.UUID, description='Filter by device ID'),
+            OpenApiParameter('start_date', OpenApiTypes.DATETIME, description='Start date'),
+            OpenApiParameter('end_date', OpenApiTypes.DATETIME, description='End date'),
+            OpenApiParameter('resolution', OpenApiTypes.INT, description='Downsample into buckets of this many seconds (needs device_id, start_date and end_date)'),
+            OpenApiParameter('max_points', OpenApiTypes.INT, description='Downsample to at most this many buckets (needs device_id, start_date and end_date)'),
+        ]
+    )
+    def list(self, request):
+        """List measurements newest first, one keyset page at a time - admin sees all, client sees only their devices"""
+        queryset, error = self.filter_measurements(request)
+        if error:
+            return error
+        
+        if 'resolution' in request.query_params or 'max_points' in request.query_params:
+            return self.downsampled(request, queryset)
+        
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
+    def downsampled(self, request, queryset):
+        """Return avg/min/max per time bucket instead of raw rows"""
+        try:
+            start, end, resolution = parse_downsample_params(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        points = [
+            downsampled_point(row)
+            for row in downsample_measurements(queryset, start, resolution)
+        ]
+        
+        return Response({
+            'start_date': start,
+            'end_date': end,
+            'resolution_seconds': resolution,
+            'points': points,
+        })
+    
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('device_id', OpenApiTypes.UUID, description='Filter by device ID'),
+            OpenApiParameter('start_date', OpenApiTypes.DATETIME, description='Start date'),
+            OpenApiParameter('end_date', OpenApiTypes.DATETIME, description='End date'),
+        ],
+        responses={(200, 'application/x-ndjson'): OpenApiTypes.STR}
+    )
+    @action(detail=False, methods=['get'])
+    def stream(self, request):
+        """Stream all matching measurements oldest first as JSON lines, in constant memory"""
+        queryset, error = self.filter_measurements(request)
+        if error:
+            return error
+        
+        rows = queryset.order_by('timestamp', 'id').values_list(
+            'id', 'device_id', 'timestamp', 'measurement_value', 'created_at'
+        )
+        chunk_size = settings.MEASUREMENTS_STREAM_CHUNK_SIZE
+        renderer = ORJSONRenderer()
+        
+        def generate():
+            # .iterator() uses a PostgreSQL server-side cursor, fetching chunk_size rows at a time
+            lines = []
+            for row in rows.iterator(chunk_size=chunk_size):
+                lines.append(renderer.render(measurement_row(*row)))
+                if len(lines) >= chunk_size:
+                    yield b'\n'.join(lines) + b'\n'
+                    lines = []
+            if lines:
+                yield b'\n'.join(lines) + b'\n'
+        
+        async def agenerate():
+            # ASGI would buffer a sync generator completely before sending it
+            lines = []
+            async for row in rows.aiterator(chunk_size=chunk_size):
+                lines.append(renderer.render(measurement_row(*row)))
+                if len(lines) >= chunk_size:
+                    yield b'\n'.join(lines) + b'\n'
+                    lines = []
+            if lines:
+                yield b'\n'.join(lines) + b'\n'
+        
+        content = agenerate() if settings.SERVER_MODE == 'asgi' else generate()
+        return StreamingHttpResponse(content, content_type='application/x-ndjson')
 
 
 class HourlyEnergyConsumptionViewSet(viewsets.ReadOnlyModelViewSet):
@@ -95,9 +300,17 @@ class HourlyEnergyConsumptionViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # Normalize first so the access check sees the canonical id
+        try:
+            device_id = str(uuid.UUID(device_id))
+        except ValueError:
+            return Response(
+                {'error': 'Invalid device_id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         # Check if user has access to this device
-        accessible_device_ids = get_user_devices(request.user)
-        if device_id not in [str(did) for did in accessible_device_ids]:
+        if not can_access(request.user, device_id):
             return Response(
                 {'error': 'You do not have access to this device'},
                 status=status.HTTP_403_FORBIDDEN
@@ -107,41 +320,27 @@ class HourlyEnergyConsumptionViewSet(viewsets.ReadOnlyModelViewSet):
             date = datetime.strptime(date_str, '%Y-%m-%d').date()
         except ValueError:
             return Response(
-                {'error': 'Invalid date format. Use YYYY-MM-DD'},
+                {'error': 'Invalid date format (use YYYY-MM-DD)'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Get hourly data for the day
-        hourly_data = HourlyEnergyConsumption.objects.filter(
-            device_id=device_id,
-            date=date
-        ).order_by('hour')
-        
-        # Create complete 24-hour dataset (fill missing hours with 0)
-        result = []
-        hourly_dict = {item.hour: item for item in hourly_data}
+        key = daily_cache_key(device_id, date)
+        entry = cache.get(key)
+        if entry is None:
+            entry = self.build_daily(device_id, date)
+            cache.set(key, entry, daily_cache_timeout(date))
         
-        for hour in range(24):
-            if hour in hourly_dict:
-                item = hourly_dict[hour]
-                result.append({
-                    'hour': hour,
-                    'total_consumption': item.total_consumption,
-                    'measurement_count': item.measurement_count
-                })
-            else:
-                result.append({
-                    'hour': hour,
-                    'total_consumption': 0.0,
-                    'measurement_count': 0
-                })
+        if is_not_modified(request, entry['etag'], entry['last_modified']):
+            return apply_validators(Response(status=status.HTTP_304_NOT_MODIFIED), entry['etag'], entry['last_modified'])
         
-        return Response({
-            'device_id': device_id,
-            'date': date_str,
-            'hourly_data': result,
-            'total_daily_consumption': sum(item['total_consumption'] for item in result)
-        })
+        return apply_validators(Response(entry['payload']), entry['etag'], entry['last_modified'])
+    
+    def build_daily(self, device_id, date):
+        """Compute the 24-hour payload for a device/day plus its HTTP validators"""
+        rows = HourlyEnergyConsumption.objects.filter(
+            device_id=device_id
+        ).between_days(date, date).values_list(*DAILY_VALUES_FIELDS)
+        return daily_cache_entry(device_id, date, rows)
     
     @extend_schema(
         parameters=[
@@ -163,9 +362,16 @@ class HourlyEnergyConsumptionViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        try:
+            device_id = str(uuid.UUID(device_id))
+        except ValueError:
+            return Response(
+                {'error': 'Invalid device_id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         # Check if user has access to this device
-        accessible_device_ids = get_user_devices(request.user)
-        if device_id not in [str(did) for did in accessible_device_ids]:
+        if not can_access(request.user, device_id):
             return Response(
                 {'error': 'You do not have access to this device'},
                 status=status.HTTP_403_FORBIDDEN
@@ -180,25 +386,413 @@ class HourlyEnergyConsumptionViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Get data for date range
-        data = HourlyEnergyConsumption.objects.filter(
-            device_id=device_id,
-            date__gte=start_date,
-            date__lte=end_date
-        ).order_by('date', 'hour')
+        # Get data for date range - plain tuples, no model instances or serializer fields
+        rows = HourlyEnergyConsumption.objects.filter(
+            device_id=device_id
+        ).between_days(start_date, end_date).order_by('bucket_start').values_list(*HOURLY_VALUES_FIELDS)
         
-        serializer = self.get_serializer(data, many=True)
-        
-        # Calculate total
-        total = data.aggregate(total=Sum('total_consumption'))['total'] or 0.0
+        # Build the rows and the total in one pass instead of a second SUM query
+        data, total = hourly_rows_to_dicts(rows)
         
         return Response({
             'device_id': device_id,
             'start_date': start_date_str,
             'end_date': end_date_str,
-            'data': serializer.data,
+            'data': data,
             'total_consumption': total
         })
+    
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('device_id', OpenApiTypes.UUID, description='Filter by device ID', required=True),
+            OpenApiParameter('hours', OpenApiTypes.INT, description=f'Window length in hours, ending with the current hour (default {settings.HOURLY_WINDOW_DEFAULT_HOURS})'),
+        ]
+    )
+    @action(detail=False, methods=['get'])
+    def window(self, request):
+        """Get consumption for a rolling window of the last N hours"""
+        device_id = request.query_params.get('device_id')
+        
+        if not device_id:
+            return Response(
+                {'error': 'device_id parameter is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            device_id = str(uuid.UUID(device_id))
+        except ValueError:
+            return Response(
+                {'error': 'Invalid device_id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Check if user has access to this device
+        if not can_access(request.user, device_id):
+            return Response(
+                {'error': 'You do not have access to this device'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        try:
+            hours = int(request.query_params.get('hours', settings.HOURLY_WINDOW_DEFAULT_HOURS))
+            if not 1 <= hours <= settings.HOURLY_WINDOW_MAX_HOURS:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {'error': f'hours must be an integer between 1 and {settings.HOURLY_WINDOW_MAX_HOURS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # One (device_id, bucket_start) index range scan, however many day boundaries it crosses
+        rows = HourlyEnergyConsumption.objects.filter(
+            device_id=device_id
+        ).last_hours(hours, timezone.now()).order_by('bucket_start').values_list(*HOURLY_VALUES_FIELDS)
+        
+        data, total = hourly_rows_to_dicts(rows)
+        
+        return Response({
+            'device_id': device_id,
+            'hours': hours,
+            'data': data,
+            'total_consumption': total
+        })
+    
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('device_ids', OpenApiTypes.STR, description='Comma-separated device IDs', required=True),
+            OpenApiParameter('date', OpenApiTypes.DATE, description='Single date (YYYY-MM-DD), or use start_date/end_date'),
+            OpenApiParameter('start_date', OpenApiTypes.DATE, description='Start date (YYYY-MM-DD)'),
+            OpenApiParameter('end_date', OpenApiTypes.DATE, description='End date (YYYY-MM-DD)'),
+        ]
+    )
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """Get zero-filled hourly consumption for many devices in one request"""
+        device_ids_str = request.query_params.get('device_ids', '')
+        date_str = request.query_params.get('date')
+        start_date_str = request.query_params.get('start_date', date_str)
+        end_date_str = request.query_params.get('end_date', date_str)
+        
+        if not device_ids_str or not start_date_str or not end_date_str:
+            return Response(
+                {'error': 'device_ids and either date or start_date and end_date parameters are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            device_ids = list(dict.fromkeys(str(uuid.UUID(d.strip())) for d in device_ids_str.split(',') if d.strip()))
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+        except ValueError:
+            return Response(
+                {'error': 'Invalid device_ids or date format (use YYYY-MM-DD)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        num_days = (end_date - start_date).days + 1
+        if num_days < 1 or num_days > settings.BATCH_MAX_DAYS or len(device_ids) > settings.BATCH_MAX_DEVICES:
+            return Response(
+                {'error': f'At most {settings.BATCH_MAX_DEVICES} devices and {settings.BATCH_MAX_DAYS} days per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # One access check for the whole set
+        forbidden = inaccessible_devices(request.user, device_ids)
+        if forbidden:
+            return Response(
+                {'error': 'You do not have access to these devices', 'device_ids': forbidden},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        # Zero-filled grid per device/day, then fill from a single query
+        days = [start_date + timedelta(days=offset) for offset in range(num_days)]
+        grid = {
+            device_id: {day: [[0.0, 0] for _ in range(24)] for day in days}
+            for device_id in device_ids
+        }
+        rows = HourlyEnergyConsumption.objects.filter(
+            device_id__in=device_ids
+        ).between_days(start_date, end_date).values_list('device_id', 'date', 'hour', 'total_consumption', 'measurement_count')
+        for device_id, day, hour, total, count in rows:
+            grid[str(device_id)][day][hour] = [total, count]
+        
+        devices = {}
+        for device_id, device_days in grid.items():
+            day_results = []
+            for day, hours in device_days.items():
+                day_results.append({
+                    'date': day.isoformat(),
+                    'hourly_data': [
+                        {'hour': hour, 'total_consumption': total, 'measurement_count': count}
+                        for hour, (total, count) in enumerate(hours)
+                    ],
+                    'total_daily_consumption': sum(total for total, _ in hours)
+                })
+            devices[device_id] = {
+                'days': day_results,
+                'total_consumption': sum(day['total_daily_consumption'] for day in day_results)
+            }
+        
+        return Response({
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'devices': devices
+        })
+    
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('device_id', OpenApiTypes.UUID, description='Device ID', required=True),
+            OpenApiParameter('days', OpenApiTypes.INT, description=f'Baseline window in days (default {settings.BASELINE_DEFAULT_DAYS})'),
+            OpenApiParameter('recent_hours', OpenApiTypes.INT, description=f'Complete hours to score (default {settings.BASELINE_RECENT_HOURS})'),
+            OpenApiParameter('z_threshold', OpenApiTypes.FLOAT, description=f'|z| flagged as anomaly (default {settings.BASELINE_Z_THRESHOLD})'),
+        ]
+    )
+    @action(detail=False, methods=['get'])
+    def baseline(self, request):
+        """Hour-of-week baseline, percentiles and z-scores of recent hours for one device"""
+        device_id = request.query_params.get('device_id')
+        if not device_id:
+            return Response(
+                {'error': 'device_id parameter is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            device_id = str(uuid.UUID(device_id))
+            days = int(request.query_params.get('days', settings.BASELINE_DEFAULT_DAYS))
+            recent_hours = int(request.query_params.get('recent_hours', settings.BASELINE_RECENT_HOURS))
+            z_threshold = float(request.query_params.get('z_threshold', settings.BASELINE_Z_THRESHOLD))
+            if not 1 <= days <= settings.BASELINE_MAX_DAYS or not 1 <= recent_hours <= 168 or z_threshold <= 0:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {'error': f'Invalid device_id, days (1-{settings.BASELINE_MAX_DAYS}), recent_hours (1-168) or z_threshold'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not can_access(request.user, device_id):
+            return Response(
+                {'error': 'You do not have access to this device'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        # Valid until the device's next hourly update or the next hour starts
+        current_hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        key = analytics_cache_key('baseline', device_id, days, recent_hours, z_threshold, current_hour.isoformat())
+        result = cache.get(key)
+        if result is None:
+            result = device_baseline(device_id, days, recent_hours, z_threshold)
+            cache.set(key, result, settings.ANALYTICS_CACHE_TTL)
+        
+        return Response(result)
+    
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('device_id', OpenApiTypes.UUID, description='Device ID', required=True),
+            OpenApiParameter('year', OpenApiTypes.INT, description='Calendar year (default current year)'),
+            OpenApiParameter('encoding', OpenApiTypes.STR, description='base64 (little-endian float32 buffer, default) or lists'),
+        ]
+    )
+    @action(detail=False, methods=['get'])
+    def heatmap(self, request):
+        """Days x 24 hours consumption matrix for a year in one response"""
+        device_id = request.query_params.get('device_id')
+        encoding = request.query_params.get('encoding', 'base64')
+        if not device_id or encoding not in ('base64', 'lists'):
+            return Response(
+                {'error': 'device_id parameter is required and encoding must be base64 or lists'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            device_id = str(uuid.UUID(device_id))
+            year = int(request.query_params.get('year', timezone.now().year))
+            if not 2000 <= year <= 9999:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {'error': 'Invalid device_id or year'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not can_access(request.user, device_id):
+            return Response(
+                {'error': 'You do not have access to this device'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        key = heatmap_cache_key(device_id, year)
+        buffer = cache.get(key)
+        if buffer is None:
+            buffer = year_heatmap(device_id, year).astype('<f4').tobytes()
+            cache.set(key, buffer, heatmap_cache_timeout(year))
+        matrix = np.frombuffer(buffer, dtype='<f4').reshape(-1, 24)
+        
+        if encoding == 'base64':
+            # Decode with new Float32Array(bytes.buffer); NaN marks hours with no data
+            values = base64.b64encode(buffer).decode('ascii')
+        else:
+            # float32 -> rounded float64 so JSON does not carry float32 noise digits
+            rounded = np.round(matrix.astype(np.float64), 6).tolist()
+            values = [[None if value != value else value for value in row] for row in rounded]
+        
+        reported = matrix[~np.isnan(matrix)]
+        return Response({
+            'device_id': device_id,
+            'year': year,
+            'start_date': f'{year}-01-01',
+            'days': matrix.shape[0],
+            'hours': 24,
+            'encoding': 'base64-float32-le' if encoding == 'base64' else 'lists',
+            'values': values,
+            'total_consumption': float(reported.sum(dtype=np.float64)),
+            'max_hourly_consumption': float(reported.max()) if reported.size else None,
+        })
+    
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('device_id', OpenApiTypes.UUID, description='Device ID', required=True),
+            OpenApiParameter('start_date', OpenApiTypes.DATE, description='Start date (YYYY-MM-DD)', required=True),
+            OpenApiParameter('end_date', OpenApiTypes.DATE, description='End date (YYYY-MM-DD)', required=True),
+            OpenApiParameter('percentiles', OpenApiTypes.STR, description='Comma-separated percentiles 0-100 (default 50,95,99)'),
+            OpenApiParameter('per_day', OpenApiTypes.BOOL, description='Also return the percentiles of each day'),
+        ]
+    )
+    @action(detail=False, methods=['get'])
+    def percentiles(self, request):
+        """Reading percentiles over a date range, merged from per-day sketches"""
+        device_id = request.query_params.get('device_id')
+        start_date_str = request.query_params.get('start_date')
+        end_date_str = request.query_params.get('end_date')
+        per_day = request.query_params.get('per_day', '').lower() in ('1', 'true', 'yes')
+        
+        if not all([device_id, start_date_str, end_date_str]):
+            return Response(
+                {'error': 'device_id, start_date, and end_date parameters are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            device_id = str(uuid.UUID(device_id))
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            percentiles = sorted({float(p) for p in request.query_params.get('percentiles', '50,95,99').split(',') if p.strip()})
+            num_days = (end_date - start_date).days + 1
+            if not percentiles or not all(0 <= p <= 100 for p in percentiles):
+                raise ValueError
+            if not 1 <= num_days <= settings.PERCENTILES_MAX_DAYS:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {'error': f'Invalid device_id, dates (YYYY-MM-DD, at most {settings.PERCENTILES_MAX_DAYS} days) or percentiles (0-100)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not can_access(request.user, device_id):
+            return Response(
+                {'error': 'You do not have access to this device'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        # Retired with the device's next ingest, like the other analytics
+        key = analytics_cache_key(
+            'percentiles', device_id, start_date.isoformat(), end_date.isoformat(),
+            ','.join(f'{p:g}' for p in percentiles), per_day
+        )
+        result = cache.get(key)
+        if result is None:
+            result = range_percentiles(device_id, start_date, end_date, percentiles, per_day)
+            cache.set(key, result, settings.ANALYTICS_CACHE_TTL)
+        
+        return Response(result)
+    
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('device_ids', OpenApiTypes.STR, description='Comma-separated device IDs', required=True),
+            OpenApiParameter('start_date', OpenApiTypes.DATE, description='Start date (YYYY-MM-DD)', required=True),
+            OpenApiParameter('end_date', OpenApiTypes.DATE, description='End date (YYYY-MM-DD)', required=True),
+            OpenApiParameter('tariff_id', OpenApiTypes.UUID, description='Price every device with this tariff instead of its own'),
+        ]
+    )
+    @action(detail=False, methods=['get'])
+    def cost(self, request):
+        """Time-of-use cost per device and month for a date range"""
+        device_ids_str = request.query_params.get('device_ids', '')
+        start_date_str = request.query_params.get('start_date')
+        end_date_str = request.query_params.get('end_date')
+        tariff_id = request.query_params.get('tariff_id')
+        
+        if not device_ids_str or not start_date_str or not end_date_str:
+            return Response(
+                {'error': 'device_ids, start_date and end_date parameters are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            device_ids = list(dict.fromkeys(str(uuid.UUID(d.strip())) for d in device_ids_str.split(',') if d.strip()))
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            if tariff_id:
+                tariff_id = str(uuid.UUID(tariff_id))
+        except ValueError:
+            return Response(
+                {'error': 'Invalid device_ids, tariff_id or date format (use YYYY-MM-DD)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        num_days = (end_date - start_date).days + 1
+        if num_days < 1 or num_days > settings.COST_MAX_DAYS or len(device_ids) > settings.BATCH_MAX_DEVICES:
+            return Response(
+                {'error': f'At most {settings.BATCH_MAX_DEVICES} devices and {settings.COST_MAX_DAYS} days per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        forbidden = inaccessible_devices(request.user, device_ids)
+        if forbidden:
+            return Response(
+                {'error': 'You do not have access to these devices', 'device_ids': forbidden},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        try:
+            tariffs = resolve_tariffs(device_ids, tariff_id)
+        except Tariff.DoesNotExist:
+            return Response(
+                {'error': 'Tariff not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        untariffed = [device_id for device_id, tariff in tariffs.items() if tariff is None]
+        if untariffed:
+            return Response(
+                {'error': 'No tariff assigned and no default tariff configured', 'device_ids': untariffed},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        report = cost_report(device_ids, tariffs, start_date, end_date)
+        
+        devices = {}
+        totals = {}
+        for device_id, months in report.items():
+            tariff = tariffs[device_id]
+            total_cost = sum(cost for _, _, _, cost in months)
+            devices[device_id] = {
+                'tariff': {'id': str(tariff.id), 'name': tariff.name, 'currency': tariff.currency},
+                'months': [
+                    {'month': f'{year}-{month:02d}', 'consumption': kwh, 'cost': cost}
+                    for year, month, kwh, cost in months
+                ],
+                'total_consumption': sum(kwh for _, _, kwh, _ in months),
+                'total_cost': total_cost,
+            }
+            totals[tariff.currency] = totals.get(tariff.currency, 0.0) + total_cost
+        
+        return Response({
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'devices': devices,
+            'total_cost_by_currency': totals,
+        })
 
 
 class DeviceViewSet(viewsets.ReadOnlyModelViewSet):
@@ -212,17 +806,290 @@ class DeviceViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         """Filter devices based on user role"""
-        user = self.request.user
+        # Admin can see all devices, clients only their assigned devices
+        queryset = filter_accessible(Device.objects.all(), self.request.user, field='id')
+        return DeviceSerializer.annotate_queryset(queryset)
+
+
+class FleetAnalyticsViewSet(viewsets.ViewSet):
+    """
+    Fleet-wide analytics for admins, read from incrementally maintained rollups
+    """
+    permission_classes = [IsAuthenticated]
+    
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('date', OpenApiTypes.DATE, description='Day to report (YYYY-MM-DD, default today)'),
+            OpenApiParameter('window_days', OpenApiTypes.INT, description='Days ending at date used for top-N (default 1)'),
+            OpenApiParameter('top', OpenApiTypes.INT, description='Number of top consuming devices (default 10)'),
+        ]
+    )
+    def list(self, request):
+        """Hourly fleet totals, devices over their limit and top-N consumers"""
+        if not is_admin(request.user):
+            return Response(
+                {'error': 'Fleet analytics are only available to admins'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        try:
+            date_str = request.query_params.get('date')
+            date = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else timezone.now().date()
+            window_days = max(1, min(int(request.query_params.get('window_days', 1)), settings.FLEET_MAX_WINDOW_DAYS))
+            top = max(1, min(int(request.query_params.get('top', 10)), settings.FLEET_MAX_TOP))
+        except ValueError:
+            return Response(
+                {'error': 'Invalid date (use YYYY-MM-DD), window_days or top'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # At most 24 x FLEET_SHARDS rows, whatever the fleet size
+        hours = {hour: {'hour': hour, 'total_consumption': 0.0, 'measurement_count': 0, 'devices_over_limit': 0} for hour in range(24)}
+        fleet_rows = FleetHourlyConsumption.objects.filter(date=date).values('hour').annotate(
+            total=Sum('total_consumption'),
+            count=Sum('measurement_count'),
+            over=Sum('devices_over_limit')
+        )
+        for row in fleet_rows:
+            hours[row['hour']].update(
+                total_consumption=row['total'],
+                measurement_count=row['count'],
+                devices_over_limit=row['over']
+            )
         
-        if user.role == 'admin':
-            # Admin can see all devices
-            return Device.objects.all()
+        window_start = date - timedelta(days=window_days - 1)
+        if window_days == 1:
+            # Ordered scan of the (date, -total_consumption) index, stops after `top` rows
+            top_rows = list(
+                DeviceDailyConsumption.objects.filter(date=date)
+                .order_by('-total_consumption')
+                .values('device_id', 'total_consumption')[:top]
+            )
         else:
-            # Client can only see their assigned devices
-            device_ids = UserDeviceMapping.objects.filter(
-                user_id=user.id
-            ).values_list('device_id', flat=True)
-            return Device.objects.filter(id__in=device_ids)
+            top_rows = list(
+                DeviceDailyConsumption.objects.filter(date__gte=window_start, date__lte=date)
+                .values('device_id')
+                .annotate(total_consumption=Sum('total_consumption'))
+                .order_by('-total_consumption')[:top]
+            )
+        names = dict(Device.objects.filter(id__in=[row['device_id'] for row in top_rows]).values_list('id', 'name'))
+        
+        hourly_data = [hours[hour] for hour in range(24)]
+        current_hour = timezone.now().hour if date == timezone.now().date() else 23
+        
+        return Response({
+            'date': date.isoformat(),
+            'hourly_data': hourly_data,
+            'total_daily_consumption': sum(hour['total_consumption'] for hour in hourly_data),
+            'devices_over_limit': hours[current_hour]['devices_over_limit'],
+            'top_devices': {
+                'start_date': window_start.isoformat(),
+                'end_date': date.isoformat(),
+                'devices': [
+                    {
+                        'device_id': str(row['device_id']),
+                        'name': names.get(row['device_id']),
+                        'total_consumption': row['total_consumption'],
+                    }
+                    for row in top_rows
+                ],
+            },
+        })
+
+
+class ExportViewSet(viewsets.ViewSet):
+    """
+    Streaming CSV / Parquet export of raw or hourly history
+    """
+    permission_classes = [IsAuthenticated]
+    
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('kind', OpenApiTypes.STR, description='raw or hourly (default hourly)'),
+            OpenApiParameter('output', OpenApiTypes.STR, description='csv or parquet (default csv)'),
+            OpenApiParameter('device_ids', OpenApiTypes.STR, description='Comma-separated device IDs (default: all accessible devices)'),
+            OpenApiParameter('start_date', OpenApiTypes.DATE, description='Start date (YYYY-MM-DD)', required=True),
+            OpenApiParameter('end_date', OpenApiTypes.DATE, description='End date (YYYY-MM-DD)', required=True),
+            OpenApiParameter('gzip', OpenApiTypes.BOOL, description='gzip the CSV file / use gzip Parquet column compression'),
+        ],
+        responses={(200, 'text/csv'): OpenApiTypes.BINARY, (200, 'application/vnd.apache.parquet'): OpenApiTypes.BINARY}
+    )
+    def list(self, request):
+        """Stream history for the user's devices in constant memory"""
+        kind = request.query_params.get('kind', 'hourly')
+        file_format = request.query_params.get('output', 'csv')
+        compress = request.query_params.get('gzip', '').lower() in ('1', 'true', 'yes')
+        device_ids_str = request.query_params.get('device_ids', '')
+        
+        if kind not in EXPORT_KINDS or file_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"kind must be one of {', '.join(EXPORT_KINDS)} and output one of {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            start_date = datetime.strptime(request.query_params.get('start_date', ''), '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.query_params.get('end_date', ''), '%Y-%m-%d').date()
+            requested = list(dict.fromkeys(str(uuid.UUID(d.strip())) for d in device_ids_str.split(',') if d.strip()))
+        except ValueError:
+            return Response(
+                {'error': 'start_date and end_date (YYYY-MM-DD) are required; device_ids must be UUIDs'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if end_date < start_date:
+            return Response(
+                {'error': 'end_date must not be before start_date'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        forbidden = inaccessible_devices(request.user, requested)
+        if forbidden:
+            return Response(
+                {'error': 'You do not have access to these devices', 'device_ids': forbidden},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        # None exports every device (admins only)
+        if requested:
+            device_ids = requested
+        elif is_admin(request.user):
+            device_ids = None
+        else:
+            device_ids = get_accessible_device_ids(request.user)
+        
+        rows = export_queryset(kind, device_ids, start_date, end_date)
+        encoder = get_encoder(kind, file_format, compress)
+        content = aiter_export(rows, encoder) if settings.SERVER_MODE == 'asgi' else iter_export(rows, encoder)
+        
+        response = StreamingHttpResponse(content, content_type=export_content_type(file_format, compress))
+        filename = export_filename(kind, file_format, start_date, end_date, compress)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+def format_live_events(payloads, dropped):
+    """Render drained live payloads as one SSE chunk"""
+    chunk = ''
+    if dropped:
+        # Buffer overflowed - the client should refetch to resync
+        chunk += f"event: dropped\ndata: {json.dumps({'count': dropped})}\n\n"
+    if not payloads:
+        # Comment line keeps proxies from timing out and detects closed clients
+        return chunk + ": heartbeat\n\n"
+    return chunk + ''.join(f"event: measurement\ndata: {payload}\n\n" for payload in payloads)
+
+
+def narrow_live_devices(requested, allowed):
+    """
+    Devices a client's live stream may keep receiving after its access is re-read,
+    or None to close the stream because an explicitly requested device was revoked
+    """
+    if requested:
+        return requested if requested <= allowed else None
+    return allowed
+
+
+LIVE_REVOKED_EVENT = "event: revoked\ndata: {}\n\n"
+
+
+class LiveStreamViewSet(viewsets.ViewSet):
+    """
+    Server-Sent Events stream of new readings and hourly totals, replacing polling.
+    Send the usual Authorization header (e.g. fetch() with a streaming body reader).
+    Needs SERVER_MODE=asgi (or dev); wsgi workers answer 503.
+    Client access is re-read every heartbeat: unassigned devices stop streaming, and a
+    stream for explicitly requested devices ends with a 'revoked' event.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, EventStreamRenderer]
+    
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('device_ids', OpenApiTypes.STR, description='Comma-separated device IDs (default: all accessible devices)'),
+        ],
+        responses={(200, 'text/event-stream'): OpenApiTypes.STR}
+    )
+    def list(self, request):
+        """Stream 'measurement' events for the user's devices"""
+        if settings.SERVER_MODE == 'wsgi':
+            # Each open stream would pin one of the worker's few gthread threads
+            return Response(
+                {'error': 'Live streaming requires SERVER_MODE=asgi'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        
+        device_ids_str = request.query_params.get('device_ids', '')
+        try:
+            requested = frozenset(str(uuid.UUID(d.strip())) for d in device_ids_str.split(',') if d.strip())
+        except ValueError:
+            return Response(
+                {'error': 'Invalid device_ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        forbidden = inaccessible_devices(request.user, requested)
+        if forbidden:
+            return Response(
+                {'error': 'You do not have access to these devices', 'device_ids': forbidden},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        # None subscribes an admin to every device
+        if requested:
+            device_ids = requested
+        elif is_admin(request.user):
+            device_ids = None
+        else:
+            device_ids = get_accessible_device_ids(request.user)
+        
+        subscription = live_hub.subscribe(device_ids)
+        if subscription is None:
+            return Response(
+                {'error': 'Too many live subscribers, try again later'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        
+        # Admins see every device; clients may be unassigned while the stream is open
+        recheck = not is_admin(request.user)
+        
+        def generate():
+            try:
+                yield f"retry: {int(settings.LIVE_RECONNECT_DELAY * 1000)}\n\n"
+                checked = time.monotonic()
+                while True:
+                    if recheck and time.monotonic() - checked >= settings.LIVE_HEARTBEAT_SECONDS:
+                        checked = time.monotonic()
+                        allowed = narrow_live_devices(requested, get_accessible_device_ids(request.user))
+                        if allowed is None:
+                            yield LIVE_REVOKED_EVENT
+                            return
+                        subscription.restrict(allowed)
+                    yield format_live_events(*subscription.drain(settings.LIVE_HEARTBEAT_SECONDS))
+            finally:
+                live_hub.unsubscribe(subscription)
+        
+        async def agenerate():
+            # Waits on the event loop instead of holding a thread per subscriber
+            try:
+                yield f"retry: {int(settings.LIVE_RECONNECT_DELAY * 1000)}\n\n"
+                checked = time.monotonic()
+                while True:
+                    if recheck and time.monotonic() - checked >= settings.LIVE_HEARTBEAT_SECONDS:
+                        checked = time.monotonic()
+                        allowed = narrow_live_devices(requested, await aget_accessible_device_ids(request.user))
+                        if allowed is None:
+                            yield LIVE_REVOKED_EVENT
+                            return
+                        subscription.restrict(allowed)
+                    yield format_live_events(*await subscription.adrain(settings.LIVE_HEARTBEAT_SECONDS))
+            finally:
+                live_hub.unsubscribe(subscription)
+        
+        content = agenerate() if settings.SERVER_MODE == 'asgi' else generate()
+        response = StreamingHttpResponse(content, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
@@ -0,0 +1,116 @@
+"""
+Supervised multi-process worker pool for the RabbitMQ consumers.
+
+Each worker is a forked process with its own AMQP and DB connection. Ingest
+queues are partitioned across workers so every queue (and therefore every
+device routed to it by the load balancer) is consumed by exactly one process,
+which keeps per-device ordering.
+"""
+import logging
+import multiprocessing
+import signal
+import time
+from django import db
+from .consumers import DeviceDataConsumer, SyncConsumer
+
+logger = logging.getLogger(__name__)
+
+
+def partition_queues(queue_names, num_workers):
+    """Split queues round-robin into at most num_workers non-empty groups"""
+    groups = [queue_names[i::num_workers] for i in range(num_workers)]
+    return [group for group in groups if group]
+
+
+def _run_consumer(consumer_factory):
+    """Worker process entry point: consume until SIGTERM, then drain and exit"""
+    # Ctrl+C is handled by the supervisor, which forwards SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    consumer = consumer_factory()
+    signal.signal(signal.SIGTERM, lambda signum, frame: consumer.connection.request_stop())
+
+    consumer.start()
+    consumer.connection.stop()
+    db.connections.close_all()
+
+
+def run_ingest_worker(queue_names):
+    _run_consumer(lambda: DeviceDataConsumer(queue_names=queue_names))
+
+
+def run_sync_worker():
+    _run_consumer(SyncConsumer)
+
+
+class WorkerPool:
+    """Starts consumer processes and restarts any that crash"""
+
+    def __init__(self, queue_names, num_workers, restart_delay=2, shutdown_timeout=30):
+        self.queue_groups = partition_queues(queue_names, num_workers)
+        self.restart_delay = restart_delay
+        self.shutdown_timeout = shutdown_timeout
+        self.context = multiprocessing.get_context('fork')
+        self.processes = {}
+        self.shutting_down = False
+
+        if len(self.queue_groups) < num_workers:
+            logger.warning(
+                f"Only {len(queue_names)} ingest queues for {num_workers} workers - "
+                f"starting {len(self.queue_groups)} ingest workers"
+            )
+
+    def worker_specs(self):
+        """(name, target, args) for every supervised process"""
+        specs = [
+            (f"ingest-{index}", run_ingest_worker, (group,))
+            for index, group in enumerate(self.queue_groups)
+        ]
+        specs.append(("sync", run_sync_worker, ()))
+        return specs
+
+    def spawn(self, name, target, args):
+        # Never let a child inherit the parent's DB socket
+        db.connections.close_all()
+        process = self.context.Process(target=target, args=args, name=name, daemon=False)
+        process.start()
+        self.processes[name] = (process, target, args)
+        logger.info(f"Started worker {name} (pid {process.pid}) {args[0] if args else ''}")
+
+    def handle_shutdown(self, signum, frame):
+        self.shutting_down = True
+
+    def run(self):
+        """Supervise workers until SIGTERM/SIGINT, then drain them"""
+        signal.signal(signal.SIGTERM, self.handle_shutdown)
+        signal.signal(signal.SIGINT, self.handle_shutdown)
+
+        for name, target, args in self.worker_specs():
+            self.spawn(name, target, args)
+
+        while not self.shutting_down:
+            time.sleep(1)
+            for name, (process, target, args) in list(self.processes.items()):
+                if process.is_alive() or self.shutting_down:
+                    continue
+                logger.error(f"Worker {name} (pid {process.pid}) exited with code {process.exitcode} - restarting")
+                time.sleep(self.restart_delay)
+                self.spawn(name, target, args)
+
+        self.stop()
+
+    def stop(self):
+        """Send SIGTERM to all workers and wait for them to finish their current message"""
+        logger.info("Draining workers...")
+        for process, _, _ in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+
+        deadline = time.monotonic() + self.shutdown_timeout
+        for name, (process, _, _) in self.processes.items():
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Worker {name} did not drain in time - killing")
+                process.kill()
+                process.join()
+        logger.info("All workers stopped")